@@ -0,0 +1,102 @@
+# checks that `process_LTRO.py --incremental` gives the same sales as a full run
+#
+# On generated data (see benchmarks/generate.py), in a temporary directory:
+#  1. a full run on all the LTRO files
+#  2. a full run with only some of the sales of the last LTRO file (the seed
+#     of the incremental run), then an incremental run with the whole file,
+#     so some sales of an application number, and some sales registered
+#     twice, are in the seed run and the others in the incremental run
+# and the kw-sales.csv of both are compared. The rows of an incremental run
+# are not in the same order (the reprocessed sales go at the end), so the
+# rows are compared sorted.
+#
+# `python -m benchmarks.check_incremental`                      scale 0.1, seed 0
+# `python -m benchmarks.check_incremental --scale 1 --seed 3`
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+import pandas as pd
+
+import process_LTRO as LTRO
+import run_pipelines as RP
+import utils.LTROutils as LT
+from benchmarks.generate import generate, LTRO_HEADER_ROWS
+
+# rows of an LTRO workbook before the sales (see benchmarks.generate._write_ltro_xlsx)
+LTRO_TITLE_ROWS = 9
+
+
+def _keep_some_sales(xlsx_file, seed, share=0.5):
+    """
+    rewrites an LTRO workbook with only a share of its sales (picked at random)
+    """
+    import openpyxl
+
+    rnd = random.Random(seed)
+    rows = list(openpyxl.load_workbook(xlsx_file, read_only=True).active.iter_rows(values_only=True))
+    first_sale = LTRO_TITLE_ROWS + len(LTRO_HEADER_ROWS)
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet()
+    for row in rows[:first_sale]:
+        ws.append(row)
+    for row in rows[first_sale:]:
+        if rnd.random() < share:
+            ws.append(row)
+    wb.save(xlsx_file)
+
+
+def _sorted_sales():
+    sales = pd.read_csv(LTRO.SALES_FILE, dtype=str, keep_default_na=False)
+    return sales.sort_values(list(sales.columns), kind='stable').reset_index(drop=True)
+
+
+def check_incremental(scale=0.1, seed=0):
+    """
+    :return: dataframe of the rows of kw-sales.csv found in only one of the runs
+        (with a column `run`, 'full' or 'incremental'), empty if they are the same
+    """
+    work_dir = tempfile.mkdtemp(prefix="kw-incremental-x{}-".format(scale))
+    cwd = os.getcwd()
+    try:
+        generate(work_dir, scale, seed)
+        # the scripts use paths relative to the repository root
+        os.chdir(work_dir)
+        # kw-properties.csv is read by process_LTRO.py
+        RP.PIPELINES['landvaluation']().run(force=True)
+
+        LTRO.main(incremental=False)
+        full = _sorted_sales()
+
+        for previous_run_file in [LTRO.SALES_FILE, LT.CLEANED_SALES_FILE, LT.LTRO_SOURCES_FILE]:
+            os.remove(previous_run_file)
+        last_file = LTRO.LTRO_FILES[-1]
+        shutil.copy(last_file, last_file + ".all")
+        _keep_some_sales(last_file, seed)
+        LTRO.main(incremental=False)
+        os.replace(last_file + ".all", last_file)
+        LTRO.main(incremental=True)
+        incremental = _sorted_sales()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    # rows in only one of the runs (a row found twice in a run counts twice)
+    full['nth'] = full.groupby(list(full.columns)).cumcount()
+    incremental['nth'] = incremental.groupby(list(incremental.columns)).cumcount()
+    merged = full.merge(incremental, how='outer', indicator='run')
+    different = merged[merged.run != 'both'].drop(columns='nth')
+    different['run'] = different.run.map({'left_only': 'full', 'right_only': 'incremental'})
+    return different.sort_values(['application_number', 'run'])
+
+
+if __name__ == "__main__":
+    scale = float(sys.argv[sys.argv.index("--scale") + 1]) if "--scale" in sys.argv else 0.1
+    seed = int(sys.argv[sys.argv.index("--seed") + 1]) if "--seed" in sys.argv else 0
+    different = check_incremental(scale, seed)
+    print("\nincremental and full runs: {}".format("[OK]" if different.empty else "DIFFERENT"))
+    if not different.empty:
+        print(different.to_string(index=False))
+    sys.exit(0 if different.empty else 1)
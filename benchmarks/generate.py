@@ -0,0 +1,456 @@
+# synthetic input data for the benchmarks
+#
+# The real inputs (landvaluation.bm scrapes, LTRO workbooks and the
+# Property Skipper / Skipper Stats feeds) are private, so the benchmarks
+# run on generated files with the same layout, written where the
+# pipelines look for them (relative to a root directory):
+#
+#   scraping/<today>_landvaluation_data.csv        last scrape
+#   data/landvaluation/latest_landvaluation_data.csv
+#   data/property_type_dict.csv
+#   data/LTRO/LTRO_2018.csv, LTRO_2018_2022.xlsx, LTRO_2022.xlsx, LTRO_2024.xlsx
+#   data/LTRO/Norwood/parcel_id_assn_nr_database.csv
+#   data/skipper/<today>_skipper_properties.xml     (so it is not downloaded)
+#   data/skipper/transactions/<today>_transactions.xml
+#
+# The sales and listings refer to the generated properties, with the
+# usual quirks of the real data (parcel IDs instead of addresses, several
+# assessment numbers, lands, fractionals, re-registrations, sales in
+# both LTRO and Skipper Stats...) so every cleaning step has work to do.
+#
+# `python -m benchmarks.generate <root> [--scale 10] [--seed 0]`
+import copy
+import csv
+import datetime
+import os
+import random
+import sys
+import xml.etree.ElementTree as ET
+
+import utils.downloadutils as DL
+
+# number of rows of each input at scale 1 (about the current volumes)
+VOLUMES = {
+    'properties': 32000,       # landvaluation.bm
+    'ltro_sales': 8000,        # the 4 LTRO files together
+    'norwood_parcels': 12000,
+    'listings': 1500,          # Property Skipper feed
+    'transactions': 4000,      # Skipper Stats feed
+}
+SCALES = [1, 10, 100]
+
+PARISHES = ['Pembroke', 'Paget', 'Warwick', 'Devonshire', 'Smiths', 'Hamilton',
+            'Sandys', 'Southampton', "St. George's"]
+# how the parishes are sometimes written in the feeds (see simplify_parishes)
+PARISH_SPELLINGS = {'Pembroke': ['City of Hamilton', 'City Of Hamilton'],
+                    "St. George's": ['Town of St. George', 'St. Georges'],
+                    'Smiths': ["Smith's"], 'Hamilton': ['Hamilton Parish']}
+POSTCODES = {'Pembroke': 'HM', 'Paget': 'PG', 'Warwick': 'WK', 'Devonshire': 'DV', 'Smiths': 'FL',
+             'Hamilton': 'CR', 'Sandys': 'MA', 'Southampton': 'SN', "St. George's": 'GE'}
+# 2 letter code of the parcel IDs of each parish (Norwood dataset)
+PARCEL_CODES = {'Pembroke': 'PE', 'Paget': 'PA', 'Warwick': 'WA', 'Devonshire': 'DE', 'Smiths': 'SM',
+                'Hamilton': 'HA', 'Sandys': 'SA', 'Southampton': 'SO', "St. George's": 'SG'}
+STREETS = ['Harbour Road', 'Middle Road', 'South Road', 'North Shore Road', 'Cedar Avenue',
+           'Point Shares Road', 'Tribe Road No. 3', 'Crow Lane', 'Palmetto Road', 'Knapton Hill',
+           'Flatts Hill', 'Ireland Lane', 'Camelot Lane', 'Fairyland Lane']
+# most properties have no building name ('\xa0' on landvaluation.bm)
+BUILDING_NAMES = ['\xa0'] * 8 + ['Sea View', 'Main House', 'Apt 1', 'Apt 2', 'Unit 3', 'The Cottage',
+                                 'Island', 'Hill Top House', 'Cedar Ridge', 'Lower Apartment']
+# property types of landvaluation.bm (with their frequency)
+# and of the feeds, with the type they are mapped to by property_type_dict.csv
+LANDVALUATION_TYPES = {'house': 55, 'apartment': 25, 'condominium unit': 8, 'commercial': 7,
+                       'land': 3, 'hotel': 1, 'dock': 1}
+PROPERTY_TYPE_DICT = {'house': 'house', 'apartment': 'condo', 'condominium unit': 'condo',
+                      'condo': 'condo', 'cottage': 'house', 'commercial': 'commercial',
+                      'hotel': 'commercial', 'land': 'land', 'dock': 'other',
+                      'fractional': 'fractional'}
+SKIPPER_TYPES = ['House', 'Condo', 'Apartment', 'Cottage', 'Land', 'Commercial', 'Fractional']
+# effective dates of the historic ARVs
+ARV_DATES = ['01/01/2000', '01/01/2006', '01/01/2011', '01/01/2015', '01/01/2019', '01/01/2024']
+FRACTIONAL_DESCRIPTIONS = ['One Tenth fractional share Harbour Court', '1/10 th share Tucker\'s Point Golf Villa',
+                           'Fractional ownership at Newstead Belmont Hills']
+LAND_DESCRIPTIONS = ['Lot of land on {}', 'Vacant lot {}', 'Land situate at {}']
+AGENTS = [('101', 'Jane Smith', 'Island Realty', 'jane@example.bm', '441-555-0101'),
+          ('102', 'John Outerbridge', 'Harbour Properties', 'john@example.bm', '441-555-0102'),
+          ('103', 'Mary Trott', 'Pink Sand Realty', 'mary@example.bm', '441-555-0103')]
+
+TODAY = datetime.date.today()
+
+
+def _date(rnd, start=datetime.date(2018, 1, 1), end=TODAY):
+    return start + datetime.timedelta(days=rnd.randint(0, (end - start).days))
+
+
+def _price(rnd):
+    return rnd.choice([rnd.randint(20, 600) * 5000, rnd.randint(100, 2000) * 5000, rnd.randint(1, 9) * 100])
+
+
+def _spelling(rnd, parish):
+    # now and then a parish is written in one of its other forms
+    if parish in PARISH_SPELLINGS and rnd.random() < 0.2:
+        return rnd.choice(PARISH_SPELLINGS[parish])
+    return parish
+
+
+################  LANDVALUATION ################
+
+def _property(rnd, assessment_number):
+    parish = rnd.choice(PARISHES)
+    property_type = rnd.choices(list(LANDVALUATION_TYPES), weights=list(LANDVALUATION_TYPES.values()))[0]
+    # newest first, as on landvaluation.bm
+    historic = sorted(rnd.sample(ARV_DATES, rnd.randint(1, 4)), key=lambda date: date[-4:], reverse=True)
+    return {
+        'assessment_number': assessment_number,
+        'arv': '${:,}'.format(rnd.randint(10, 800) * 300),
+        'tax_code': rnd.choice(['R', 'R', 'R', 'C', 'E']),
+        'property_type': rnd.choice([property_type.upper(), property_type.title()]),
+        'address': '{} {}, {}, {} {:02d}'.format(rnd.randint(1, 150), rnd.choice(STREETS), parish,
+                                                 POSTCODES[parish], rnd.randint(1, 20)),
+        'grid': '{}{}'.format(rnd.choice('ABCDEFGH'), rnd.randint(1, 40)),
+        'parish': parish,
+        'building_name': rnd.choice(BUILDING_NAMES),
+        # "dd/mm/yyyy: $arv" lines, joined with a space by the scraper (see scraping/fixtures/)
+        'Historic_ARVs': ' '.join('{}: ${:,}'.format(date, rnd.randint(10, 800) * 300) for date in historic),
+    }
+
+
+def generate_landvaluation(root, n_properties, rnd):
+    """
+    writes the latest landvaluation data and a newer scrape of it:
+    about 3% of the properties changed, 1% disappeared and 1% are new.
+    :return: list of the properties (dicts) of the scrape
+    """
+    assessment_numbers = ['{:09d}'.format(n) for n in rnd.sample(range(10 ** 7, 10 ** 9), int(n_properties * 1.01))]
+    latest = [_property(rnd, assessment_number) for assessment_number in assessment_numbers[:n_properties]]
+
+    scraped = []
+    for prop in latest:
+        if rnd.random() < 0.01:
+            continue  # disappeared
+        prop = dict(prop)
+        if rnd.random() < 0.03:
+            prop['arv'] = '${:,}'.format(rnd.randint(10, 800) * 300)
+            prop['Historic_ARVs'] = '{}: {} {}'.format(TODAY.strftime('%d/%m/%Y'), prop['arv'],
+                                                       prop['Historic_ARVs'])
+        scraped.append(prop)
+    scraped.extend(_property(rnd, assessment_number) for assessment_number in assessment_numbers[n_properties:])
+    rnd.shuffle(scraped)
+
+    latest_fields = ['assessment_number', 'arv', 'tax_code', 'property_type', 'address', 'grid',
+                     'parish', 'building_name']
+    with open(os.path.join(root, 'data/landvaluation/latest_landvaluation_data.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=latest_fields, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(latest)
+    scraped_file = os.path.join(root, 'scraping', '{}_landvaluation_data.csv'.format(TODAY.isoformat()))
+    with open(scraped_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=latest_fields + ['Historic_ARVs'])
+        writer.writeheader()
+        writer.writerows(scraped)
+
+    with open(os.path.join(root, 'data/property_type_dict.csv'), 'w', newline='') as f:
+        csv.writer(f).writerows(PROPERTY_TYPE_DICT.items())
+    return scraped
+
+
+################  LTRO ################
+
+# columns of the LTRO workbooks (the two header rows, see LTROutils.LTRO_HEADER)
+LTRO_HEADER_ROWS = [
+    ['Application', 'x', 'Sale', 'x', 'Registration', 'x', 'x', 'Parish', 'x', 'Parcel', 'x',
+     'Assessment', 'Address', 'x', 'Mode of', 'Acquisition', 'Nature of', 'Price'],
+    ['Number', None, 'Type', None, 'Date', None, None, None, None, 'Area', None,
+     'Number', None, None, 'Acquisition', 'Date', 'Interest', None],
+]
+# columns of LTRO_2018.csv (already processed)
+LTRO_CSV_COLUMNS = ['application_number', 'sale_type', 'registration_date', 'parish', 'parcel_area',
+                    'assessment_number', 'address', 'Mode of\nAcquisition', 'acquisition_date',
+                    'Nature of\nInterest', 'price']
+PARCEL_AREAS = ['0.222 hectare/0.550 acre', '1200 sq ft', None, '0.1 ha and 0.2 ha',
+                '0.264 ha. (0.652 ac.)', '850 sq. m', '1.5 acres']
+
+
+def _sale(rnd, application_number, properties):
+    """
+    a row of an LTRO file (in the order of LTRO_CSV_COLUMNS)
+    """
+    prop = rnd.choice(properties)
+    street = prop['address'].split(',')[0]
+    kind = rnd.random()
+    if kind < 0.70:
+        assessment_number = prop['assessment_number']
+        address = prop['address'] if rnd.random() < 0.7 else street + ', ' + prop['parish']
+    elif kind < 0.80:
+        # the address is a parcel ID (see the Norwood dataset)
+        assessment_number = 0
+        address = '{}-{}{}'.format(PARCEL_CODES[prop['parish']], rnd.randint(1, 2000), rnd.choice(['', '', '/A', '/1']))
+    elif kind < 0.88:
+        assessment_number = '{}, {}'.format(prop['assessment_number'], rnd.choice(properties)['assessment_number'])
+        address = prop['address']
+    elif kind < 0.95:
+        assessment_number = 'Unknown'
+        address = rnd.choice(LAND_DESCRIPTIONS).format(street)
+    else:
+        assessment_number = 0
+        address = rnd.choice(FRACTIONAL_DESCRIPTIONS)
+    registration_date = _date(rnd)
+    acquisition_date = registration_date - datetime.timedelta(days=rnd.randint(0, 90))
+    return [application_number, 'Sale', datetime.datetime.combine(registration_date, datetime.time()),
+            prop['parish'], rnd.choice(PARCEL_AREAS), assessment_number, address,
+            rnd.choice(['Conveyance', 'Conveyance', 'Lease', 'Assignment of lease']),
+            acquisition_date.isoformat(), rnd.choice(['Freehold', 'Leasehold']), _price(rnd)]
+
+
+def _sales(rnd, n_sales, properties, application_numbers):
+    sales = []
+    for _ in range(n_sales):
+        sale = _sale(rnd, next(application_numbers), properties)
+        sales.append(sale)
+        if rnd.random() < 0.1:
+            # same application number, a second property
+            sales.append(_sale(rnd, sale[0], properties))
+        if rnd.random() < 0.03:
+            # the same sale registered again a few weeks later
+            again = list(sale)
+            again[0] = next(application_numbers)
+            again[2] = sale[2] + datetime.timedelta(days=rnd.randint(10, 60))
+            sales.append(again)
+    return sales
+
+
+def _write_ltro_xlsx(xlsx_file, sales):
+    import openpyxl
+
+    # write-only workbooks are streamed to disk, large files fit in memory
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(['Land Title Registry Office - Sales Report'])
+    for _ in range(8):
+        ws.append([])
+    for header_row in LTRO_HEADER_ROWS:
+        ws.append(header_row)
+    for sale in sales:
+        # spread the values over the columns of the sheet (empty columns in between)
+        ws.append([sale[0], None, sale[1], None, sale[2], None, None, sale[3], None, sale[4], None,
+                   sale[5], sale[6], None, sale[7], sale[8], sale[9], sale[10]])
+    wb.save(xlsx_file)
+
+
+def generate_ltro(root, n_sales, properties, rnd, n_parcels):
+    """
+    writes the 4 LTRO files and the Norwood dataset
+    :return: list of the sales (rows of LTRO_CSV_COLUMNS)
+    """
+    application_numbers = iter(range(100000, 10 ** 9))
+    ltro_dir = os.path.join(root, 'data/LTRO')
+    # share of the sales in each file
+    shares = {'LTRO_2018.csv': 0.15, 'LTRO_2018_2022.xlsx': 0.5, 'LTRO_2022.xlsx': 0.15, 'LTRO_2024.xlsx': 0.2}
+    all_sales = []
+    for ltro_file, share in shares.items():
+        sales = _sales(rnd, int(n_sales * share), properties, application_numbers)
+        if ltro_file.endswith('.csv'):
+            with open(os.path.join(ltro_dir, ltro_file), 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(LTRO_CSV_COLUMNS)
+                writer.writerows([sale[:2] + [sale[2].date().isoformat()] + sale[3:] for sale in sales])
+        else:
+            _write_ltro_xlsx(os.path.join(ltro_dir, ltro_file), sales)
+        all_sales.extend(sales)
+
+    # parcel IDs and the assessment number of the parcel (0 if unknown)
+    with open(os.path.join(ltro_dir, 'Norwood/parcel_id_assn_nr_database.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['parcel_id', 'street_address', 'parish', 'postcode', 'assessment_number'])
+        per_parish = n_parcels // len(PARISHES)
+        for parish in PARISHES:
+            for k in range(1, per_parish + 1):
+                prop = rnd.choice(properties)
+                writer.writerow(['{}-{}'.format(PARCEL_CODES[parish], k), prop['address'].split(',')[0],
+                                 parish, POSTCODES[parish] + ' 01',
+                                 prop['assessment_number'] if rnd.random() < 0.8 else '0'])
+    return all_sales
+
+
+################  PROPERTY SKIPPER ################
+
+def _text(parent, tag, value):
+    element = ET.SubElement(parent, tag)
+    if value is not None:
+        element.text = str(value)
+    return element
+
+
+def _description(rnd, prop):
+    text = '{} in {}.\r\nWalking distance to the beach.'.format(rnd.choice(['Charming', 'Spacious', 'Renovated']),
+                                                               prop['parish'])
+    if rnd.random() < 0.05:
+        text += ' ' + rnd.choice(FRACTIONAL_DESCRIPTIONS)
+    return text
+
+
+def generate_property_skipper(root, n_listings, properties, rnd):
+    """
+    writes today's Property Skipper feed (<root><property>...</property></root>)
+    """
+    feed = ET.Element('root')
+    for i in range(n_listings):
+        prop = rnd.choice(properties)
+        street = prop['address'].split(',')[0]
+        listing = ET.SubElement(feed, 'property')
+        _text(listing, 'reference', 'KW{:06d}'.format(i))
+        _text(listing, 'skipper_id', 50000 + i)
+        kind = rnd.random()
+        assessment_number = rnd.choice([prop['assessment_number']] * 8 + [
+            None, 'N/A', '0', '{} and {}'.format(prop['assessment_number'], rnd.choice(properties)['assessment_number'])])
+        _text(listing, 'assessment_number', assessment_number)
+        if kind < 0.05:
+            name = rnd.choice(LAND_DESCRIPTIONS).format(street)
+        elif kind < 0.08:
+            name = str(rnd.randint(1, 50))  # just a number
+        else:
+            name = street
+        _text(listing, 'name', name)
+        _text(listing, 'city', _spelling(rnd, prop['parish']))
+        _text(listing, 'zip', '{} {:02d}'.format(POSTCODES[prop['parish']], rnd.randint(1, 20)))
+        _text(listing, 'country', 'Bermuda')
+        _text(listing, 'longitude', round(rnd.uniform(-64.88, -64.65), 6))
+        _text(listing, 'latitude', round(rnd.uniform(32.25, 32.39), 6))
+        _text(listing, 'property_type', rnd.choice(SKIPPER_TYPES))
+        _text(listing, 'url', 'https://www.example.bm/listing/{}-{}'.format(
+            i, street.lower().replace(' ', '-').replace('.', '')))
+        _text(listing, 'views', rnd.randint(0, 5000))
+        _text(listing, 'special_headline', rnd.choice([None, None, 'Price reduced!', 'Ocean views']))
+        _text(listing, 'short_description', _description(rnd, prop))
+        _text(listing, 'long_description', _description(rnd, prop) * rnd.randint(3, 10))
+        _text(listing, 'youtube_id', rnd.choice([None] * 9 + ['dQw4w9WgXcQ']))
+        _text(listing, 'vimeo_id', rnd.choice([None] * 19 + ['76979871']))
+        _text(listing, 'paradym_url', rnd.choice([None] * 9 + ['https://paradym.example.com/{}'.format(i)]))
+        _text(listing, 'virtual_tour_url', rnd.choice([None] * 4 + ['https://tour.example.com/{}'.format(i)]))
+        images = ET.SubElement(listing, 'images')
+        for k in range(rnd.randint(0, 20)):
+            _text(images, 'image', 'https://img.example.bm/{}/{}.jpg'.format(i, k))
+        _text(listing, 'bedrooms', rnd.randint(0, 6))
+        _text(listing, 'bathrooms', rnd.randint(1, 5))
+        _text(listing, 'half_bathrooms', rnd.randint(0, 2))
+        _text(listing, 'lotsize', rnd.choice([None, round(rnd.uniform(0.05, 3), 2)]))
+        _text(listing, 'sqft', rnd.choice([None, rnd.randint(400, 8000)]))
+        added = _date(rnd, datetime.date(2015, 1, 1))
+        _text(listing, 'date_added', '{} 10:00:00'.format(added.isoformat()))
+        _text(listing, 'date_relisted', rnd.choice([None, '{} 09:30:00'.format(_date(rnd, added).isoformat())]))
+        is_rent = int(rnd.random() < 0.3)
+        _text(listing, 'is_rent', is_rent)
+        _text(listing, 'is_let', 0)
+        _text(listing, 'is_sale', 1 - is_rent)
+        _text(listing, 'under_contract', int(rnd.random() < 0.1))
+        _text(listing, 'under_offer', int(rnd.random() < 0.1))
+        _text(listing, 'buyer_type', rnd.choice(['Any', 'Bermudian', 'Non-Bermudian']))
+        _text(listing, 'price', rnd.choice([None, rnd.randint(2, 20) * 500]) if is_rent else _price(rnd))
+        _text(listing, 'price_from', rnd.choice([None] * 9 + [_price(rnd)]))
+        _text(listing, 'daily_rate', rnd.choice([None] * 19 + [rnd.randint(2, 20) * 50]))
+        agent = ET.SubElement(listing, 'agent')
+        for field in rnd.choice(AGENTS):
+            _text(agent, 'field', field)
+
+    ET.ElementTree(feed).write(os.path.join(root, DL.todays_skipper_xml()), encoding='utf-8', xml_declaration=True)
+
+
+################  SKIPPER STATS ################
+
+def _transaction(rnd, transactions, transaction_id, prop, date, price, status='Sold'):
+    transaction = ET.SubElement(transactions, 'transaction')
+    _text(transaction, 'id', transaction_id)
+    _text(transaction, 'status', status)
+    _text(transaction, 'transaction_date', date.isoformat())
+    _text(transaction, 'price', None if price is None else '{:,}'.format(price))
+    _text(transaction, 'sold_to_international_purchaser', int(rnd.random() < 0.1))
+    _text(transaction, 'comment', rnd.choice([None, None, 'Sold above asking', 'Estate sale']))
+    listing = ET.SubElement(transaction, 'listing', id=str(70000 + transaction_id))
+    _text(listing, 'ref', rnd.choice([None] + ['SS{:06d}'.format(transaction_id)] * 9))
+    property_type = PROPERTY_TYPE_DICT.get(prop['property_type'].lower(), 'house')
+    _text(listing, 'property_type', property_type)
+    photos = ET.SubElement(listing, 'photos')
+    for k in range(rnd.choice([0, 0, 1, 3, 8])):
+        photo = ET.SubElement(photos, 'photo')
+        _text(photo, 'path', '/photos/{}/{}.jpg'.format(transaction_id, k))
+    assessment = ET.SubElement(listing, 'assessment')
+    is_fractional = rnd.random() < 0.03
+    _text(assessment, 'assessment_number', None if is_fractional else prop['assessment_number'])
+    _text(assessment, 'address_line', prop['address'].split(',')[0])
+    building_name = prop['building_name'].strip() or None
+    if is_fractional:
+        building_name = 'Harbour Court Residences Unit {}{}'.format(rnd.randint(1, 30), rnd.choice('ABCD'))
+    _text(assessment, 'building_name', building_name)
+    _text(assessment, 'parish', _spelling(rnd, prop['parish']))
+    _text(assessment, 'postcode', prop['address'].split(',')[-1].strip())
+    _text(assessment, 'latitude', round(rnd.uniform(32.25, 32.39), 6))
+    _text(assessment, 'longitude', round(rnd.uniform(-64.88, -64.65), 6))
+    _text(assessment, 'arv_default', prop['arv'].replace('$', '').replace(',', ''))
+    _text(assessment, 'is_land', int(prop['property_type'].lower() == 'land'))
+    _text(assessment, 'is_fractional_unit', int(is_fractional))
+    return transaction
+
+
+def generate_skipper_stats(root, n_transactions, properties, sales, rnd):
+    """
+    writes today's Skipper Stats transactions.
+    About a third of the sales are also in the LTRO sales
+    (a few weeks before their registration date), so they are deduplicated.
+    """
+    by_assessment_number = {prop['assessment_number']: prop for prop in properties}
+    # LTRO sales of a single known property
+    ltro_sales = [sale for sale in sales if sale[5] in by_assessment_number]
+
+    feed = ET.Element('skipperstats')
+    transactions = ET.SubElement(feed, 'transactions')
+    for transaction_id in range(n_transactions):
+        status = 'Sold' if rnd.random() < 0.85 else rnd.choice(['Withdrawn', 'Expired'])
+        if ltro_sales and rnd.random() < 0.35:
+            sale = rnd.choice(ltro_sales)
+            prop = by_assessment_number[sale[5]]
+            date = sale[2].date() - datetime.timedelta(days=rnd.randint(0, 45))
+            price = sale[10]
+        else:
+            prop = rnd.choice(properties)
+            date = _date(rnd)
+            price = None if rnd.random() < 0.01 else _price(rnd)
+        transaction = _transaction(rnd, transactions, transaction_id, prop, date, price, status)
+        if rnd.random() < 0.03:
+            # the same sale entered twice, once without photos
+            duplicate = copy.deepcopy(transaction)
+            duplicate.find('listing/photos').clear()
+            transactions.append(duplicate)
+
+    transactions_file = DL.todays_file(DL.TRANSACTIONS_DIR, 'transactions.xml')
+    ET.ElementTree(feed).write(os.path.join(root, transactions_file), encoding='utf-8', xml_declaration=True)
+
+
+def generate(root, scale=1, seed=0):
+    """
+    writes all the inputs of the pipelines under root
+    :param root: directory where the data is generated (the pipelines then run from it)
+    :param scale: multiplies VOLUMES (1 is about the current volumes)
+    :param seed: the same seed generates the same data
+    :return: number of rows of each input
+    """
+    rnd = random.Random(seed)
+    volumes = {name: max(1, int(volume * scale)) for name, volume in VOLUMES.items()}
+    for directory in ['scraping', 'data/landvaluation', 'data/LTRO/Norwood', DL.TRANSACTIONS_DIR]:
+        os.makedirs(os.path.join(root, directory), exist_ok=True)
+
+    print("generating {} properties".format(volumes['properties']))
+    properties = generate_landvaluation(root, volumes['properties'], rnd)
+    print("generating {} LTRO sales".format(volumes['ltro_sales']))
+    sales = generate_ltro(root, volumes['ltro_sales'], properties, rnd, volumes['norwood_parcels'])
+    print("generating {} Property Skipper listings".format(volumes['listings']))
+    generate_property_skipper(root, volumes['listings'], properties, rnd)
+    print("generating {} Skipper Stats transactions".format(volumes['transactions']))
+    generate_skipper_stats(root, volumes['transactions'], properties, sales, rnd)
+    return volumes
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("usage: python -m benchmarks.generate <root> [--scale 10] [--seed 0]")
+    scale = float(sys.argv[sys.argv.index("--scale") + 1]) if "--scale" in sys.argv else 1
+    seed = int(sys.argv[sys.argv.index("--seed") + 1]) if "--seed" in sys.argv else 0
+    generate(sys.argv[1], scale, seed)
@@ -0,0 +1,163 @@
+# benchmarks of the four pipelines on synthetic data
+#
+# For each scale, the inputs are generated in a temporary directory
+# (see benchmarks/generate.py), the pipelines run there with --force
+# one after the other (not in parallel, so the stages don't compete
+# for the CPU) and the time of each stage is saved as JSON in
+# benchmarks/results/ (not committed), named after the date, commit and scale.
+#
+# `python -m benchmarks.run`                    scale 1
+# `python -m benchmarks.run --scale 1 10 100`   several scales
+# `python -m benchmarks.run --keep`             keep the generated data
+# `python -m benchmarks.run --results-dir DIR`  save the results to DIR
+# `python -m benchmarks.run --compare old.json new.json`
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from importlib import metadata
+
+import run_pipelines as RP
+from benchmarks.generate import generate, VOLUMES
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_DIR, "benchmarks", "results")
+# packages whose version is recorded with the results
+PACKAGES = ['pandas', 'numpy', 'openpyxl', 'pyarrow', 'lxml', 'thefuzz', 'pyproj']
+
+
+def _git(*args):
+    try:
+        return subprocess.run(["git"] + list(args), cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _versions():
+    versions = {'python': platform.python_version()}
+    for package in PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+def run_benchmark(scale=1, seed=0, keep=False):
+    """
+    generates the data of a scale and runs all the pipelines on it
+    :return: dict with the time of each pipeline and of each of its stages (in seconds)
+    """
+    work_dir = tempfile.mkdtemp(prefix="kw-benchmark-x{}-".format(scale))
+    cwd = os.getcwd()
+    result = {
+        'commit': _git("rev-parse", "HEAD"),
+        # uncommitted changes also count
+        'dirty': bool(_git("status", "--porcelain", "--untracked-files=no")),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'platform': platform.platform(),
+        'versions': _versions(),
+        'scale': scale,
+        'seed': seed,
+    }
+    try:
+        start = time.perf_counter()
+        result['volumes'] = generate(work_dir, scale, seed)
+        result['generate_seconds'] = time.perf_counter() - start
+
+        # the pipelines use paths relative to the repository root
+        os.chdir(work_dir)
+        result['pipelines'] = {}
+        for step in RP.STEPS:
+            for name in step:
+                pipeline = RP.PIPELINES[name]()
+                start = time.perf_counter()
+                pipeline.run(force=True)
+                result['pipelines'][name] = {'seconds': time.perf_counter() - start,
+                                             'stages': pipeline.timings}
+                # what the stages did (duplicates found, etc.), to compare between commits too
+                with open(pipeline.manifest_file) as f:
+                    stages = json.load(f)['stages']
+                result['pipelines'][name]['counters'] = {stage: record['counters'] for stage, record in stages.items()
+                                                         if record.get('counters')}
+    finally:
+        os.chdir(cwd)
+        if keep:
+            print("data kept in " + work_dir)
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return result
+
+
+def save_result(result, results_dir=RESULTS_DIR):
+    os.makedirs(results_dir, exist_ok=True)
+    results_file = os.path.join(results_dir, "{}_{}_x{}.json".format(
+        result['date'][:10], (result['commit'] or 'unknown')[:7], result['scale']))
+    with open(results_file, 'w') as f:
+        json.dump(result, f, indent=2)
+    return results_file
+
+
+def print_result(result):
+    print("\n >> BENCHMARK x{} ({} properties) << \n".format(result['scale'], result['volumes']['properties']))
+    for name, pipeline in result['pipelines'].items():
+        print("{:<16} {:>8.2f}s".format(name, pipeline['seconds']))
+        for stage, seconds in pipeline['stages'].items():
+            print("    {:<14} {:>6.2f}s".format(stage, seconds))
+
+
+def compare(old_file, new_file):
+    """
+    prints the time of each stage in two results and the ratio new / old
+    """
+    with open(old_file) as f:
+        old = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+    if old['scale'] != new['scale']:
+        print("WARNING, comparing scale x{} with scale x{}".format(old['scale'], new['scale']))
+    print("{:<28} {:>10} {:>10} {:>7}".format("", (old['commit'] or '?')[:7], (new['commit'] or '?')[:7], "ratio"))
+    for name, pipeline in new['pipelines'].items():
+        old_pipeline = old['pipelines'].get(name, {'seconds': None, 'stages': {}})
+        rows = [(name, old_pipeline['seconds'], pipeline['seconds'])]
+        rows += [("    " + stage, old_pipeline['stages'].get(stage), seconds)
+                 for stage, seconds in pipeline['stages'].items()]
+        for label, old_seconds, new_seconds in rows:
+            if old_seconds:
+                print("{:<28} {:>9.2f}s {:>9.2f}s {:>6.2f}x".format(label, old_seconds, new_seconds,
+                                                                   new_seconds / old_seconds))
+            else:
+                print("{:<28} {:>10} {:>9.2f}s".format(label, "-", new_seconds))
+
+
+def _scales(argv):
+    # the numbers after --scale
+    if "--scale" not in argv:
+        return [1]
+    scales = []
+    for arg in argv[argv.index("--scale") + 1:]:
+        if arg.startswith('--'):
+            break
+        scales.append(float(arg) if '.' in arg else int(arg))
+    return scales
+
+
+if __name__ == "__main__":
+    if "--compare" in sys.argv:
+        position = sys.argv.index("--compare")
+        compare(sys.argv[position + 1], sys.argv[position + 2])
+        sys.exit(0)
+
+    seed = int(sys.argv[sys.argv.index("--seed") + 1]) if "--seed" in sys.argv else 0
+    results_dir = sys.argv[sys.argv.index("--results-dir") + 1] if "--results-dir" in sys.argv else RESULTS_DIR
+    for scale in _scales(sys.argv):
+        print("\nscale x{}: {}".format(scale, {name: int(volume * scale) for name, volume in VOLUMES.items()}))
+        result = run_benchmark(scale, seed, keep="--keep" in sys.argv)
+        print_result(result)
+        print("\nresults saved to " + save_result(result, results_dir))
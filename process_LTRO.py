@@ -1,9 +1,14 @@
 # Imports
+import os
+import sys
+
 import pandas as pd
-import numpy as np
 
 # LTRO functions
 import utils.LTROutils as LT
+import utils.manifestutils as MAN
+import utils.outpututils as OUT
+import utils.schemautils as SCH
 import utils.skipperutils as skipu
 from utils.LTROutils import NORWOOD_DATA_PATH
 
@@ -13,118 +18,251 @@ from utils.LTROutils import NORWOOD_DATA_PATH
 # 3. use standard property_type
 # 4. process duplicates
 # 5. use standard parishes
+#
+# run with `python process_LTRO.py --incremental` to only process
+# the sales from new LTRO files (see the end of this script)
 
 # 1. Files from LTRO:
 DATA_18_22 = "./data/LTRO/LTRO_2018_2022.xlsx"
 DATA_18_PROCESSED = "./data/LTRO/LTRO_2018.csv"
 DATA_22 = "./data/LTRO/LTRO_2022.xlsx"
 DATA_24 = "./data/LTRO/LTRO_2024.xlsx"
+# oldest first
+LTRO_FILES = [DATA_18_PROCESSED, DATA_18_22, DATA_22, DATA_24]
+
+SALES_FILE = "./data/kw-sales.csv"
+PROPERTIES_FILE = "./data/kw-properties.csv"
+NORWOOD_FILE = NORWOOD_DATA_PATH + "parcel_id_assn_nr_database.csv"
+
+
+def load_ltro_file(ltro_file):
+    # 2. Load & Clean Files
+    # (the XLSX files are streamed, keeping only the columns we use)
+    if ltro_file.endswith(".csv"):
+        df = pd.read_csv(ltro_file)
+    else:
+        df = LT.load_ltro_data(ltro_file)
+    df["source_file"] = ltro_file
+    return df
+
+
+def load_ltro_sales():
+    """
+    Steps 1. and 2. on all the LTRO files.
+    The cleaned sales are also saved for incremental runs
+    :return: cleaned LTRO sales (combined from the LTRO files)
+    """
+    # combine all 4 files
+    df = pd.concat([load_ltro_file(ltro_file) for ltro_file in LTRO_FILES])
+    df = LT.add_sale_key(df)
+    LT.save_cleaned_sales(df, {ltro_file: MAN.file_hash(ltro_file) for ltro_file in LTRO_FILES})
+    return df
+
+
+def load_properties():
+    return OUT.read_output(PROPERTIES_FILE)
+
+
+def load_norwood():
+    nw = pd.read_csv(NORWOOD_FILE, dtype={"assessment_number": str})
+    return LT.build_parcel_id_index(nw)
+
+
+def clean_sales(df):
+    """
+    Step 3. on cleaned LTRO sales.
+    :param df: cleaned LTRO sales (combined from the LTRO files)
+    :return: sales with a property_type
+    """
+    # the sales of all the LTRO files (and of the last run) are together from here,
+    # so they get the same categories. Dates are parsed here once.
+    df = SCH.apply_schema(df, SCH.LTRO_SALES)
+    # if there were any NaN convert them to zero
+    df = SCH.fill_missing(df, SCH.LTRO_SALES)
+    df.reset_index(drop=True, inplace=True)
+
+    print(f"\n{df.shape[0]} sales imported between dates:"
+          f"{df.registration_date.min()} and "
+          f"{df.registration_date.max()}\n")
+    MAN.count('sales_imported', df.shape[0])
+
+    # 3. a new columns called "property_type"
+    # is defined. It will contain either
+    # "fractional", "land", "house", "condo" or False
+    df = LT.identify_fractionals(df)
+    df = LT.identify_lands(df)
+    df = LT.identify_houses(df)
+    df = LT.identify_condos(df)
+    return df
+
+
+def dedup_sales(df):
+    """
+    Step 4.
+    :param df: sales with a property_type (see clean_sales)
+    :return: sales without duplicates
+    """
+    # 4. Remove Duplicates
+    LTRO_entries = df.shape[0]
+    df = df.drop_duplicates(subset=['application_number','registration_date',
+                                    'acquisition_date',
+                                    'assessment_number',
+                                    'price'],
+                                    keep='first', )
+
+    # Some duplicates remain (different application_number, different date but same sale)
+    # the last entries have more data, so we keep those
+    df = df[~df.duplicated(subset=['address', 'price', 'parish', 'assessment_number'], keep='last')]
+
+    print(LTRO_entries - df.shape[0], "duplicates removed")
+    MAN.count('duplicates_removed', LTRO_entries - df.shape[0])
+
+    if df[df['application_number'].duplicated()].shape[0] > 0:
+        print("WARNING, some sales HAVE DUPLICATES\n")
+
+    # keep=False to show all duplicate entries (not just the ones after the first)
+    to_process = df[df['application_number'].duplicated(keep=False)].shape[0]
+
+    df = LT.process_duplicates(df)
+    print(to_process, " rows processed for duplicates")
+    MAN.count('rows_processed_for_duplicates', to_process)
+
+    df = LT.remove_application_number_duplicates(df)
+    return df
+
+
+def enrich_sales(df, lv, nw):
+    """
+    Completes the sales without duplicates with the landvaluation and Norwood data
+    and step 5.
+    :param df: sales without duplicates (see dedup_sales)
+    :param lv: landvaluation dataframe (kw-properties.csv)
+    :param nw: Norwood parcel ID index (see LT.build_parcel_id_index)
+    :return: dataframe of sales ready for export
+    """
+    # Prepare for next phase by cleaning up assessment numbers
+    df = SCH.fill_missing(df, SCH.LTRO_SALES)
+
+    df["assessment_number"] = df.assessment_number.apply(skipu.clean_assn_nr)
+    df = LT.add_arv_to_ltro(df, lv)
+
+
+    # improve sales property type data
+    df = LT.clean_property_type(df, lv)
+
+
+    # Sanity check:
+    # keep only properties such that the sales price is more than 2 years of rent.
+    df = df[~(df['combined_arv']*2 >= df['price'])] #  & (df.property_type != 'fractional')]
+
+    # create a column with surface area in hectares
+    df = LT.clean_area(df)
+
+    # 5. Use standard parishes
+    df = LT.simplify_parishes(df)
+
+    # Select columns of interest
+    final_df = df[["application_number", "registration_date", "parish",
+                   "address", "parcel_area", "parcel_area_ha",
+                  "assessment_number", "acquisition_date",
+                   "price", "arv", "combined_arv", "property_type"]].copy(deep=False)
+
+    # final_df.assessment_number = final_df.assessment_number.apply(LT.get_assessment_number)
+    final_df["assessment_number"] = final_df.assessment_number.apply(skipu.clean_assn_nr)
+
+    # try to find the assessment number or address
+    # for properties identified only with their parcel ID (like PA-2037)
+    final_df = LT.clean_addresses_with_assessment_number(final_df, lv)
+    final_df = LT.clean_addresses_with_norwood(final_df, nw)
+    final_df = LT.clean_ARV_with_landvaluation(final_df, lv)
+    # Revisit sales data to improve property type
+    final_df = LT.clean_property_type(final_df, lv)
+    # final cleanup of addresses
+    final_df = LT.clean_addresses_with_landvaluation(final_df, lv)
+
+    # Some sales have "ghost" assessment numbers
+    # https://github.com/bermuda-automation/kw-data-import/issues/5
+    # remove them
+    final_df = LT.remove_ghost_assessment_numbers(final_df, lv)
+
+    # remove duplicates with a difference in registration date of less than 4 months
+    # as long as the price, address and assessment number are the same for the two records
+    final_df = LT.remove_close_duplicate_sales(final_df)
+    return final_df
+
+
+def process_sales(df, lv, nw):
+    """
+    Steps 3. to 5. on cleaned LTRO sales.
+    :param df: cleaned LTRO sales (combined from the LTRO files)
+    :param lv: landvaluation dataframe (kw-properties.csv)
+    :param nw: Norwood parcel ID index (see LT.build_parcel_id_index)
+    :return: dataframe of sales ready for export
+    """
+    return enrich_sales(dedup_sales(clean_sales(df)), lv, nw)
+
+
+def export_sales(final_df):
+    OUT.write_output(final_df, SALES_FILE)
+
+
+def main(incremental=False):
+    lv = load_properties()
+    nw = load_norwood()
+
+    cleaned_sales, processed_files = LT.load_cleaned_sales()
+    if incremental and (cleaned_sales is None or not os.path.exists(SALES_FILE)):
+        print("No previous run to build on, processing all LTRO files")
+        incremental = False
+
+    if not incremental:
+        export_sales(process_sales(load_ltro_sales(), lv, nw))
+
+    else:
+        ltro_hashes = {ltro_file: MAN.file_hash(ltro_file) for ltro_file in LTRO_FILES}
+        # Only the LTRO files which are new (or have changed) are read
+        new_files = [ltro_file for ltro_file in LTRO_FILES
+                     if processed_files.get(ltro_file) != ltro_hashes[ltro_file]]
+        if len(new_files) > 0:
+            new_file_sales = pd.concat([load_ltro_file(ltro_file) for ltro_file in new_files])
+            new_file_sales = LT.add_sale_key(new_file_sales)
+            # sales already found in a previous LTRO file are not new
+            new_sales = new_file_sales[~new_file_sales.sale_key.isin(cleaned_sales.sale_key)]
+        else:
+            new_file_sales = new_sales = cleaned_sales.iloc[0:0]
+        print(f"{len(new_files)} new LTRO files with {new_sales.shape[0]} new sales")
+        MAN.count('new_ltro_files', len(new_files))
+        MAN.count('new_sales', new_sales.shape[0])
+
+        if new_sales.shape[0] > 0:
+            # new sales and the sales they could be duplicates of
+            candidates = LT.find_duplicate_candidates(cleaned_sales, new_sales)
+            print(f"{candidates.shape[0]} processed sales could be duplicates of the new sales")
+            MAN.count('duplicate_candidates', candidates.shape[0])
+            # in the order of a full run, so the same duplicates are kept
+            file_order = {ltro_file: position for position, ltro_file in enumerate(LTRO_FILES)}
+            full_run_sales = pd.concat([cleaned_sales[~cleaned_sales.source_file.isin(new_files)], new_file_sales])
+            full_run_sales = full_run_sales.sort_values('source_file', key=lambda files: files.map(file_order),
+                                                        kind='stable')
+            df = LT.in_full_run_order(pd.concat([candidates, new_sales]), full_run_sales)
+
+            final_df = process_sales(df, lv, nw)
+
+            # replace the sales of the application numbers processed with all
+            # their sales in the existing output (read from the CSV, so the
+            # sales which are kept are written back as they were)
+            complete = LT.complete_applications(pd.concat([cleaned_sales, new_sales]), df)
+            final_df = final_df[final_df.application_number.astype(str).isin(complete)]
+            previous_df = pd.read_csv(SALES_FILE, dtype={"assessment_number": str})
+            reprocessed = previous_df.application_number.astype(str).isin(complete)
+            final_df = pd.concat([previous_df[~reprocessed], final_df])
+            export_sales(final_df)
+
+        LT.save_cleaned_sales(pd.concat([cleaned_sales, new_sales]), ltro_hashes)
+
+    print("\n >> LTRO DATA IMPORTED << \n")
 
-df = pd.read_excel(DATA_18_22, header=None, skiprows=9)
-older_ltro = pd.read_csv(DATA_18_PROCESSED)
-dflast =  pd.read_excel(DATA_22, header=None, skiprows=9)
-df24 =  pd.read_excel(DATA_24, header=None, skiprows=9)
-# 2. Clean Files
-df = LT.clean_ltro_data(df)
-dflast = LT.clean_ltro_data(dflast)
-df24 = LT.clean_ltro_data(df24)
-
-# combine all 4 files
-df = pd.concat([older_ltro, df, dflast, df24])
-# if there were any NaN convert them to zero
-df = df.replace(np.nan, 0, regex=True)
-df['registration_date'] =  pd.to_datetime(df['registration_date'], format='%Y-%m-%d').dt.date
-df.reset_index(drop=True, inplace=True)
-
-print(f"\n{df.shape[0]} sales imported between dates:"
-      f"{df.registration_date.min()} and "
-      f"{df.registration_date.max()}\n")
-
-# 3. a new columns called "property_type"
-# is defined. It will contain either
-# "fractional", "land", "house", "condo" or False
-df = LT.identify_fractionals(df)
-df = LT.identify_lands(df)
-df = LT.identify_houses(df)
-df = LT.identify_condos(df)
-
-# 4. Remove Duplicates
-LTRO_entries = df.shape[0]
-df = df.drop_duplicates(subset=['application_number','registration_date',
-                                'acquisition_date',
-                                'assessment_number',
-                                'price'], 
-                                keep='first', )
-
-# Some duplicates remain (different application_number, different date but same sale)
-# the last entries have more data, so we keep those
-df = df[~df.duplicated(subset=['address', 'price', 'parish', 'assessment_number'], keep='last')]
-
-print(LTRO_entries - df.shape[0], "duplicates removed")
-
-if df[df['application_number'].duplicated()].shape[0] > 0:
-    print("WARNING, some sales HAVE DUPLICATES\n")
-
-# keep=False to show all duplicate entries (not just the ones after the first)
-to_process = df[df['application_number'].duplicated(keep=False)].shape[0]
-
-df = LT.process_duplicates(df)
-print(to_process, " rows processed for duplicates")
-
-df = LT.remove_application_number_duplicates(df)
-
-# Prepare for next phase by cleaning up assessment numbers
-df = df.replace(np.nan, 0, regex=True)
-
-df["assessment_number"] = df.assessment_number.apply(skipu.clean_assn_nr)
-lv = pd.read_csv("./data/kw-properties.csv", dtype={"assessment_number": str})
-df = LT.add_arv_to_ltro(df, lv)
-
-
-# improve sales property type data
-df = LT.clean_property_type(df, lv)
-
-
-# Sanity check:
-# keep only properties such that the sales price is more than 2 years of rent.
-df = df[~(df['combined_arv']*2 >= df['price'])] #  & (df.property_type != 'fractional')]
-
-# create a column with surface area in hectares
-df = LT.clean_area(df)
-
-# 5. Use standard parishes
-df = LT.simplify_parishes(df)
-
-# Select columns of interest
-final_df = df[["application_number", "registration_date", "parish",
-               "address", "parcel_area", "parcel_area_ha",
-              "assessment_number", "acquisition_date",
-               "price", "arv", "combined_arv", "property_type"]].copy(deep=False)
-
-# final_df.assessment_number = final_df.assessment_number.apply(LT.get_assessment_number)
-final_df["assessment_number"] = final_df.assessment_number.apply(skipu.clean_assn_nr)
-
-# try to find the assessment number or address
-# for properties identified only with their parcel ID (like PA-2037)
-nw = pd.read_csv(NORWOOD_DATA_PATH + "parcel_id_assn_nr_database.csv",
-                 dtype={"assessment_number": str})
-
-final_df = LT.clean_addresses_with_assessment_number(final_df, lv)
-final_df = LT.clean_addresses_with_norwood(final_df, nw)
-final_df = LT.clean_ARV_with_landvaluation(final_df, lv)
-# Revisit sales data to improve property type
-final_df = LT.clean_property_type(final_df, lv)
-# final cleanup of addresses
-final_df = LT.clean_addresses_with_landvaluation(final_df, lv)
-
-# Some sales have "ghost" assessment numbers
-# https://github.com/bermuda-automation/kw-data-import/issues/5
-# remove them
-final_df = LT.remove_ghost_assessment_numbers(final_df, lv)
-
-# remove duplicates with a difference in registration date of less than 4 months
-# as long as the price, address and assessment number are the same for the two records
-final_df = LT.remove_close_duplicate_sales(final_df)
-final_df.to_csv("./data/kw-sales.csv", index=False)
 
-print("\n >> LTRO DATA IMPORTED << \n")
+if __name__ == "__main__":
+    with MAN.recording('ltro', inputs=LTRO_FILES + [PROPERTIES_FILE, NORWOOD_FILE], outputs=[SALES_FILE]):
+        main(incremental="--incremental" in sys.argv)
@@ -1,11 +1,13 @@
 import glob
 import os
+import sys
 import csv
 import pandas as pd
-import numpy as np
 
 import utils.LTROutils as LT
 import utils.landvalutils as LAV
+import utils.manifestutils as MAN
+import utils.outpututils as OUT
 
 #  Importing data from land valuation has the following steps:
 # 1. check if there is new data that has been scraped
@@ -13,137 +15,237 @@ import utils.landvalutils as LAV
 # 3. process duplicates
 # 4. use standard property_type
 # 5. use standard parishes
+#
+# run with `python process_landvaluation.py --incremental` to only clean
+# the properties which were added or changed since the last scrape
+# (see the end of this script)
 
-files_from_scraping = glob.glob('./scraping/*.csv') 
-# get the file which was last modified
-last_scraped_data_file = max(files_from_scraping, key=os.path.getmtime)
-scraped = pd.read_csv(last_scraped_data_file, dtype={"assessment_number": str})
-
-latest_lv_data_file = "./data/landvaluation/latest_landvaluation_data.csv"
-df = pd.read_csv(latest_lv_data_file, dtype={"assessment_number": str})
-
-# 1. Have new properties been added by scraping?
-# If so, 
-# - let's find which assessment_numbers have modified values
-# - let's maintain old assessment_numbers even if they are not in landvaluation anymore
-#    (for the record, we want to keep the old values)
-# - let's add the new assessment_numbers to the latest_landvaluation_data.csv file
-
-# Ensure 'assessment_number' is the index for both DataFrames
-# so we can use vectorized operations
-scraped.set_index('assessment_number', inplace=True)
-scraped = scraped.sort_index()
-
-df.set_index('assessment_number', inplace=True)
-df = df.sort_index()
-
-# Ensure both DataFrames have the same columns
-fields_to_compare = ['arv', 'tax_code', 'property_type', 'address', 'grid', 'parish', 'building_name']
-scraped = scraped[fields_to_compare]
-df = df[fields_to_compare]
-
-# To compare the dataframes, we need to have the same assessment numbers
-df_coincide = df.copy(deep=True)
-df_coincide = df_coincide[df_coincide.index.isin(scraped.index)]
-
-scraped_coincide = scraped.copy(deep=True)
-scraped_coincide = scraped_coincide[scraped_coincide.index.isin(df.index)]
-
-# mask with changed fields using vectorized operations
-changed_fields_mask = (scraped_coincide != df_coincide).any(axis=1)
-# Update only the changed fields
-df.update(scraped_coincide.loc[changed_fields_mask, fields_to_compare])
-
-# reset index for df
-df["assessment_number"] = df.index
-df.reset_index(drop=True, inplace=True)
-
-# reset index for scraped
-scraped["assessment_number"] = scraped.index
-scraped.reset_index(drop=True, inplace=True)
+PROPERTIES_FILE = "./data/kw-properties.csv"
+SCRAPED_FILES = './scraping/*.csv'
+LATEST_LV_DATA_FILE = "./data/landvaluation/latest_landvaluation_data.csv"
+
+
+def last_scraped_file():
+    files_from_scraping = glob.glob(SCRAPED_FILES)
+    # get the file which was last modified
+    return max(files_from_scraping, key=os.path.getmtime)
+
+
+def load_scraped_data():
+    return pd.read_csv(last_scraped_file(), dtype={"assessment_number": str})
+
+
+def load_latest_data():
+    return pd.read_csv(LATEST_LV_DATA_FILE, dtype={"assessment_number": str})
+
+
+def merge_scraped_data(df, scraped):
+    """
+    Steps 1. and 2.
+    :param df: latest landvaluation data
+    :param scraped: last scraped landvaluation data
+    :return: latest data updated with the scraped data
+    """
+    # 1. Have new properties been added by scraping?
+    # If so, 
+    # - let's find which assessment_numbers have modified values
+    # - let's maintain old assessment_numbers even if they are not in landvaluation anymore
+    #    (for the record, we want to keep the old values)
+    # - let's add the new assessment_numbers to the latest_landvaluation_data.csv file
+
+    # Ensure 'assessment_number' is the index for both DataFrames
+    # so we can use vectorized operations
+    scraped = scraped.set_index('assessment_number')
+    scraped = scraped.sort_index()
+
+    df = df.set_index('assessment_number')
+    df = df.sort_index()
+
+    # Ensure both DataFrames have the same columns
+    fields_to_compare = LAV.LANDVALUATION_FIELDS
+    scraped = scraped[fields_to_compare]
+    df = df[fields_to_compare]
+
+    # To compare the dataframes, we need to have the same assessment numbers
+    df_coincide = df.copy(deep=True)
+    df_coincide = df_coincide[df_coincide.index.isin(scraped.index)]
+
+    scraped_coincide = scraped.copy(deep=True)
+    scraped_coincide = scraped_coincide[scraped_coincide.index.isin(df.index)]
+
+    # mask with changed fields using vectorized operations
+    changed_fields_mask = (scraped_coincide != df_coincide).any(axis=1)
+    # Update only the changed fields
+    df.update(scraped_coincide.loc[changed_fields_mask, fields_to_compare])
+
+    # reset index for df
+    df["assessment_number"] = df.index
+    df.reset_index(drop=True, inplace=True)
+
+    # reset index for scraped
+    scraped["assessment_number"] = scraped.index
+    scraped.reset_index(drop=True, inplace=True)
             
-# 2. add the new assessment numbers
-# Find assessment numbers in df that are not in df23
-new_assessment_numbers = scraped[~scraped['assessment_number'].isin(df['assessment_number'])]
-# Add these new entries to new_df
-df = pd.concat([df, new_assessment_numbers], ignore_index=True)
-# reset index
-df.reset_index(drop=True, inplace=True)
-
-print(f"Added {len(new_assessment_numbers)} new properties to the dataset.")
-print(f"The dataset now has {len(df)} properties.")
-
-
-# 3. Process Duplicates (also further below)
-##### change to lower
-df["property_type"] = df["property_type"].str.lower().str.strip()
-df["tax_code"] = df["tax_code"].str.lower().str.strip()
-df["address_low"] = df["address"].str.lower().str.strip()
-df["building_name_low"] = df["building_name"].str.lower().str.strip()
-
-df = df.drop_duplicates()
-
-
-# 4. Simplify Categories (Standardise property_type)
-# Load Dictionary from CSV
-with open('./data/property_type_dict.csv') as csv_file:
-    reader = csv.reader(csv_file)
-    property_type_dict = dict(reader)
-
-# Map new categories using the dictionary    
-df2=df.replace({"property_type": property_type_dict})
-df2["property_type"].value_counts() # the last one is currently "land"
-print("\n", len(df2["property_type"].value_counts()), "property types identified.\n") # there are currently 12 property_type
-
-
-##### change ARV to numbers
-df2.arv = df2.arv.map(lambda x: int(x.replace(',','').replace('$','')) if isinstance(x, str) else x)
-# some ARVs may be NaN, so replace them with 0
-df2.arv = df2.arv.replace(np.nan, 0, regex=True)
-
-#### drop all empty columns & rows ####
-# delete all empty columns & rows
-df2 = df2.dropna(axis=1, how='all')
-df2 = df2.dropna(axis=0, how='all')
-
-##### Sanity checks
-# Check for Duplicates
-dfarv = df2.drop_duplicates(subset=['assessment_number'], keep="last")
-if df2.shape[0] != dfarv.shape[0]:
-    print("WARNING, THERE SEEM TO BE DUPLICATE ASSESSMENT NUMBERS")
-    print("processing duplicates with similar building name:")
-    df2 = LAV.process_and_merge_duplicates(df2)
-    if df2.shape[0] < 40000:
-        print("\n Nr of unique assessment numbers: ", df2.shape[0], "[OK]\n")    
+    # 2. add the new assessment numbers
+    # Find assessment numbers in df that are not in df23
+    new_assessment_numbers = scraped[~scraped['assessment_number'].isin(df['assessment_number'])]
+    # Add these new entries to new_df
+    df = pd.concat([df, new_assessment_numbers], ignore_index=True)
+    # reset index
+    df.reset_index(drop=True, inplace=True)
+
+    print(f"Added {len(new_assessment_numbers)} new properties to the dataset.")
+    MAN.count('new_properties', len(new_assessment_numbers))
+    print(f"The dataset now has {len(df)} properties.")
+    return df
+
+
+def clean_properties(df):
+    """
+    Steps 3. to 6. on the landvaluation data.
+    :param df: landvaluation data (latest data merged with the last scrape)
+    :return: dataframe of properties ready for export
+    """
+    # 3. Process Duplicates (also further below)
+    ##### change to lower
+    df["property_type"] = df["property_type"].str.lower().str.strip()
+    df["tax_code"] = df["tax_code"].str.lower().str.strip()
+    df["address_low"] = df["address"].str.lower().str.strip()
+    df["building_name_low"] = df["building_name"].str.lower().str.strip()
+
+    df = df.drop_duplicates()
+
+
+    # 4. Simplify Categories (Standardise property_type)
+    # Load Dictionary from CSV
+    with open('./data/property_type_dict.csv') as csv_file:
+        reader = csv.reader(csv_file)
+        property_type_dict = dict(reader)
+
+    # Map new categories using the dictionary    
+    df2=df.replace({"property_type": property_type_dict})
+    df2["property_type"].value_counts() # the last one is currently "land"
+    print("\n", len(df2["property_type"].value_counts()), "property types identified.\n") # there are currently 12 property_type
+
+
+    ##### change ARV to numbers
+    df2.arv = df2.arv.map(lambda x: int(x.replace(',','').replace('$','')) if isinstance(x, str) else x)
+    # some ARVs may be NaN, so replace them with 0
+    df2.arv = df2.arv.fillna(0)
+
+    #### drop all empty columns & rows ####
+    # delete all empty columns & rows
+    df2 = df2.dropna(axis=1, how='all')
+    df2 = df2.dropna(axis=0, how='all')
+
+    ##### Sanity checks
+    # Check for Duplicates
+    dfarv = df2.drop_duplicates(subset=['assessment_number'], keep="last")
+    if df2.shape[0] != dfarv.shape[0]:
+        print("WARNING, THERE SEEM TO BE DUPLICATE ASSESSMENT NUMBERS")
+        print("processing duplicates with similar building name:")
+        df2 = LAV.process_and_merge_duplicates(df2)
+        if df2.shape[0] < 40000:
+            print("\n Nr of unique assessment numbers: ", df2.shape[0], "[OK]\n")    
+        else:
+            print("WARNING, ", df2.shape[0], "ARE TOO MANY DUPLICATE ASSESSMENT NUMBERS!!")
+
+    else:
+        print("# of unique assessment numbers: ", df2.shape[0], "[OK]")    
+    # Inspect ARV range
+    mxarv = df2["arv"].max()
+    minarv = df2["arv"].min()
+    if minarv < 0:
+        print("NEGARIVE ARVs, please inspect data")
+    if mxarv > 10000000:
+        print("ARVs too large, please inspect data")
+    else:
+        print("Min ARV:", minarv, "and", "Max ARV", mxarv,  "[OK]")
+
+    # 5. Simplify Parishes
+    df2 = LT.simplify_parishes(df2)
+    # Remove any assessment number duplicates left (keep the last one)
+    df = df2[~df2.assessment_number.duplicated(keep='last')]
+
+    # 6. Create a column with the property name.
+    df["property_name"] = LAV.create_property_names(df)
+
+    # Select columns of interest    
+    df_for_export = df[["assessment_number","arv","tax_code","property_type", "address", "grid", "parish", "building_name", "property_name"]]
+    # make sure assessment numbers stay as 9 digit strings
+    df_for_export.loc[:, 'assessment_number'] = df_for_export['assessment_number'].astype(str)
+    return df_for_export
+
+
+def export_properties(df_for_export):
+    # save to CSV
+    print(f"{len(df_for_export)} properties exported to CSV")
+    OUT.write_output(df_for_export, PROPERTIES_FILE)
+
+
+def save_latest_data(df):
+    """
+    the latest data now includes the last scrape, it is saved
+    so the next run (incremental or not) compares against it
+    :param df: latest data updated with the scraped data
+    """
+    # sorted as merge_scraped_data sorts it, so saving the same data again gives the same file
+    latest = df[["assessment_number"] + LAV.LANDVALUATION_FIELDS].sort_values('assessment_number', kind='stable')
+    latest.to_csv(LATEST_LV_DATA_FILE, index=False)
+
+
+def update_properties(df, added, changed):
+    """
+    Incremental run: the new and changed properties are cleaned
+    and replace their rows in PROPERTIES_FILE
+    :param df: latest data updated with the scraped data
+    :param added: assessment numbers added by the last scrape
+    :param changed: assessment numbers changed by the last scrape
+    """
+    # only the new and changed properties are cleaned again
+    to_clean = df[df.assessment_number.isin(added.append(changed))]
+    if to_clean.shape[0] > 0:
+        cleaned = clean_properties(to_clean.reset_index(drop=True))
+        # replace those properties in the existing output
+        # (read from the CSV, so the rows which are kept are written back as they were)
+        previous_df = pd.read_csv(PROPERTIES_FILE, dtype={"assessment_number": str})
+        previous_df = previous_df[~previous_df.assessment_number.isin(cleaned.assessment_number)]
+        df_for_export = pd.concat([previous_df, cleaned], ignore_index=True)
+        print(f"{len(cleaned)} properties updated, {len(df_for_export)} properties exported to CSV")
+        OUT.write_output(df_for_export, PROPERTIES_FILE)
+
+
+def main(incremental=False):
+    scraped = load_scraped_data()
+    # keep the ARVs over time of each property
+    LAV.update_historic_arvs(scraped)
+
+    df = load_latest_data()
+
+    if incremental and not os.path.exists(PROPERTIES_FILE):
+        print("No previous run to build on, processing all properties")
+        incremental = False
+
+    if incremental:
+        # which properties have been added, changed or disappeared since the last scrape?
+        added, changed, disappeared = LAV.find_landvaluation_changes(df, scraped)
+        LAV.log_landvaluation_changes(df, scraped, added, changed, disappeared, last_scraped_file())
+        print(f"{len(added)} properties added, {len(changed)} changed "
+              f"and {len(disappeared)} disappeared since the last scrape")
+        MAN.count('added', len(added))
+        MAN.count('changed', len(changed))
+        MAN.count('disappeared', len(disappeared))
+
+    df = merge_scraped_data(df, scraped)
+    save_latest_data(df)
+
+    if not incremental:
+        export_properties(clean_properties(df))
     else:
-        print("WARNING, ", df2.shape[0], "ARE TOO MANY DUPLICATE ASSESSMENT NUMBERS!!")
-    
-else:
-    print("# of unique assessment numbers: ", df2.shape[0], "[OK]")    
-# Inspect ARV range
-mxarv = df2["arv"].max()
-minarv = df2["arv"].min()
-if minarv < 0:
-    print("NEGARIVE ARVs, please inspect data")
-if mxarv > 10000000:
-    print("ARVs too large, please inspect data")
-else:
-    print("Min ARV:", minarv, "and", "Max ARV", mxarv,  "[OK]")
-
-# 5. Simplify Parishes
-df2 = LT.simplify_parishes(df2)
-# Remove any assessment number duplicates left (keep the last one)
-df = df2[~df2.assessment_number.duplicated(keep='last')]
-
-# 6. Create a column with the property name.
-df["property_name"] = df.apply(LAV.create_property_name, axis=1)
-
-# Select columns of interest    
-df_for_export = df[["assessment_number","arv","tax_code","property_type", "address", "grid", "parish", "building_name", "property_name"]]
-# make sure assessment numbers stay as 9 digit strings
-df_for_export.loc[:, 'assessment_number'] = df_for_export['assessment_number'].astype(str)
-# save to CSV
-print(f"{len(df_for_export)} properties exported to CSV")
-df_for_export.to_csv("./data/kw-properties.csv", index=False)
+        update_properties(df, added, changed)
 
 
+if __name__ == "__main__":
+    with MAN.recording('landvaluation', inputs=[last_scraped_file(), LATEST_LV_DATA_FILE],
+                       outputs=[PROPERTIES_FILE, LAV.HISTORIC_ARVS_FILE]):
+        main(incremental="--incremental" in sys.argv)
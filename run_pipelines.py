@@ -0,0 +1,136 @@
+"""Runs the data import pipelines, skipping the stages whose inputs did not change"""
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import process_landvaluation as LV
+import process_LTRO as LTRO
+import process_propertyskipper as PS
+import process_skipperstats as SS
+import utils.downloadutils as DL
+import utils.landvalutils as LAV
+import utils.LTROutils as LT
+from utils.pipeline import Stage, Pipeline
+
+# run with `python run_pipelines.py` to run all the pipelines,
+# `python run_pipelines.py ltro skipperstats` to only run some of them
+# and `--force` to run all their stages even if nothing changed
+#
+# landvaluation runs first, then ltro and propertyskipper
+# at the same time (in separate processes), then skipperstats
+#
+# a change in the code of a stage (its module or the modules of
+# this repository it imports) runs the stage again, see utils/pipeline.py
+
+
+def landvaluation_pipeline():
+    return Pipeline('landvaluation', [
+        Stage('scraped', LV.load_scraped_data, files=[LV.SCRAPED_FILES]),
+        Stage('historic_arvs', LAV.update_historic_arvs, inputs=['scraped'],
+              outputs=[LAV.HISTORIC_ARVS_FILE]),
+        Stage('latest', LV.load_latest_data, files=[LV.LATEST_LV_DATA_FILE]),
+        Stage('merge', LV.merge_scraped_data, inputs=['latest', 'scraped']),
+        # the next run compares the scrape against the merged data
+        Stage('save_latest', LV.save_latest_data, inputs=['merge'],
+              outputs=[LV.LATEST_LV_DATA_FILE]),
+        Stage('clean', LV.clean_properties, inputs=['merge'],
+              files=['./data/property_type_dict.csv']),
+        Stage('export', LV.export_properties, inputs=['clean'],
+              outputs=[LV.PROPERTIES_FILE]),
+    ])
+
+
+def ltro_pipeline():
+    return Pipeline('ltro', [
+        Stage('sales', LTRO.load_ltro_sales, files=LTRO.LTRO_FILES,
+              outputs=[LT.CLEANED_SALES_FILE, LT.LTRO_SOURCES_FILE]),
+        Stage('properties', LTRO.load_properties, files=[LTRO.PROPERTIES_FILE]),
+        Stage('norwood', LTRO.load_norwood, files=[LTRO.NORWOOD_FILE]),
+        Stage('clean', LTRO.clean_sales, inputs=['sales']),
+        Stage('dedup', LTRO.dedup_sales, inputs=['clean']),
+        Stage('enrich', LTRO.enrich_sales, inputs=['dedup', 'properties', 'norwood']),
+        Stage('export', LTRO.export_sales, inputs=['enrich'],
+              outputs=[LTRO.SALES_FILE]),
+    ])
+
+
+def propertyskipper_pipeline():
+    return Pipeline('propertyskipper', [
+        # the feed is downloaded once a day, its content is the input of the next stages
+        Stage('download', DL.download_skipper_properties, always_run=True,
+              files=lambda: [DL.todays_skipper_xml()]),
+        Stage('feed', PS.load_skipper_properties, inputs=['download']),
+        Stage('properties', PS.load_properties, files=[PS.PROPERTIES_FILE]),
+        Stage('clean', PS.clean_skipper_properties, inputs=['feed', 'properties']),
+        Stage('export', PS.export_skipper_properties, inputs=['clean'],
+              outputs=[PS.SKIPPER_PROPERTIES_FILE, PS.LISTINGS_FILE]),
+    ])
+
+
+def skipperstats_pipeline():
+    return Pipeline('skipperstats', [
+        Stage('download', DL.download_transactions, always_run=True,
+              files=lambda: [DL.last_transactions_file()]),
+        Stage('transactions', SS.load_transactions, inputs=['download']),
+        Stage('clean', SS.clean_transactions, inputs=['transactions']),
+        Stage('sales', SS.load_sales, files=[SS.SALES_FILE]),
+        Stage('properties', SS.load_properties, files=[SS.PROPERTIES_FILE]),
+        Stage('dedup', SS.dedup_with_ltro, inputs=['clean', 'sales', 'properties']),
+        Stage('export', SS.export_skipperstats_sales, inputs=['dedup'],
+              outputs=[SS.SKIPPER_STATS_SALES_FILE]),
+    ])
+
+
+PIPELINES = {
+    'landvaluation': landvaluation_pipeline,
+    'ltro': ltro_pipeline,
+    'propertyskipper': propertyskipper_pipeline,
+    'skipperstats': skipperstats_pipeline,
+}
+
+# the pipelines of each step run at the same time,
+# the steps run one after the other:
+# kw-properties.csv is used by all the others, kw-sales.csv by skipperstats
+STEPS = [
+    ['landvaluation'],
+    ['ltro', 'propertyskipper'],
+    ['skipperstats'],
+]
+
+
+def run_pipeline(name, force=False):
+    """
+    :return: wall time of the pipeline in seconds
+    """
+    start = time.perf_counter()
+    PIPELINES[name]().run(force=force)
+    return time.perf_counter() - start
+
+
+def main(names=None, force=False):
+    start = time.perf_counter()
+    wall_times = {}
+    for step in STEPS:
+        step = [name for name in step if not names or name in names]
+        if len(step) == 1:
+            wall_times[step[0]] = run_pipeline(step[0], force)
+        elif len(step) > 1:
+            with ProcessPoolExecutor(max_workers=len(step)) as executor:
+                futures = {name: executor.submit(run_pipeline, name, force) for name in step}
+                for name, future in futures.items():
+                    # a failed pipeline stops the next steps (they need its output)
+                    wall_times[name] = future.result()
+
+    print("\n >> PIPELINES DONE << \n")
+    for name, wall_time in wall_times.items():
+        print("{:<16} {:>8.1f}s".format(name, wall_time))
+    print("{:<16} {:>8.1f}s".format("total", time.perf_counter() - start))
+    return wall_times
+
+
+if __name__ == "__main__":
+    names = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    unknown = set(names) - set(PIPELINES)
+    if unknown:
+        sys.exit("Unknown pipelines: {} (choose from {})".format(", ".join(sorted(unknown)), ", ".join(PIPELINES)))
+    main(names, force="--force" in sys.argv)
@@ -0,0 +1,135 @@
+"""Runs http_scraping against recorded pages of landvaluation.bm
+
+A local server (http.server) answers with fixtures/search_form.html to the GET
+and with fixtures/parish_postback.html to the postback of each parish, after
+checking the postback has the fields of the form. The parishes are fetched with
+http_scraping.get_parish_data and parsed with scraping_methods.process_landval_data
+in a temporary directory, and their Historic ARVs with utils.landvalutils.parse_historic_arvs:
+`python check_http_scraping.py` (from the scraping directory)
+"""
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import http_scraping
+import scraping_methods
+
+SCRAPING_DIR = os.path.dirname(os.path.abspath(__file__))
+# utils is in the parent directory
+sys.path.append(os.path.dirname(SCRAPING_DIR))
+import utils.landvalutils as LAV  # noqa: E402
+
+FIXTURES_DIR = os.path.join(SCRAPING_DIR, "fixtures")
+SEARCH_FORM_FILE = os.path.join(FIXTURES_DIR, "search_form.html")
+PARISH_POSTBACK_FILE = os.path.join(FIXTURES_DIR, "parish_postback.html")
+# what the recorded pages contain
+PARISHES = ["City of Hamilton", "Devonshire", "St. George's"]
+PROPERTIES_PER_PARISH = 3
+FIRST_PROPERTY = {'assessment_number': '010001011', 'arv': '$45,600', 'tax_code': 'R',
+                  'property_type': 'HOUSE', 'address': '12 Cedar Avenue', 'grid': '15'}
+# (effective date, ARV) of the Historic ARVs of the first property
+FIRST_HISTORIC_ARVS = [('2020-01-01', 42000), ('2015-01-01', 39600)]
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    # the fields every postback must send (read from the search form)
+    required_fields = ['__VIEWSTATE', '__EVENTVALIDATION',
+                       'ctl00$ContentPlaceHolder1$ddlParish', 'ctl00$ContentPlaceHolder1$btnSearch']
+    # parish values posted, to check each parish was fetched once
+    posted = []
+
+    def send_page(self, page_file):
+        with open(page_file, "rb") as f:
+            page = f.read()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(page)))
+        self.end_headers()
+        self.wfile.write(page)
+
+    def do_GET(self):
+        self.send_page(SEARCH_FORM_FILE)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        data = parse_qs(self.rfile.read(length).decode("utf-8"), keep_blank_values=True)
+        missing = [field for field in self.required_fields if not data.get(field, [''])[0]]
+        if missing:
+            self.send_error(400, "missing fields: {}".format(missing))
+            return
+        self.posted.append(data['ctl00$ContentPlaceHolder1$ddlParish'][0])
+        self.send_page(PARISH_POSTBACK_FILE)
+
+    def log_message(self, format, *args):
+        # no log line for each request
+        pass
+
+
+def start_server():
+    """
+    :return: server answering with the fixtures on a free port (in a thread)
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    """
+    :return: list of problems found (empty if the scrape worked)
+    """
+    server = start_server()
+    url = "http://127.0.0.1:{}/".format(server.server_address[1])
+    problems = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        # process_landval_data writes the CSV file to the current directory
+        os.chdir(work_dir)
+        try:
+            tmp_dir = os.path.join(work_dir, "tmp_data")
+            saved = http_scraping.get_parish_data(url, tmp_dir, max_workers=2)
+            if sorted(saved) != sorted(PARISHES):
+                problems.append("parishes saved: {}".format(saved))
+            if sorted(FixtureHandler.posted) != ['1', '2', '3']:
+                problems.append("parishes posted: {}".format(FixtureHandler.posted))
+
+            result = scraping_methods.process_landval_data(tmp_dir, cleanup='never')
+            if result is None:
+                problems.append("process_landval_data did not find all the parishes")
+            else:
+                if len(result) != len(PARISHES) * PROPERTIES_PER_PARISH:
+                    problems.append("{} properties scraped".format(len(result)))
+                if list(result.parish.unique()) != PARISHES:
+                    problems.append("parishes scraped: {}".format(list(result.parish.unique())))
+                first = result.iloc[0]
+                for column, value in FIRST_PROPERTY.items():
+                    if first[column].strip() != value:
+                        problems.append("{} is {!r} instead of {!r}".format(column, first[column], value))
+                # every parish has the same recorded table, the first one is enough
+                historic = LAV.parse_historic_arvs(result[result.parish == PARISHES[0]])
+                first_historic = historic[historic.assessment_number == FIRST_PROPERTY['assessment_number']]
+                found = [(date.strftime('%Y-%m-%d'), arv)
+                         for date, arv in zip(first_historic.effective_date, first_historic.arv)]
+                if found != FIRST_HISTORIC_ARVS:
+                    problems.append("historic ARVs are {} instead of {}".format(found, FIRST_HISTORIC_ARVS))
+
+            # the scrape is completed, so running it again fetches every parish again
+            FixtureHandler.posted.clear()
+            http_scraping.get_parish_data(url, tmp_dir, max_workers=2)
+            if len(FixtureHandler.posted) != len(PARISHES):
+                problems.append("{} parishes fetched after a completed scrape".format(len(FixtureHandler.posted)))
+        finally:
+            os.chdir(cwd)
+            server.shutdown()
+    return problems
+
+
+if __name__ == "__main__":
+    problems = main()
+    print("http scraping of the fixtures: {}".format("[OK]" if not problems else "PROBLEMS FOUND"))
+    for problem in problems:
+        print("   - " + problem)
+    sys.exit(0 if not problems else 1)
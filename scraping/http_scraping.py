@@ -0,0 +1,127 @@
+# functions for landvaluation scraping without a browser
+#
+# landvaluation.bm is an ASP.NET WebForms page: selecting a parish and
+# clicking "Search" posts the form back (with its __VIEWSTATE etc.)
+# and the answer contains the table of properties of the parish.
+# Here the postback is replayed over plain HTTP, one request per parish.
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from lxml import etree, html
+
+from scraping_methods import TMP_DIR, start_scrape, save_manifest, is_fetched
+
+BASE_URL = "https://landvaluation.bm/"
+# ids of the elements of the search form (same as in scraping_methods.get_parish_data)
+PARISH_SELECT_ID = 'ContentPlaceHolder1_ddlParish'
+SEARCH_BUTTON_ID = 'ContentPlaceHolder1_btnSearch'
+RESULTS_TABLE_ID = 'ContentPlaceHolder1_gvAssessmentList'
+# parishes fetched at the same time
+MAX_WORKERS = 4
+TIMEOUT = 120  # seconds, the results of a parish can take a while
+
+
+def new_session(pool_size=MAX_WORKERS):
+    """
+    requests session with a connection pool large enough for
+    the concurrent requests, retrying failed requests a few times
+    """
+    session = requests.Session()
+    retries = Retry(total=3, backoff_factor=2, status_forcelist=[500, 502, 503, 504],
+                    allowed_methods=['GET', 'POST'])
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_search_form(session, url=BASE_URL):
+    """
+    Loads the search page and reads what is needed to post the form back.
+    :return: dict with
+        'fields': the hidden fields of the form (__VIEWSTATE, __EVENTVALIDATION, ...)
+        'parish_field': name of the parish dropdown
+        'button': (name, value) of the search button
+        'parishes': list of (value, parish name) from the dropdown options
+    """
+    response = session.get(url, timeout=TIMEOUT)
+    response.raise_for_status()
+    page = html.fromstring(response.content)
+
+    fields = {field.get('name'): field.get('value', '')
+              for field in page.xpath('//input[@type="hidden"][@name]')}
+    parish_select = page.get_element_by_id(PARISH_SELECT_ID)
+    button = page.get_element_by_id(SEARCH_BUTTON_ID)
+    parishes = [(option.get('value'), option.text_content().strip())
+                for option in parish_select.iter('option')
+                if option.get('value')]
+    return {'fields': fields,
+            'parish_field': parish_select.get('name'),
+            'button': (button.get('name'), button.get('value', '')),
+            'parishes': parishes}
+
+
+def fetch_parish(session, form, parish_value, url=BASE_URL):
+    """
+    Posts the search form for a parish and returns the HTML of the table of results
+    """
+    data = dict(form['fields'])
+    data[form['parish_field']] = parish_value
+    button_name, button_value = form['button']
+    data[button_name] = button_value
+
+    response = session.post(url, data=data, timeout=TIMEOUT)
+    response.raise_for_status()
+    page = html.fromstring(response.content)
+    tables = page.xpath('//*[@id="{}"]'.format(RESULTS_TABLE_ID))
+    if len(tables) == 0:
+        raise ValueError("No results table for parish {}".format(parish_value))
+    return etree.tostring(tables[0], encoding='unicode', method='html')
+
+
+def get_parish_data(url=BASE_URL, tmp_dir=TMP_DIR, max_workers=MAX_WORKERS):
+    """
+    Saves the table of properties of each parish in tmp_dir/<parish>.html
+    (like scraping_methods.get_parish_data, but without a browser)
+    so they can be processed with scraping_methods.process_landval_data.
+    The parishes already fetched by an interrupted scrape (see scraping_methods.start_scrape)
+    are skipped.
+    :param url: address of landvaluation.bm (or of a local copy of it)
+    :param tmp_dir: directory where the HTML tables are saved
+    :param max_workers: number of parishes fetched at the same time
+    """
+    manifest = start_scrape(tmp_dir)
+    session = new_session(max_workers)
+    form = get_search_form(session, url)
+    print([parish for _, parish in form['parishes']], len(form['parishes']))
+
+    manifest['parishes'] = [parish for _, parish in form['parishes']]
+    save_manifest(manifest, tmp_dir)
+    to_fetch = [(value, parish) for value, parish in form['parishes']
+                if not is_fetched(manifest, parish, tmp_dir)]
+    if len(to_fetch) < len(form['parishes']):
+        print('--> {} parishes already saved'.format(len(form['parishes']) - len(to_fetch)))
+    manifest_lock = threading.Lock()
+
+    def save_parish(parish_option):
+        value, parish = parish_option
+        table = fetch_parish(session, form, value, url)
+        parish_table_file = os.path.join(tmp_dir, "{}.html".format(parish))
+        with open(parish_table_file, "w", encoding="utf-8") as f:
+            print('--> saving ' + parish + '\n')
+            f.write(table)
+        with manifest_lock:
+            manifest['fetched'][parish] = datetime.now().isoformat(timespec='seconds')
+            save_manifest(manifest, tmp_dir)
+        return parish
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        saved = list(executor.map(save_parish, to_fetch))
+    session.close()
+    return saved
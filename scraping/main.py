@@ -1,14 +1,28 @@
-import scraping_methods
+import sys
 
+import scraping_methods
 
+# run with `python main.py --http` to scrape without a browser
+# and `--url http://localhost:8000/` to scrape a local copy of the site
+# An interrupted scrape resumes at the parishes not fetched yet (see tmp_data/manifest.json),
+# a scrape which was completed (or started more than 3 days ago) starts again from the first parish
+# the temp files are deleted once all parishes are in the CSV file, unless `--keep-tmp`
 url = "https://landvaluation.bm/"
-browser = scraping_methods.init_browser(url)
+if "--url" in sys.argv:
+    url = sys.argv[sys.argv.index("--url") + 1]
 
-# download HTML files for each parish
-scraping_methods.get_parish_data(browser)
+if "--http" in sys.argv:
+    import http_scraping
+    # download HTML files for each parish (several at the same time)
+    http_scraping.get_parish_data(url)
+else:
+    browser = scraping_methods.init_browser(url)
+
+    # download HTML files for each parish
+    scraping_methods.get_parish_data(browser)
 
 # open HTML files locally, exctract data
 # and save to csv file
 # delete tmp HTML files
-scraping_methods.process_landval_data()
-
+cleanup = 'never' if "--keep-tmp" in sys.argv else 'on_success'
+scraping_methods.process_landval_data(cleanup=cleanup)
@@ -1,16 +1,101 @@
 # functions for landvaluation scraping
 
 import os
+import csv
+import json
 import time
 import glob
-from datetime import datetime
+from datetime import date, datetime
 
-from splinter import Browser
-from bs4 import BeautifulSoup
 import pandas as pd
 
 
+TMP_DIR = "./tmp_data/"
+# record of the parishes fetched and parsed so far (in TMP_DIR)
+# so an interrupted scrape resumes where it stopped
+MANIFEST_FILE = "manifest.json"
+# an interrupted scrape is resumed during this many days,
+# after that the next scrape starts again from the first parish
+RESUME_DAYS = 3
+
+
+def new_manifest():
+    return {'scrape_date': date.today().isoformat(), 'completed': None,
+            'parishes': [], 'fetched': {}, 'parsed': {}}
+
+
+def load_manifest(tmp_dir=TMP_DIR):
+    """
+    :return: the manifest of the current scrape:
+        'scrape_date': day the scrape started (the date of the CSV file)
+        'completed': time all the parishes were saved to the CSV file (None until then)
+        'parishes': all the parishes to fetch (empty if not known yet)
+        'fetched': {parish: time} of the parishes saved to <parish>.html
+        'parsed': {parish: time} of the parishes parsed to <parish>.csv
+    """
+    manifest_file = os.path.join(tmp_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_file):
+        return new_manifest()
+    with open(manifest_file) as f:
+        manifest = json.load(f)
+    # manifests written before the scrape date was recorded
+    manifest.setdefault('scrape_date', None)
+    manifest.setdefault('completed', None)
+    return manifest
+
+
+def can_resume(manifest):
+    """
+    True if the scrape of the manifest was interrupted recently
+    (not if it was completed, or started more than RESUME_DAYS ago)
+    """
+    if manifest['completed'] is not None or manifest['scrape_date'] is None:
+        return False
+    started = date.fromisoformat(manifest['scrape_date'])
+    return (date.today() - started).days <= RESUME_DAYS
+
+
+def start_scrape(tmp_dir=TMP_DIR):
+    """
+    Manifest of the scrape to run: the interrupted scrape in tmp_dir
+    if it can be resumed, otherwise a new one (the files left in
+    tmp_dir by an older scrape are deleted, so they are not used again)
+    :return: manifest
+    """
+    os.makedirs(tmp_dir, exist_ok=True)
+    manifest = load_manifest(tmp_dir)
+    if os.path.exists(os.path.join(tmp_dir, MANIFEST_FILE)) and can_resume(manifest):
+        print("resuming the scrape started on {}".format(manifest['scrape_date']))
+        return manifest
+    old_files = glob.glob(os.path.join(tmp_dir, "*"))
+    if len(old_files) > 0:
+        print("Deleting {} temp files of the previous scrape".format(len(old_files)))
+        for f in old_files:
+            os.remove(f)
+    manifest = new_manifest()
+    save_manifest(manifest, tmp_dir)
+    return manifest
+
+
+def save_manifest(manifest, tmp_dir=TMP_DIR):
+    # write to another file first, so an interruption
+    # never leaves a half written manifest
+    manifest_file = os.path.join(tmp_dir, MANIFEST_FILE)
+    with open(manifest_file + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_file + ".tmp", manifest_file)
+
+
+def is_fetched(manifest, parish, tmp_dir=TMP_DIR):
+    return (parish in manifest['fetched']
+            and os.path.exists(os.path.join(tmp_dir, "{}.html".format(parish))))
+
+
 def init_browser(url):
+    # splinter is only needed when scraping with a browser
+    # (see http_scraping.py to scrape without one)
+    from splinter import Browser
+
     mycwd = os.getcwd()
     # executable_path = {'executable_path' : mycwd + '/chrome-linux64/chrome'} # chromedriver_110'}
     executable_path = {'executable_path' : mycwd + '/msedgedriver'}
@@ -26,12 +111,18 @@ def init_browser(url):
     browser.driver.maximize_window()  # full screen to view all menus
     return browser
 
-def get_parish_data(browser):
+def get_parish_data(browser, tmp_dir=TMP_DIR):
+    manifest = start_scrape(tmp_dir)
     parish_list = browser.find_by_id('ContentPlaceHolder1_ddlParish').text.split('\n')
     print(parish_list, len(parish_list))
+    manifest['parishes'] = [parish.strip() for parish in parish_list[:11]]
+    save_manifest(manifest, tmp_dir)
     # value from 1: "City of Hamilton" to 11: "Warwick"
     for i in range(1, 12):
         parish = parish_list[i-1].strip()
+        if is_fetched(manifest, parish, tmp_dir):
+            print('--> ' + parish + ' already saved')
+            continue
         # for each number
         browser.find_by_id('ContentPlaceHolder1_ddlParish').select(str(i))
         time.sleep(0.5)
@@ -45,58 +136,144 @@ def get_parish_data(browser):
     
         html = browser.find_by_id('ContentPlaceHolder1_gvAssessmentList')[0].html
 
-        parish_table_file ="./tmp_data/{}.html".format(parish)
+        parish_table_file = os.path.join(tmp_dir, "{}.html".format(parish))
         with open(parish_table_file, "w") as f:
             print('--> saving ' + parish + '\n')
             f.write(html)
+        manifest['fetched'][parish] = datetime.now().isoformat(timespec='seconds')
+        save_manifest(manifest, tmp_dir)
 
     browser.quit()
 
 
-def process_landval_data():
-    # The dataframe where we will save all the data
-    result = pd.DataFrame(columns=['assessment_number', 'arv', 'tax_code', 'property_type', 'address', 'grid', 'parish', 'building_name'])
-
-    # what is the position of each piece of information
-    # on the table with the results?
-    landval_info_position = {0: 'assessment_number', 1:'arv', 2: 'Historic_ARVs', 3: 'tax_code', 4: 'property_type', 5: 'building_name', 6: 'address', 7: 'grid'}
-
-    tmp_dir = "./tmp_data/"
-    directory_list = os.listdir(tmp_dir)
-
-    today = datetime.today()
-    outfile = '{}-{:02d}-{:02d}_landvaluation_data.csv'.format(today.year, today.month, today.day)
-
-    nr_processed_so_far = 0
-    for parish_table in directory_list:
-        soup = BeautifulSoup(open(tmp_dir + parish_table,
-                                  encoding="utf8"),
-                             features="html.parser")
-        extracted = soup.find_all("tr", attrs={'style': 'background-color:White;'})
-        which_parish = parish_table.split(".html")[0]
-        
-        print("processing {} {} properties. - {} done. ".format(len(extracted), which_parish, nr_processed_so_far))
-        for k, row in enumerate(extracted):
-            rowvals = row.find_all('td')
-            landval_dict = {}
-            landval_dict['parish'] = which_parish
-            # note this assumes files name as: Parish.html when scraping
-        
-            for j, rowval in enumerate(rowvals[1:]):
-                landval_dict[landval_info_position[j]] = rowval.text
-                # add a new row after the last line
-            result.loc[len(result)] = landval_dict
-            # append results to CSV
-        result.to_csv(outfile, index=False, encoding="utf-8-sig")
-        nr_processed_so_far += len(extracted)
-
-    # delete temp html files
-    # ask for confirmation before deleting
-    delete = input('Ready to delete files? Y/N')
-    if delete == 'Y':
+# columns of the CSV file with the scraped data
+LANDVAL_COLUMNS = ['assessment_number', 'arv', 'tax_code', 'property_type', 'address',
+                   'grid', 'parish', 'building_name', 'Historic_ARVs']
+
+# what is the position of each piece of information
+# on the table with the results?
+LANDVAL_INFO_POSITION = {0: 'assessment_number', 1:'arv', 2: 'Historic_ARVs', 3: 'tax_code', 4: 'property_type', 5: 'building_name', 6: 'address', 7: 'grid'}
+
+
+def cell_text(cell):
+    """
+    Text of a cell of the table, the lines separated by <br> are
+    joined with a space (the Historic ARVs are one per line)
+    """
+    for line_break in cell.iter('br'):
+        line_break.tail = ' ' + (line_break.tail or '')
+    return ''.join(cell.itertext())
+
+
+def parse_parish_table(parish_table_file):
+    """
+    Streams the properties of the HTML table saved for a parish.
+    The rows are read one at a time with lxml (and freed once read),
+    so the whole HTML tree is never built.
+    :param parish_table_file: HTML file saved by get_parish_data
+    :return: generator of dicts with the values of each property
+    """
+    from lxml import etree
+
+    for _, row in etree.iterparse(parish_table_file, events=('end',), tag='tr',
+                                  html=True, encoding='utf-8'):
+        if row.get('style') != 'background-color:White;':
+            continue
+        landval_dict = {}
+        # the first cell is not used
+        for j, rowval in enumerate(list(row.iter('td'))[1:]):
+            landval_dict[LANDVAL_INFO_POSITION[j]] = cell_text(rowval)
+        yield landval_dict
+
+        # free the rows already processed
+        row.clear()
+        while row.getprevious() is not None:
+            del row.getparent()[0]
+
+
+def parse_parish(parish, tmp_dir=TMP_DIR):
+    """
+    Parses <parish>.html to <parish>.csv (the checkpoint of the parish)
+    :return: list of dicts with the values of each property
+    """
+    rows = []
+    with open(os.path.join(tmp_dir, "{}.csv".format(parish)), 'w', newline='', encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=LANDVAL_COLUMNS, lineterminator='\n')
+        writer.writeheader()
+        for landval_dict in parse_parish_table(os.path.join(tmp_dir, "{}.html".format(parish))):
+            landval_dict['parish'] = parish
+            writer.writerow(landval_dict)
+            rows.append(landval_dict)
+    return rows
+
+
+def read_parsed_parish(parish, tmp_dir=TMP_DIR):
+    """
+    Reads the properties of a parish already parsed by parse_parish
+    """
+    with open(os.path.join(tmp_dir, "{}.csv".format(parish)), newline='', encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def process_landval_data(tmp_dir=TMP_DIR, cleanup='on_success'):
+    """
+    Extracts the properties of the parish tables saved in tmp_dir
+    to <date>_landvaluation_data.csv (the date the scrape started).
+    Only the parishes which were not parsed yet (see the manifest) are parsed.
+    :param tmp_dir: directory with the HTML tables of the parishes
+    :param cleanup: 'on_success' deletes the files in tmp_dir once all
+        the parishes are in the CSV file, 'never' keeps them
+    :return: dataframe with the scraped data,
+        None if some parishes have not been fetched yet
+    """
+    manifest = load_manifest(tmp_dir)
+    if len(manifest['fetched']) == 0:
+        # the HTML files were not saved by get_parish_data (or the manifest is gone)
+        # use all the files in the directory
+        # note this assumes files name as: Parish.html when scraping
+        manifest['fetched'] = {parish_table.split(".html")[0]: None
+                               for parish_table in sorted(os.listdir(tmp_dir))
+                               if parish_table.endswith(".html")}
+
+    missing = [parish for parish in manifest['parishes'] if parish not in manifest['fetched']]
+    if len(missing) > 0:
+        print("WARNING, these parishes have not been fetched yet:", missing)
+        print("Run the scraper again to fetch them, the parishes already fetched are kept")
+        return None
+
+    # the date of the scrape, not of today (the scrape may have been resumed)
+    outfile = '{}_landvaluation_data.csv'.format(manifest['scrape_date'] or date.today().isoformat())
+
+    # rows are written to the CSV as they are parsed
+    # and the dataframe is built once all parishes are done
+    rows = []
+    with open(outfile, 'w', newline='', encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=LANDVAL_COLUMNS, lineterminator='\n')
+        writer.writeheader()
+        # in the order of the dropdown when known
+        for which_parish in (manifest['parishes'] or list(manifest['fetched'])):
+            if which_parish in manifest['parsed'] and os.path.exists(os.path.join(tmp_dir, "{}.csv".format(which_parish))):
+                parish_rows = read_parsed_parish(which_parish, tmp_dir)
+                print("{} {} properties already parsed".format(len(parish_rows), which_parish))
+            else:
+                parish_rows = parse_parish(which_parish, tmp_dir)
+                manifest['parsed'][which_parish] = datetime.now().isoformat(timespec='seconds')
+                save_manifest(manifest, tmp_dir)
+                print("processed {} {} properties. - {} done. ".format(len(parish_rows), which_parish,
+                                                                       len(rows) + len(parish_rows)))
+            writer.writerows(parish_rows)
+            rows.extend(parish_rows)
+    result = pd.DataFrame(rows, columns=LANDVAL_COLUMNS)
+    # the next scrape starts a new manifest
+    manifest['completed'] = datetime.now().isoformat(timespec='seconds')
+    save_manifest(manifest, tmp_dir)
+
+    # delete temp html files (and the parsed parishes)
+    # once they are all in the CSV file
+    if cleanup == 'on_success':
         print("\nDeleting temp files")
-        files = glob.glob(tmp_dir + "*")
+        files = glob.glob(os.path.join(tmp_dir, "*"))
         for f in files:
             os.remove(f)
 
-
+    return result
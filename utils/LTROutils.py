@@ -1,17 +1,127 @@
 # functions for cleaning up LTRO data
+import bisect
 import decimal
+import hashlib
+import json
+import os
 import re
+from collections import defaultdict
 from operator import itemgetter
 
 import pandas as pd
 import numpy as np
-from thefuzz import fuzz
 
+import utils.manifestutils as MAN
+import utils.schemautils as SCH
 import utils.skipperutils as skipu
+from utils.profileutils import instrument
 
 DATA_PATH = "./data/"
 NORWOOD_DATA_PATH = "./data/LTRO/Norwood/"
+# cleaned LTRO sales (before deduplication) kept for incremental runs
+CLEANED_SALES_FILE = "./data/LTRO/ltro_cleaned_sales.pkl"
+# hashes of the LTRO files already included in CLEANED_SALES_FILE
+LTRO_SOURCES_FILE = "./data/LTRO/ltro_sources.json"
+# surface units of the LTRO parcel areas, in hectares
+AREA_UNITS_IN_HA = {'ha': 1, 'ac': 0.404686, 'sq m': 0.0001, 'sq ft': 9.2903/1000000}
+# a number followed by one of the units above
+AREA_PATTERN = re.compile(r'(?P<value>\d[\d,]*(?:\.\d+)?|\.\d+)\s*'
+                          r'(?:(?P<ha>hectares?|ha)|(?P<ac>acres?|ac)'
+                          r'|(?P<sq_m>sq\.?\s*m(?:eters?|etres?)?|square\s+met(?:er|re)s?)'
+                          r'|(?P<sq_ft>sq\.?\s*f(?:ee)?t|square\s+f(?:ee|oo)t))\b',
+                          flags=re.IGNORECASE)
+# fields which identify a sale in the cleaned LTRO data
+SALE_KEY_FIELDS = ['application_number', 'registration_date', 'acquisition_date',
+                   'assessment_number', 'address', 'price']
+
+# rows above the headers of an LTRO sheet (title, report dates, etc.)
+LTRO_PREAMBLE_ROWS = 9
+# the headers are split over two rows
+LTRO_HEADER_ROWS = 2
+# hack for 2022 as the sheet has yet again different headers
+# these are the non-empty columns of the sheet, left to right.
+# columns marked with the "kill" keyword are not kept
+LTRO_HEADER = ['application_number', 'kill', 'sale_type',
+               'kill', 'registration_date',
+               'kill', 'kill', 'parish', 'kill', 'parcel_area', 'kill',
+               'assessment_number', 'address', 'kill',
+               'Mode of\nAcquisition', 'acquisition_date',
+               'Nature of\nInterest', 'price']
+
+@instrument
+def read_ltro_xlsx(xlsx_file):
+    """
+    Streams the first sheet of an LTRO XLSX export
+    with openpyxl in read-only mode, instead of loading the
+    whole sheet with pd.read_excel:
+
+    - the preamble rows are skipped
+    - the two (split) header rows tell us which columns are in use,
+      these are mapped to LTRO_HEADER
+    - only the values of the columns we keep (not "kill") are read
+    - empty rows are skipped as they are read
+
+    :param xlsx_file: path to the LTRO XLSX file
+    :return: dataframe with the columns of LTRO_HEADER which are kept
+    """
+    import openpyxl
+
+    wb = openpyxl.load_workbook(xlsx_file, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        rows = ws.iter_rows(min_row=LTRO_PREAMBLE_ROWS + 1, values_only=True)
+
+        # find the header rows (skip any empty rows before them)
+        header_rows = []
+        for row in rows:
+            if any(value is not None for value in row):
+                header_rows.append(row)
+            if len(header_rows) == LTRO_HEADER_ROWS:
+                break
+
+        # a column is in use if either of the header rows has a value
+        n_columns = max([len(row) for row in header_rows], default=0)
+        used_columns = [i for i in range(n_columns)
+                        if any(i < len(row) and row[i] is not None for row in header_rows)]
+        if len(used_columns) != len(LTRO_HEADER):
+            raise ValueError(f"{xlsx_file}: expected {len(LTRO_HEADER)} columns "
+                             f"in the LTRO headers but found {len(used_columns)}")
+
+        kept = [(i, name) for i, name in zip(used_columns, LTRO_HEADER) if name != 'kill']
+        kept_positions = [i for i, _ in kept]
+        get_kept = itemgetter(*kept_positions)
+        width = max(kept_positions) + 1
+
+        records = []
+        for row in rows:
+            if len(row) < width:
+                # read-only mode truncates rows after the last cell
+                row = row + (None,) * (width - len(row))
+            values = get_kept(row)
+            if all(value is None for value in values):
+                # empty row
+                continue
+            # like pd.read_excel, store whole numbers as integers
+            records.append(tuple(int(v) if isinstance(v, float) and v.is_integer() else v
+                                 for v in values))
+    finally:
+        # read-only workbooks keep the file open until closed
+        wb.close()
+
+    return pd.DataFrame.from_records(records, columns=[name for _, name in kept])
+
+@instrument
+def load_ltro_data(xlsx_file):
+    """
+    Streams an LTRO XLSX file (see read_ltro_xlsx)
+    and applies the same filtering as clean_ltro_data()
+    :param xlsx_file: path to the LTRO XLSX file
+    :return: dataframe
+    """
+    df = read_ltro_xlsx(xlsx_file)
+    return _filter_ltro_sales(df)
 
+@instrument
 def clean_ltro_data(df):
     """
     takes a dataframe which has just been imported
@@ -23,35 +133,37 @@ def clean_ltro_data(df):
     - drop empty prices or prices below $1000
     - drop unidentifiable properties
     - remove time from timestamp (keep only date)
+
+    For large files prefer load_ltro_data() which streams the XLSX file.
     """
 
     # delete all empty columns & rows
     df = df.dropna(axis=1, how='all')
     df = df.dropna(axis=0, how='all')
-        
-    # hack for 2022 as the sheet has yet again different headers
-    new_header_list = ['application_number', 'kill', 'sale_type',
-                       'kill', 'registration_date', 
-                       'kill', 'kill', 'parish', 'kill', 'parcel_area', 'kill',
-                       'assessment_number', 'address', 'kill',
-                       'Mode of\nAcquisition', 'acquisition_date',
-                       'Nature of\nInterest', 'price']
-    
-    
-    
-    # load that list as the new headers for the dataframe
+
+    # load LTRO_HEADER as the new headers for the dataframe
     # mark for removal with "kill" keyword
     # remove the top 2 rows with the old headers
-    df.columns = new_header_list
+    df.columns = LTRO_HEADER
     df.drop("kill", axis=1, inplace=True) # remove empty columns
-    df.drop(df.index[:2], inplace=True) # remove old headers
-    
+    df.drop(df.index[:LTRO_HEADER_ROWS], inplace=True) # remove old headers
+
+    return _filter_ltro_sales(df)
+
+def _filter_ltro_sales(df):
+    """
+    filtering of LTRO sales once the headers have been renamed:
+
+    - drop empty prices or prices below $1000
+    - drop unidentifiable properties
+    - remove time from timestamp (keep only date)
+    """
     # Identify the ones with price of ZERO
     # or with empty or string where the price should be
     # coerce will convert the string to NaN
     df ['price'] = pd.to_numeric(df['price'], errors='coerce')
     # if there were any NaN convert them to zero
-    df = df.replace(np.nan, 0, regex=True)
+    df = SCH.fill_missing(df, SCH.LTRO_SALES)
     
     # Remove sales for less $1000
     # as these are not real sales
@@ -80,6 +192,128 @@ def clean_ltro_data(df):
 
     return df
 
+@instrument
+def add_sale_key(df):
+    """
+    Adds a column "sale_key" with a stable identifier for each
+    cleaned LTRO sale: a hash of the SALE_KEY_FIELDS.
+    The same sale found in two LTRO releases gets the same key.
+    """
+    joined = df[SALE_KEY_FIELDS].astype(str).agg('|'.join, axis=1)
+    df['sale_key'] = joined.map(lambda x: hashlib.md5(x.encode('utf-8')).hexdigest()[:16])
+    return df
+
+@instrument
+def load_cleaned_sales():
+    """
+    Returns the cleaned LTRO sales saved by the last run and the
+    hashes of the LTRO files they came from.
+    (None, {}) if there is nothing saved yet.
+    """
+    if not (os.path.exists(CLEANED_SALES_FILE) and os.path.exists(LTRO_SOURCES_FILE)):
+        return None, {}
+    with open(LTRO_SOURCES_FILE) as f:
+        sources = json.load(f)
+    return pd.read_pickle(CLEANED_SALES_FILE), sources
+
+@instrument
+def save_cleaned_sales(df, sources):
+    """
+    Saves the cleaned LTRO sales (with their sale_key)
+    and the hashes of the LTRO files they came from.
+    The pickle keeps the types of the cleaned data
+    (dates, integers, strings) exactly as they were.
+    """
+    df.to_pickle(CLEANED_SALES_FILE)
+    with open(LTRO_SOURCES_FILE, 'w') as f:
+        json.dump(sources, f, indent=2)
+
+def _has_assessment_number(assessment_numbers):
+    """
+    True for the sales with a real assessment number
+    (not empty, 0, 'N/A', 'Dock'... see skipu.clean_assn_nr)
+    """
+    has_number = {an: skipu.clean_assn_nr(an) != 0 for an in pd.unique(assessment_numbers)}
+    return assessment_numbers.map(has_number).fillna(False).astype(bool).to_numpy()
+
+
+def _same_sale_keys(sales, has_number, others, others_have_number):
+    """
+    True for the rows of `sales` with the same application number as
+    a row of `others`, or the same keys of a duplicate (see find_duplicate_candidates)
+    """
+    same_application = sales.application_number.isin(others.application_number).to_numpy()
+    sale_keys = pd.MultiIndex.from_arrays([sales.assessment_number, sales.price])
+    other_keys = pd.MultiIndex.from_arrays([others.assessment_number, others.price])
+    same_assessment_and_price = sale_keys.isin(other_keys[others_have_number]) & has_number
+    address_keys = pd.MultiIndex.from_arrays([sales.address, sales.price])
+    other_address_keys = pd.MultiIndex.from_arrays([others.address, others.price])
+    same_address_and_price = address_keys.isin(other_address_keys[~others_have_number]) & ~has_number
+    return same_application | same_assessment_and_price | same_address_and_price
+
+
+@instrument
+def find_duplicate_candidates(sales, new_sales):
+    """
+    Finds the rows of `sales` (cleaned LTRO sales already processed)
+    which could be duplicates of `new_sales`, so that an incremental
+    run only needs to process new_sales and those rows.
+
+    A sale already processed is a candidate when it has
+    - the same application number as a new sale, or
+    - the same assessment number and price as a new sale
+      (only for real assessment numbers: many unrelated sales have
+      a placeholder like 0 and a round price), or
+    - without a real assessment number, the same address and price as a
+      new sale without one (the duplicates removed by dedup_sales).
+    The sales with the same keys as a candidate are candidates too (until
+    no more are found), so whole applications are processed together, and
+    a candidate is processed with the sales it could be a duplicate of.
+    :param sales: dataframe of cleaned sales already processed
+    :param new_sales: dataframe of cleaned sales not processed yet
+    :return: the rows of sales which could be duplicates of new_sales
+    """
+    has_number = _has_assessment_number(sales.assessment_number)
+    candidates = _same_sale_keys(sales, has_number, new_sales,
+                                 _has_assessment_number(new_sales.assessment_number))
+    while True:
+        found = _same_sale_keys(sales, has_number, sales[candidates], has_number[candidates])
+        if not (found & ~candidates).any():
+            break
+        candidates = candidates | found
+    return sales[candidates]
+
+
+def complete_applications(sales, processed):
+    """
+    Application numbers of which all the sales are in `processed`
+    (only those can replace the output of a previous run)
+    :param sales: dataframe of all the cleaned sales
+    :param processed: dataframe of the cleaned sales processed
+    :return: set of application numbers (as strings)
+    """
+    is_processed = sales.sale_key.isin(processed.sale_key)
+    applications = sales.application_number.astype(str)
+    incomplete = set(applications[~is_processed])
+    return set(processed.application_number.astype(str)) - incomplete
+
+
+def in_full_run_order(df, ordered_sales):
+    """
+    Sorts cleaned sales in the order of `ordered_sales` (the order of a full
+    run: the LTRO files in order, and the sales of each file in order), as the
+    deduplication keeps the first or the last of the duplicates.
+    The sales not in ordered_sales go last.
+    :param df: dataframe of cleaned sales (with their sale_key)
+    :param ordered_sales: dataframe of cleaned sales in the order of a full run
+    :return: df sorted
+    """
+    position = pd.Series(range(len(ordered_sales)), index=ordered_sales.sale_key.values)
+    position = position[~position.index.duplicated()]
+    order = df.sale_key.map(position).fillna(len(ordered_sales))
+    return df.iloc[order.argsort(kind='stable')]
+
+
 def _in_keywords(x, keywords):
     '''
     Check if any of the keywords are in string x
@@ -94,6 +328,7 @@ def _in_keywords(x, keywords):
     else:
         return any([keyword in x for keyword in keywords])
             
+@instrument
 def identify_fractionals(df):
     '''
     identify which rows correspond to sales of fractional properties.
@@ -129,6 +364,7 @@ def identify_fractionals(df):
 
     return df
 
+@instrument
 def identify_lands(df, skipper_dataframe=False):
     '''
     Identify which rows correspond to sales of lands
@@ -170,6 +406,7 @@ def identify_lands(df, skipper_dataframe=False):
     df = df.drop('new_lands', axis=1)
     return df
 
+@instrument
 def identify_houses(df):
     '''
     identify which rows correspond to sales of house or condo
@@ -198,6 +435,7 @@ def identify_houses(df):
     df = df.drop('new_houses', axis=1)
     return df
 
+@instrument
 def identify_condos(df):
     '''
     identify which rows correspond to sales of a condo
@@ -227,10 +465,10 @@ def identify_condos(df):
     df = df.drop('new_condos', axis=1)
     return df
     
+@instrument
 def process_duplicates(df):
     
     duplis = df[df['application_number'].duplicated(keep=False)]
-    current_row = duplis[["application_number","assessment_number", "price"]].iloc[0].tolist()
     processed_rows = []
     marked_for_delete = []
 
@@ -311,6 +549,32 @@ def process_duplicates(df):
     df = df.drop(marked_for_delete)
     return df
 
+def _similar_ltro_addresses(addr_0, addr_1):
+    """
+    fuzzy address rules used by remove_application_number_duplicates
+    to decide if two LTRO addresses are the same property
+    """
+    from thefuzz import fuzz
+
+    similarity_ratio = fuzz.ratio(addr_0, addr_1)
+    if similarity_ratio > 80:
+        return True
+    # although the first characters don't coincide,
+    # are they close enough?
+    trunc_similarity_ratio = fuzz.ratio(addr_0[15:], addr_1[15:])
+    if trunc_similarity_ratio > 80:
+        return True
+    # perhaps fuzzy match is far but end of address and numbers match?
+    end_similarity_ratio = fuzz.ratio(addr_0[-25:], addr_1[-25:])
+    if end_similarity_ratio > 85:
+        # extract only the numbers using regular expressions
+        numbers_only_0 = set(re.findall(r'\d+', addr_0))
+        numbers_only_1 = set(re.findall(r'\d+', addr_1))
+        # both addresses match at the end and contain the same numbers
+        return numbers_only_0 == numbers_only_1
+    return False
+
+@instrument
 def remove_application_number_duplicates(df):
     '''
     Although application numbers should be unique to each sale,
@@ -325,6 +589,12 @@ def remove_application_number_duplicates(df):
     - address has a high fuzzy match
     This function is somewhat adhoc to cope with the lack of 
     consistency in the data entry of LTRO.
+
+    The candidates are grouped once by (assessment_number, price),
+    and each group is decided on its own (sorted by acquisition date):
+    - two sales: the first one is deleted if the addresses are a close match
+    - more sales: the first one is deleted if two of them have
+      the same address and acquisition date
     '''
     sa_duplicates = df[df.duplicated(subset=['assessment_number', 
                                              'parish', 
@@ -332,58 +602,29 @@ def remove_application_number_duplicates(df):
                                              'acquisition_date', 
                                              'property_type'], 
                                              keep=False)].sort_values(by="acquisition_date")
-    seen_indices = []
     to_delete = []
-    for k, row in sa_duplicates.iterrows():
-        if k in seen_indices:
-            continue
-        dupli = sa_duplicates[(sa_duplicates.assessment_number == row.assessment_number) \
-                              & (sa_duplicates.price == row.price)]
+    groups = sa_duplicates.groupby(['assessment_number', 'price'], sort=False, dropna=False)
+    for _, dupli in groups:
         if len(dupli) <= 1:
             # something happened here
             # no duplicates found but should be.
             continue
         if len(dupli) == 2:
-            # confirm that the addresses are a close match
-            similarity_ratio = fuzz.ratio(dupli.address.values[0],
-                                        dupli.address.values[1])
             # we assume duplicates are only two
-            if similarity_ratio > 80:
+            # confirm that the addresses are a close match
+            addr_0, addr_1 = dupli.address.astype(str).values
+            if _similar_ltro_addresses(addr_0, addr_1):
                 # they are close enough we can remove the first one
                 to_delete.append(dupli.index[0])
-                seen_indices.append(dupli.index[1])
-            else:
-                trunc_similarity_ratio = fuzz.ratio(dupli.address.values[0][15:],
-                                        dupli.address.values[1][15:])
-                if trunc_similarity_ratio > 80:
-                    # although the first characters don't coincide,
-                    # they are close enough we can remove the first one
-                    to_delete.append(dupli.index[0])
-                    seen_indices.append(dupli.index[1])
-                    
-                else:
-                    # perhaps fuzzy match is far but end of address and numbers match?
-                    end_similarity_ratio = fuzz.ratio(dupli.address.values[0][-25:],
-                                                    dupli.address.values[1][-25:])
-                    if end_similarity_ratio > 85:
-                        # extract only the numbers using regular expressions
-                        numbers_only_0 = set(re.findall(r'\d+', dupli.address.values[0]))
-                        numbers_only_1 = set(re.findall(r'\d+', dupli.address.values[1]))
-                        # print the result
-                        if numbers_only_1 == numbers_only_0:
-                            # both addresses match at the and and contain the same numbers
-                            to_delete.append(dupli.index[0])
-                            seen_indices.append(dupli.index[1])
-
         else:
             # too many matches?
             # can we match with the address and date?
-            addr_dupli = dupli[(dupli.address == row.address) & (dupli.acquisition_date == row.acquisition_date)]
-            if len(addr_dupli) == 2:
+            same_addr_and_date = dupli.groupby(['address', 'acquisition_date'], dropna=False).size()
+            if (same_addr_and_date == 2).any():
                 to_delete.append(dupli.index[0])
-                seen_indices.append(dupli.index[1])
 
     print(len(to_delete), 'LTRO Application number duplicates processed')
+    MAN.count('application_number_duplicates', len(to_delete))
     df = df.drop(to_delete)
     return df
 
@@ -409,6 +650,7 @@ def find_combined_arv(arv_list):
             arv_list = 0
         return arv_list
 
+@instrument
 def add_arv_to_ltro(df, lv):
     '''
     input: 
@@ -451,6 +693,7 @@ def add_arv_to_ltro(df, lv):
     df['combined_arv'] = df.arv.apply(find_combined_arv)
     return df
 
+@instrument
 def clean_property_type(df, lv):
     '''
     Uses land valuation data (more reliable)
@@ -516,6 +759,8 @@ def clean_property_type(df, lv):
             # Since this function runs twice, the property type
             # will be found the second time
             df['assessment_number'] = df.assessment_number.apply(skipu.clean_assn_nr)
+            # (not the property type of the previous row)
+            p_type = 0
 
         # does the df already have a property type?
         current_p_type = row.property_type
@@ -537,62 +782,38 @@ def clean_property_type(df, lv):
             print('No property types found for ----->', p_type, current_p_type)
     return df   
 
+@instrument
 def clean_area(df):
     """
     use the column "parcel_area"
     to build a column "parcel_area_ha"
     with the same surface units (in hectares)
+
+    Every "<number> <unit>" in the parcel area is extracted at once.
+    The unit which appears first is the one used (the same area is often
+    given in two units, e.g. "0.264 ha. (0.652 ac.)") and, when that unit
+    appears several times, the parcels are added up ("0.1 ha and 0.2 ha").
+    Areas without a number followed by a known unit are left empty.
     """
-    # clean_area
-    # 1. is there a number?
-    # 2. is there a unit?
-    # if not save zero, otherwise convert to Ha and store
-    unified_area = []
-    for _, row in df.iterrows():
-        si = str(row.parcel_area).lower()
-        
-        if si != 'nan':
-            contains_digit = any(map(str.isdigit, si))
-            if contains_digit:
-                uni = get_units(si)
-                # which one of those units appears first?
-                if len(uni)==1:
-                    first_unit = uni[0]
-                    
-                elif len(uni)>1:
-                    where_are_they = map(lambda x: si.find(x) , uni)
-                    wat = list(where_are_they)
-                    pos_min = min(enumerate(wat), key=itemgetter(1))[0]
-                    first_unit = uni[pos_min]
-                    
-                else: # no unit in this string
-                    first_unit = None
-                    unified_area.append(None)
-                    continue
-                
-                # Two properties or a single one?
-                one_or_several = si.split(first_unit)
-                
-                if len(one_or_several) > 2:
-                    # there are several lands with the same unit
-                    # could be improved latter by trying to add them up
-                    unified_area.append(None)
-                else:
-                    converted_surface = convert_to_ha(one_or_several[0], first_unit)
-                    if converted_surface:
-                        unified_area.append(round(converted_surface, 3))
-                    else:
-                        unified_area.append(None)
-                        
-                    # just a single land. Save it to standard units
-                
-            else: # does not contain digit
-                unified_area.append(None)
-        else: # it is nan
-            unified_area.append(None)
-            
+    area = pd.Series(df['parcel_area'].astype(str).values)
+    parcels = area.str.extractall(AREA_PATTERN)
+
+    if parcels.shape[0] == 0:
+        df['parcel_area_ha'] = np.nan
+        return df
+
+    # which unit matched?
+    parcels['unit'] = np.select([parcels.ha.notna(), parcels.ac.notna(), parcels.sq_m.notna()],
+                                ['ha', 'ac', 'sq m'], default='sq ft')
+    parcels['area_ha'] = (parcels.value.str.replace(',', '', regex=False).astype(float)
+                          * parcels.unit.map(AREA_UNITS_IN_HA))
+    # only keep the areas in the first unit that appears
+    first_unit = parcels.groupby(level=0).unit.transform('first')
+    parcels = parcels[parcels.unit == first_unit]
+
     # Create New Dataframe Column
-    df['parcel_area_ha'] = unified_area
+    unified_area = parcels.groupby(level=0).area_ha.sum().round(3)
+    df['parcel_area_ha'] = unified_area.reindex(area.index).values
     return df
 
 def nr_of_decimals(x):
@@ -617,49 +838,7 @@ def smtm(x, show_decimals=False):
     else:
         return "${:,.0f}".format(x)
 
-def get_units(area_string):
-    '''
-    checks if any of the standard surface area units
-    are present and returns them
-    :param str area_string: could be something like "0.222 hectare/0.550 acre"
-    0.264 ha. (0.652 ac.)
-    :return: list of units in the order they appear
-    :rtype: list
-    '''
-    possible_units = ['ac', 'acre', 'ha', 'sq m', 'square meter', 'hectare', 'sq ft', 'square feet']
-    # minor bug: 'acre' is read as having 'ac', but it's the correct unit anyway
-    unit_list = [x for x in possible_units if x in area_string]
-    return unit_list
-
-def convert_to_ha(value, unit):
-    '''
-    converts units of input to ha
-    works for acre, ac, sq m, square meter, hectare, sq ft
-    '''
-    if unit == 'ha' or unit == 'hectare':
-        try:
-            return float(value)
-        except:
-            return None
-    if unit == 'ac' or unit == 'ac':
-        try:
-            new_value = float(value)*0.404686
-            return new_value
-        except:
-            return None
-    if unit == 'sq m' or unit == 'square meter':
-        try:
-            new_value = float(value)*0.0001
-            return new_value
-        except:
-            return None
-    if unit == 'sq ft' or unit =='square feet':
-        try:
-            new_value = float(value)*9.2903/1000000
-            return new_value
-        except:
-            return None
-
+@instrument
 def simplify_parishes(df):
     '''
     This maps rows with a parish
@@ -683,6 +862,7 @@ def simplify_parishes(df):
         print("ERROR: No column named 'city' or 'parish' found in dataframe")
     return df
         
+@instrument
 def clean_addresses_with_assessment_number(df, lv):
     ''' 
     Address is deficient, but assessment number is present.
@@ -732,7 +912,24 @@ def clean_addresses_with_assessment_number(df, lv):
         df.loc[k, 'address'] = new_addr
     return df
 
-def clean_addresses_with_norwood(df, nw):
+@instrument
+def build_parcel_id_index(nw):
+    '''
+    Index of the Norwood dataset by parcel_id, built once and used
+    by clean_addresses_with_norwood() to look up parcel IDs in O(1).
+    :param nw: norwood dataframe (parcel_id_assn_nr_database.csv)
+    :return: dataframe indexed by parcel_id with the street_address, parish,
+             postcode and assessment_number of the first row of each parcel ID,
+             and n_rows, the number of rows with that parcel ID
+    '''
+    n_rows = nw.parcel_id.value_counts()
+    nw_index = nw.drop_duplicates(subset='parcel_id', keep='first').set_index('parcel_id')
+    nw_index = nw_index[['street_address', 'parish', 'postcode', 'assessment_number']].copy()
+    nw_index['n_rows'] = n_rows
+    return nw_index
+
+@instrument
+def clean_addresses_with_norwood(df, nw_index):
     '''
     2. Address is defficient and assessment number is missing.
 
@@ -740,8 +937,10 @@ def clean_addresses_with_norwood(df, nw):
     or parcel IDs.  They are usually between 4 - 11 characters.
     they begin with a 2 letter code for the parish, followed by 2 - 4 numbers.
     shortest has form: PA-8, longest has form: SO-001814
+    Parcel IDs like DE-1886/A which are not in the Norwood dataset
+    are looked up again without the part after the slash (DE-1886).
     :param df: dataframe with addresses
-    :param nw: norwood dataframe
+    :param nw_index: norwood parcel ID index, see build_parcel_id_index()
     :return: dataframe with addresses cleaned
     '''
     pattern = re.compile(r'^[A-Z]{2}-\d{1,6}$')
@@ -751,61 +950,49 @@ def clean_addresses_with_norwood(df, nw):
                                     df.address.astype(str).str.match(pattern2) | \
                                     df.address.astype(str).str.match(pattern3)) & \
                                    (df.assessment_number == 0)]
-    addr_matches = []
-    no_match = []
-
-
-    for k, row in deficient_addresses_no_an.iterrows():
-        # look up address in norwood dataset
-        addr = row.address
-        match = nw[nw.parcel_id == addr]
-        if match.shape[0] > 0:
-            new_str = match.street_address.values[0]
-            new_parish = match.parish.values[0]
-            new_postcode = match.postcode.values[0]
-
-            new_addr = "{}, {}, {} ({})".format(new_str, new_parish, new_postcode, addr)
-            assn_nr_match = match.assessment_number.values[0]
-            addr_matches.append(addr)
-
-        if match.shape[0] == 0:
-            # no address matches this parcel_id
-            if "/" in addr:
-                # try again without the part after the slash
-                shorter_addr = row.address.split('/')
-                match = nw[nw.parcel_id == shorter_addr[0]]
-                if len(match) == 1:
-                    new_str = match.street_address.values[0]
-                    new_parish = match.parish.values[0]
-                    new_postcode = match.postcode.values[0]
-
-                    new_addr = "{}, {}, {} ({})".format(new_str, new_parish, new_postcode, addr)
-                    assn_nr_match = match.assessment_number.values[0]
-                    addr_matches.append(addr)
-                elif len(match) > 1:
-                            print('Multiple Matches from Norwood:', match)
-                else:
-                    print(f"####=> nothing found for {row.address} using Norwood")
-                    no_match.append(addr)
-                    assn_nr_match = 0
-            else:
-                no_match.append(addr)
-                assn_nr_match = 0
-        
-        df.loc[k,'address'] = new_addr
-        if assn_nr_match != '0' and assn_nr_match != 0:
-            if len(assn_nr_match.split(',')) <= 2:
-                df.loc[k, 'assessment_number'] = assn_nr_match
-            else:
-                # too many assessment numbers associated with that value
-                pass
+    addr = deficient_addresses_no_an.address.astype(str)
+
+    # look up addresses in norwood dataset
+    exact_match = nw_index.reindex(addr.values).set_axis(addr.index)
+    has_exact_match = addr.isin(nw_index.index)
+
+    # no address matches this parcel_id
+    # try again without the part after the slash
+    shorter_addr = addr.str.split('/').str[0]
+    shorter_match = nw_index.reindex(shorter_addr.values).set_axis(addr.index)
+    retry = ~has_exact_match & addr.str.contains('/', regex=False)
+    has_shorter_match = retry & (shorter_match.n_rows == 1)
+    multiple_matches = retry & (shorter_match.n_rows > 1)
+
+    match = exact_match.where(has_exact_match, shorter_match)
+    found = has_exact_match | has_shorter_match
+    match = match[found]
+
+    new_addr = (match.street_address.astype(str) + ", " + match.parish.astype(str) + ", "
+                + match.postcode.astype(str) + " (" + addr[found] + ")")
+    df.loc[new_addr.index, 'address'] = new_addr
+
+    assn_nr_match = match.assessment_number
+    # too many assessment numbers associated with that value are ignored
+    use_assn_nr = (assn_nr_match.notna() & (assn_nr_match != '0')
+                   & (assn_nr_match.astype(str).str.count(',') < 2))
+    df.loc[assn_nr_match.index[use_assn_nr], 'assessment_number'] = assn_nr_match[use_assn_nr]
+
+    for k in addr.index[multiple_matches]:
+        print('Multiple Matches from Norwood:', addr[k])
+    for k in addr.index[retry & ~has_shorter_match & ~multiple_matches]:
+        print(f"####=> nothing found for {addr[k]} using Norwood")
 
     print("\nProcessing Parcel_IDs ...\n")
-    print("Address found for: ", addr_matches)
-    print("No match found for: ", no_match, "\n")
+    print("Address found for: ", addr[found].tolist())
+    print("No match found for: ", addr[~found & ~multiple_matches].tolist(), "\n")
+    MAN.count('parcel_ids', len(addr))
+    MAN.count('parcel_ids_found', found.sum())
+    MAN.count('parcel_ids_multiple_matches', multiple_matches.sum())
     return df
 
 
+@instrument
 def clean_ARV_with_landvaluation(df, lv):
     """
     This function should run following 
@@ -842,6 +1029,7 @@ def clean_ARV_with_landvaluation(df, lv):
                             df.at[k, 'arv'] = arv_list            
     return df
 
+@instrument
 def remove_ghost_assessment_numbers(df, lv):
     """
     many LTRO sales contain assessment numbers which cannot be found 
@@ -854,32 +1042,26 @@ def remove_ghost_assessment_numbers(df, lv):
 
     We finally remove sales with assessment number 0 and address 0.
     """
-    
-    number_of_assessment_numbers = (df.assessment_number
-                                     .astype(str)
-                                     .str.split(',').apply(len)
-                                     .value_counts().index
-                                    )
+    known_assessment_numbers = set(lv.assessment_number.dropna())
+
+    # sales for which the number of assessment numbers does not match the number of ARVs
+    n_assessment_numbers = df.assessment_number.astype(str).str.count(',') + 1
+    n_arvs = df.arv.astype(str).str.count(',') + 1
+    has_assessment_numbers = df.assessment_number.map(lambda x: isinstance(x, (list, str)))
+    unmatched = (n_assessment_numbers != n_arvs) & has_assessment_numbers
     print('# of ARVs does not match # of assessment numbers')
-    print('for {} sales'.format(sum(number_of_assessment_numbers)))
-            
-    for n_of_an in number_of_assessment_numbers:
-        # dataframe showing those sales for which the number of assessment numbers does not match the number of ARVs
-        unmatched_nr_of_an_arv = df[(df.assessment_number.astype(str).str.split(',').apply(len) == n_of_an) & \
-                                    (df.arv.astype(str).str.split(',').apply(len) != n_of_an)]
-        if unmatched_nr_of_an_arv.shape[0] > 0:
-            for i, row in unmatched_nr_of_an_arv.iterrows():
-                if type(row.assessment_number) == list:
-                    an_clean_list = row.assessment_number
-                else:
-                    an_list = row.assessment_number.split(',')
-                    an_clean_list = [x.replace("[","").replace("]","").replace("'","").strip() for x in an_list]
-                for an in an_clean_list:
-                    lv_match = lv[lv.assessment_number == an]
-                    if lv_match.shape[0] == 0:
-                        an_clean_list.remove(an)
-                # update the original sa dataframe with the new assessment number list
-                df.at[i, 'assessment_number'] = str(an_clean_list)
+    print('for {} sales'.format(unmatched.sum()))
+    MAN.count('arvs_not_matching_assessment_numbers', unmatched.sum())
+
+    an_lists = pd.Series([an if isinstance(an, list) else _list_from_assessment_number_string(an)
+                          for an in df.loc[unmatched, 'assessment_number']], dtype=object)
+    # one row per assessment number, keep those found in landvaluation
+    exploded = an_lists.explode()
+    exploded = exploded[exploded.isin(known_assessment_numbers)]
+    an_clean_lists = exploded.groupby(level=0).agg(list).reindex(an_lists.index)
+    # update the original sa dataframe with the new assessment number list
+    df.loc[unmatched, 'assessment_number'] = [str(an) if isinstance(an, list) else str([])
+                                              for an in an_clean_lists]
     print('Removing "ghost" assessment numbers ...')
     # remove sales with assessment number 0 and address 0
     df = df[~((df.assessment_number == '0') & (df.address == '0'))]
@@ -894,9 +1076,96 @@ def _list_from_assessment_number_string(an):
     return assn_nr_list
 
 def _fuzzy_address_match(addr1, addr2):
+    from thefuzz import fuzz
     similarity_ratio = fuzz.ratio(addr1, addr2)
     return similarity_ratio
 
+class AddressIndex:
+    """
+    Index of (landvaluation) addresses to find the rows where an address
+    - is exactly a given string: exact()
+    - contains a given string, like str.contains(text, regex=False): contains()
+    without scanning all the addresses.
+
+    - exact matches use a hash map of the addresses
+    - every word of an address is in a posting list (word -> rows).
+      A word of the text with something before and after it must be
+      a whole word of the address. The first (last) word of the text
+      may be the end (beginning) of a word of the address: those are
+      found in the sorted (reversed) vocabulary with a prefix search.
+    The rows found this way are then checked with `text in address`,
+    so the results are the same as scanning all the addresses.
+    """
+    WORD = re.compile(r'\w+')
+
+    def __init__(self, addresses):
+        """
+        :param addresses: Series of addresses (the index is returned by the queries)
+        """
+        self.labels = addresses.index
+        self.addresses = [x if isinstance(x, str) else None for x in addresses]
+
+        self.exact_rows = defaultdict(list)
+        self.postings = defaultdict(set)
+        for position, address in enumerate(self.addresses):
+            if address is None:
+                continue
+            self.exact_rows[address].append(position)
+            for word in self.WORD.findall(address):
+                self.postings[word].add(position)
+        self.vocabulary = sorted(self.postings)
+        self.reversed_vocabulary = sorted(word[::-1] for word in self.postings)
+
+    @staticmethod
+    def _starting_with(sorted_words, prefix):
+        start = bisect.bisect_left(sorted_words, prefix)
+        end = bisect.bisect_left(sorted_words, prefix + '\U0010ffff')
+        return sorted_words[start:end]
+
+    def _rows_with_words(self, words):
+        rows = set()
+        for word in words:
+            rows |= self.postings[word]
+        return rows
+
+    def _candidates(self, text):
+        """ rows which may contain text (a superset) """
+        words = [(m.start(), m.end(), m.group()) for m in self.WORD.finditer(text)]
+        whole_words = [w for start, end, w in words if start > 0 and end < len(text)]
+        if len(whole_words) > 0:
+            # the rarest words first
+            posting_lists = sorted((self.postings.get(w, set()) for w in whole_words), key=len)
+            return set.intersection(*posting_lists)
+
+        candidates = None
+        for start, end, w in words:
+            if start == 0 and end == len(text):
+                # a fragment of a word
+                rows = self._rows_with_words([v for v in self.vocabulary if w in v])
+            elif start == 0:
+                # the end of a word
+                rows = self._rows_with_words([v[::-1] for v in
+                                              self._starting_with(self.reversed_vocabulary, w[::-1])])
+            else:
+                # the beginning of a word
+                rows = self._rows_with_words(self._starting_with(self.vocabulary, w))
+            candidates = rows if candidates is None else candidates & rows
+
+        if candidates is None:
+            # no words in the text (only spaces, commas, etc.)
+            candidates = [p for p, address in enumerate(self.addresses) if address is not None]
+        return candidates
+
+    def exact(self, address):
+        """ index labels of the rows with this exact address """
+        return self.labels[self.exact_rows.get(address, [])]
+
+    def contains(self, text):
+        """ index labels of the rows with an address containing text """
+        positions = sorted(p for p in self._candidates(text) if text in self.addresses[p])
+        return self.labels[positions]
+
+@instrument
 def clean_addresses_with_landvaluation(df, lv):
     """
     If an LTRO sale has a single assessment number, we will
@@ -907,10 +1176,12 @@ def clean_addresses_with_landvaluation(df, lv):
     If an LTRO sale has no assessment number, we will try to find
     a fuzzy match to a landvaluation address and try to substitute it then
     THIS MAY SUPERSEDE clean_addresses_with_assessment_number
+    The address lookups use an AddressIndex of the landvaluation addresses.
     """
 
     # define a full address to later store the normative address
     df["full_address"] = df["address"]
+    lv_addresses = AddressIndex(lv.address)
 
     for k, row in df.iterrows():
         an = row.assessment_number
@@ -983,11 +1254,11 @@ def clean_addresses_with_landvaluation(df, lv):
         elif assn_nr_list[0] == '0' and row.address != '0' and row.address != 0:
             # No assessment number to identify the property
             # is there a good match based only on the address?
-            lv_addr_match = lv[lv.address == row.address]
+            lv_addr_match = lv.loc[lv_addresses.exact(row.address)]
             if len(lv_addr_match) >= 1:
                 # lucky match!
 
-                addresses_and_buildings = [f"{bu}, {ad}" for ad,bu in zip(lv_an_match.address, lv_an_match.building_name)]
+                addresses_and_buildings = [f"{bu}, {ad}" for ad,bu in zip(lv_addr_match.address, lv_addr_match.building_name)]
                 full_address = "\n".join(addresses_and_buildings)
                 new_assn_nrs = [an_an for an_an in lv_addr_match.assessment_number.values]
                 new_arvs = [x for x in lv_addr_match.arv.values]
@@ -1001,17 +1272,17 @@ def clean_addresses_with_landvaluation(df, lv):
                 # the address is not present verbatim
                 # in the landvaluation database.
                 # can we do a more subtle match?
-                lv_partial_addr_match = lv[lv.address.str.contains(row.address, regex=False)]
+                lv_partial_addr_match = lv.loc[lv_addresses.contains(row.address)]
                 if len(lv_partial_addr_match) >= 1:
-                    addresses_and_buildings = [f"{bu}, {ad}" for ad,bu in zip(lv_an_match.address, lv_an_match.building_name)]
+                    addresses_and_buildings = [f"{bu}, {ad}" for ad,bu in zip(lv_partial_addr_match.address, lv_partial_addr_match.building_name)]
                     full_address = "\n".join(addresses_and_buildings)
-                    new_assn_nrs = [an_an for an_an in lv_addr_match.assessment_number.values]
-                    new_arvs = [x for x in lv_addr_match.arv.values]
+                    new_assn_nrs = [an_an for an_an in lv_partial_addr_match.assessment_number.values]
+                    new_arvs = [x for x in lv_partial_addr_match.arv.values]
                     
                     df.loc[k, 'full_address'] = full_address
                     df.loc[k, 'assessment_number'] = str(new_assn_nrs)
                     df.loc[k, 'arv'] = str(new_arvs)
-                    df.loc[k, 'combined_arv'] = lv_addr_match.arv.values.sum()
+                    df.loc[k, 'combined_arv'] = lv_partial_addr_match.arv.values.sum()
                 else:
                     # no partial address match with "contains"
                     # can we try to match with the begginning of the address?
@@ -1019,7 +1290,7 @@ def clean_addresses_with_landvaluation(df, lv):
                     addr_begining = ",".join(row.address.split(',')[:-1])
                     if len(addr_begining) > 10:
                         # check that "something" is left after removing the last comma
-                        lv_partial_addr_match = lv[lv.address.str.contains(addr_begining, regex=False)]
+                        lv_partial_addr_match = lv.loc[lv_addresses.contains(addr_begining)]
                         if len(lv_partial_addr_match) == 1:
                             # single match. Very likely to be right
                             final_filter = lv_partial_addr_match[lv_partial_addr_match.parish == row.parish]
@@ -1052,149 +1323,184 @@ def clean_addresses_with_landvaluation(df, lv):
             pass
     return df
 
-def remove_close_duplicate_sales(df):
+@instrument
+def remove_close_duplicate_sales(df, max_months=4):
     """
     This function removes duplicates with a difference in registration date of less than 4 months
     Sometimes LTRO seems to record the same sale twice with different registration dates and 
     registration numbers.  Here we remove the duplicates with a difference in registration date of less than 4 months.
     as long as the price, address and assessment number are the same for the two records.
     - we also remove duplicates with the SAME application_number and registration_date.
+
+    Sales with the same assessment_number, price and full_address are sorted by
+    registration date, and every sale registered less than `max_months` after the
+    last sale kept in its group is removed (so groups of any size are handled,
+    and the first registration is kept). The differences of dates are vectorized,
+    only the groups with a chain of close sales are compared in a loop.
     :param df: dataframe with sales data
+    :param max_months: window (in months) for two records to be the same sale
     :return: dataframe with duplicates removed
     """
 
-    # Create a copy of the dataframe with assessment_number converted to string
-    df_check = df.copy()
-    df_check['assessment_number'] = df_check['assessment_number'].astype(str)
     # Find duplicates based on assessment_number, price and full_address
-    duplicates = df_check[df_check.duplicated(subset=['assessment_number', 'price', 'full_address'], keep=False)]
-    # Sort duplicates by assessment_number to group them together
-    duplicates = duplicates.sort_values('assessment_number')
-    # delete duplicates with a difference in registration date of less than 4 months
-    duplicates['registration_date'] = pd.to_datetime(duplicates['registration_date'])
-    duplicate_to_delete = []
-    for i in range(len(duplicates)):
-        if i % 2 != 0:
-            if abs((duplicates.iloc[i].registration_date - duplicates.iloc[i-1].registration_date).days / 30.44)< 4:
-                # verify that consecutive lines have the same assessment number:
-                if duplicates.iloc[i].assessment_number == duplicates.iloc[i-1].assessment_number:
-                    duplicate_to_delete.append(duplicates.iloc[i].name)
-    df.drop(duplicate_to_delete, inplace=True)
+    # (assessment_number converted to string, as it may contain lists)
+    group_keys = [df['assessment_number'].astype(str), df['price'], df['full_address']]
+    dupli_mask = pd.concat(group_keys, axis=1).duplicated(keep=False)
+    duplicates = pd.DataFrame({'assessment_number': group_keys[0][dupli_mask],
+                               'price': df.loc[dupli_mask, 'price'],
+                               'full_address': df.loc[dupli_mask, 'full_address'],
+                               'registration_date': pd.to_datetime(df.loc[dupli_mask, 'registration_date'])})
+
+    # sorted by date, each sale is compared with the last sale kept in
+    # its group (not with the previous one, which may be removed itself).
+    # Sales without a date are never removed and are not compared with.
+    # Missing addresses form a group too.
+    duplicates = duplicates.dropna(subset=['registration_date']).sort_values('registration_date', kind='stable')
+    group_ids = duplicates.groupby(['assessment_number', 'price', 'full_address'],
+                                   sort=False, dropna=False).ngroup()
+    # months since the previous sale of the group
+    months = duplicates.registration_date.groupby(group_ids).diff().dt.days / 30.44
+    close = months < max_months
+    # when the previous sale is not close to the one before it, it is kept, so a close
+    # sale is a duplicate. A sale close to a previous sale which is close itself (a chain
+    # of close sales) depends on which sales of the chain were kept: the chain can't be
+    # vectorized, so only the groups with a chain are compared one sale at a time
+    chained = close & close.groupby(group_ids).shift(fill_value=False)
+    chain_groups = group_ids[chained].unique()
+    in_chain = group_ids.isin(chain_groups)
+    duplicate_to_delete = list(duplicates.index[close & ~in_chain])
+    one_day = np.timedelta64(1, 'D')
+    for group_id in chain_groups:
+        in_group = (group_ids == group_id).to_numpy()
+        dates = duplicates.registration_date.to_numpy()[in_group]
+        indexes = duplicates.index[in_group]
+        last_kept = dates[0]
+        for index, date in zip(indexes[1:], dates[1:]):
+            if ((date - last_kept) // one_day) / 30.44 < max_months:
+                duplicate_to_delete.append(index)
+            else:
+                last_kept = date
+    df = df.drop(duplicate_to_delete)
 
     # remove one of the duplicates with the SAME application_number and registration_date.
     # potential improvement: keep the one with the most data.
     df = df[~df.duplicated(subset=['application_number', 'registration_date'], keep='first')]
 
-    # remove duplicates with the SAME application_number and registration_date.
-    # potential improvement: keep the one with the most data.
-    df = df[~df.duplicated(subset=['application_number', 'registration_date'], keep='first')]
-
     return df
 
-def build_property_name(row):
+def _short_addresses(addresses, long_enough=None):
     """
-    Build a property name from a row of the sales data.
+    Shorten comma separated addresses to their first item, or to their
+    first two items when the first one is shorter than `long_enough`
+    characters (always two items when `long_enough` is None).
     Args:
-        row: A row of the sales data.
+        addresses: A Series of addresses.
+        long_enough: The length for the first item to be enough.
     Returns:
-        A property name.
+        A Series of short addresses.
     """
-    addr_list = row.full_address.split(",")
-    if len(addr_list[0]) > 12:
-        # first item on the list is long enough for a short address
-        short_address = addr_list[0]
-    else:
-        # address is short. Use the first item.
-        if len(addr_list) > 1:
-            # address has at least two parts 
-            # separated by a comma. Use two:
-            short_address = addr_list[0] + ", " + addr_list[1]
-        else:
-            short_address = addr_list[0]
-    property_name = f"['{row.property_type} at {short_address}']"
-    return property_name
+    addr_list = addresses.astype(str).str.split(",")
+    first = addr_list.str[0]
+    second = addr_list.str[1]
+    two_items = second.notna()
+    if long_enough is not None:
+        two_items &= first.str.len() < long_enough
+    return first.where(~two_items, first + ", " + second)
+
+@instrument
+def build_property_name(df):
+    """
+    Build a property name from the type and address of the sales data.
+    Args:
+        df: The sales data.
+    Returns:
+        A Series of property names.
+    """
+    # first item on the address is long enough for a short address
+    # otherwise use two items of the address
+    short_address = _short_addresses(df.full_address, long_enough=13)
+    return "['" + df.property_type.astype(str) + " at " + short_address + "']"
 
-def flag_missing_assn(k, row, df):
+@instrument
+def flag_missing_assn(df):
     """
-    Flag a sale as having a missing assessment number.
+    Which sales would be flagged as having a missing assessment number.
+    (land and fractional sales have no assessment number)
     Args:
-        k: The index of the row.
-        row: A row of the sales data.
+        df: The sales data.
     Returns:
-        None.
+        A boolean Series.
     """
-    if row.property_type.lower() != "land" and \
-        row.property_type.lower() != "fractional" and \
-        row.property_type:
-        df.loc[k, "flag"] = "ASSN#"
-    return df
+    property_type = df.property_type.astype(str).str.lower()
+    return (df.property_type.map(lambda x: isinstance(x, str) and len(x) > 0)
+            & ~property_type.isin(["land", "fractional"]))
 
+@instrument
 def add_property_name_and_flag(df, lv):
     """
     Add a property name and flag to the sales data.
+    - sales with assessment numbers get the land valuation property names
+      (looked up in a map of assessment number -> property name)
+    - assessment numbers which are not in the land valuation database
+      are flagged and looked up by address, all at once with an AddressIndex
+    - sales without assessment number get a synthetic name and a flag.
     Args:
         df: The sales data.
         lv: The land valuation data.
     Returns:
         df: The sales data with property name and flag added.
     """
-    df["property_name"] = ""
-    df["flag"] = ""
-
-    for k, row in df.iterrows():
-        list_of_names = []
-        assess_nrs = skipu.clean_assn_nr(row.assessment_number)
-        # Assessment number is missing:
-        if assess_nrs == 0:
-            # create a synthetic property name
-            #  using the type and address.
-            df.loc[k, "property_name"] = build_property_name(row)
-
-            # FLAG the sale as having a missing assessment number:
-            df = flag_missing_assn(k, row, df)
-
-        else:
-            # Otherwise, we have a list of assessment numbers
-            # with one or more items in the list.
-            # which may or may not be in the land valuation database.
-            for assnr in assess_nrs:
-                if assnr in lv.assessment_number.values:            
-                    # it's in the land valuation database, use that name.
-                    list_of_names.append(lv[lv.assessment_number == assnr].property_name.values[0])
-                else:
-                    df = flag_missing_assn(k, row, df)
-                    # the assessment number may be faulty or 
-                    # just not in the land valuation database.
-                    # 1. let's try to find the property by address:
-                    short_address = row.full_address.split(",")
-                    if len(short_address) > 1: # several comma separated items in the address
-                        short_address = short_address[0] + ", " + short_address[1]
-                    else:
-                        short_address = short_address[0]
-
-                    # escape special characters in the address
-                    # so it's not interpreted as a regex
-                    short_address = re.escape(short_address)
-                    matching_properties = lv[lv.address.str.contains(short_address, case=False, na=False)]
-
-                    if len(matching_properties) == 1:
-                        # Found single matching property by address
-                        list_of_names.append(matching_properties.iloc[0].property_name)
-                    else:
-                        # Either several matches (not specific enough)
-                        # or No match found
-                        # In either case, we create a synthetic name from type and address
-                        short_address = row.address.split(",")
-                        if len(short_address) > 1:
-                            if len(short_address[0]) >= 12:
-                                short_address = short_address[0]
-                            else:
-                                short_address = short_address[0] + ", " + short_address[1]
-                        else:
-                            short_address = short_address[0]
-                        list_of_names.append(f"{row.property_type} at {short_address}")
-
-            # write to the property_name column:
-            df.loc[k, "property_name"] = str(list_of_names)
-        
+    sales = df.reset_index(drop=True)
+    property_name = pd.Series("", index=sales.index, dtype=object)
+    flag = pd.Series("", index=sales.index, dtype=object)
+    can_flag = flag_missing_assn(sales)
+
+    assess_nrs = sales.assessment_number.map(skipu.clean_assn_nr)
+    no_assn = assess_nrs.map(lambda x: not isinstance(x, list))
+
+    # Assessment number is missing:
+    # create a synthetic property name
+    #  using the type and address.
+    property_name[no_assn] = build_property_name(sales[no_assn])
+    # FLAG the sale as having a missing assessment number:
+    flag[no_assn & can_flag] = "ASSN#"
+
+    # Otherwise, we have a list of assessment numbers
+    # with one or more items in the list (one row for each).
+    # which may or may not be in the land valuation database.
+    assnrs = assess_nrs[~no_assn].explode()
+    lv_names = lv.drop_duplicates(subset="assessment_number").set_index("assessment_number").property_name
+    in_lv = assnrs.isin(lv_names.index)
+    # it's in the land valuation database, use that name.
+    names = assnrs.map(lv_names).where(in_lv)
+
+    # the assessment number may be faulty or
+    # just not in the land valuation database.
+    missing = assnrs.index[~in_lv]
+    flag[missing[can_flag[missing].values]] = "ASSN#"
+
+    # 1. let's try to find the property by address:
+    # (case insensitive, the address is not a regex)
+    short_address = _short_addresses(sales.full_address[missing])
+    lv_addresses = AddressIndex(pd.Series(lv.address.str.lower().values))
+    found_names = {}
+    for addr in short_address.unique():
+        matching_properties = lv_addresses.contains(addr.lower())
+        if len(matching_properties) == 1:
+            # Found single matching property by address
+            found_names[addr] = lv.property_name.values[matching_properties[0]]
+    # Either several matches (not specific enough)
+    # or No match found
+    # In either case, we create a synthetic name from type and address
+    synthetic_names = (sales.property_type[missing].astype(str) + " at "
+                       + _short_addresses(sales.address[missing], long_enough=12))
+    names[~in_lv] = short_address.map(found_names).where(short_address.isin(found_names.keys()),
+                                                         synthetic_names).values
+
+    # write to the property_name column:
+    names_per_sale = names.groupby(level=0, sort=False).agg(list).map(str)
+    property_name[names_per_sale.index] = names_per_sale
+
+    df["property_name"] = property_name.values
+    df["flag"] = flag.values
     return df
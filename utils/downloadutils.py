@@ -0,0 +1,87 @@
+# functions to download the data feeds
+# only the standard library is used, so downloading a feed
+# starts quickly: `python -m utils.downloadutils skipper skipperstats`
+import configparser
+import glob
+import os
+import subprocess
+import sys
+from datetime import datetime
+
+CONFIG_FILE = "./utils/kw_config.txt"
+SKIPPER_DIR = "data/skipper/"
+TRANSACTIONS_DIR = "data/skipper/transactions/"
+
+
+def get_xml_with_wget(url, output_file):
+    try:
+        subprocess.run(["wget", "-O", output_file, url], check=True)
+        print(f"Successfully downloaded to {output_file}")
+        with open(output_file, 'r') as f:
+            return f.read()
+    except subprocess.CalledProcessError as e:
+        print(f"Error downloading: {e}")
+        return None
+
+
+def get_url(section):
+    # Get secret URL API
+    keys = configparser.ConfigParser()
+    keys.read(CONFIG_FILE)
+    return keys.get(section, "URL")
+
+
+def todays_file(directory, name):
+    # define file to save to
+    today = datetime.today()
+    return directory + '{}-{:02d}-{:02d}_{}'.format(today.year, today.month, today.day, name)
+
+
+def todays_skipper_xml():
+    return todays_file(SKIPPER_DIR, 'skipper_properties.xml')
+
+
+def download_skipper_properties():
+    """
+    :return: path of the property skipper XML feed of today
+    """
+    skipper_properties_xml = todays_skipper_xml()
+    # if file exists for today, don't download again
+    if not os.path.exists(skipper_properties_xml):
+        # Get data from web as XML
+        get_xml_with_wget(get_url("skipper"), skipper_properties_xml)
+    print(skipper_properties_xml)
+    return skipper_properties_xml
+
+
+def last_transactions_file():
+    xml_downloads = glob.glob(TRANSACTIONS_DIR + '*.xml')
+    # get the file which was last modified
+    return max(xml_downloads, key=os.path.getmtime)
+
+
+def download_transactions():
+    """
+    :return: path of the last downloaded skipperstats XML file
+    """
+    transactions = todays_file(TRANSACTIONS_DIR, 'transactions.xml')
+    # if file exists for today, don't download again
+    if not os.path.exists(transactions):
+        # Get data from web as XML
+        get_xml_with_wget(get_url("skipperstats"), transactions)
+    return last_transactions_file()
+
+
+FEEDS = {
+    'skipper': download_skipper_properties,
+    'skipperstats': download_transactions,
+}
+
+
+if __name__ == "__main__":
+    feeds = sys.argv[1:] or list(FEEDS)
+    unknown = set(feeds) - set(FEEDS)
+    if unknown:
+        sys.exit("Unknown feeds: {} (choose from {})".format(", ".join(sorted(unknown)), ", ".join(FEEDS)))
+    for feed in feeds:
+        FEEDS[feed]()
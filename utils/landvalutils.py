@@ -1,19 +1,198 @@
 # functions to clean up landvaluation data
+import datetime
+import os
+import string
+
 import numpy as np
 import pandas as pd
-from thefuzz import fuzz
 
+import utils.manifestutils as MAN
+from utils.profileutils import instrument
+
+# fields of the scraped landvaluation data compared between two scrapes
+LANDVALUATION_FIELDS = ['arv', 'tax_code', 'property_type', 'address', 'grid', 'parish', 'building_name']
+# log of the properties which were added, changed or disappeared between scrapes
+CHANGE_LOG_FILE = "./data/landvaluation/landvaluation_changes.csv"
+# fields recorded in the change log (old and new value)
+CHANGE_LOG_FIELDS = ['arv', 'tax_code', 'property_type']
+# ARVs of each property over time (from the Historic_ARVs column of the scrapes)
+HISTORIC_ARVS_FILE = "./data/landvaluation/historic_arvs.parquet"
+# an effective date (dd/mm/yyyy, yyyy-mm-dd or only the year) followed by an ARV after its $.
+# The ARV stops at the last group of thousands, so in older scrapes where the lines
+# were joined without a space ("$42,00001/01/2015") it does not run into the next date
+HISTORIC_ARV_PATTERN = (r'(?P<effective_date>\d{1,2}/\d{1,2}/\d{4}|\d{4}-\d{2}-\d{2}|\b\d{4}\b)'
+                        r'\D*?\$(?P<arv>\d{1,3}(?:,\d{3})+|\d+)')
+# rows per row group of HISTORIC_ARVS_FILE
+HISTORIC_ARVS_ROW_GROUP = 20000
+
+@instrument
+def row_hashes(df, fields=LANDVALUATION_FIELDS):
+    '''
+    hash of the fields of each property, indexed by assessment number.
+    All fields are compared as strings, so "100" and 100 are the same.
+    If an assessment number appears more than once, the last one is used.
+    '''
+    hashes = pd.util.hash_pandas_object(df[fields].astype(str), index=False)
+    hashes.index = df.assessment_number.values
+    return hashes[~hashes.index.duplicated(keep='last')]
+
+
+@instrument
+def find_landvaluation_changes(old, new):
+    '''
+    compares two scrapes of landvaluation data with a hash of each property.
+    :param old: previous landvaluation data (latest_landvaluation_data.csv)
+    :param new: last scraped landvaluation data
+    :return: (added, changed, disappeared) assessment numbers (pd.Index)
+    '''
+    old_hashes = row_hashes(old)
+    new_hashes = row_hashes(new)
+
+    added = new_hashes.index.difference(old_hashes.index)
+    disappeared = old_hashes.index.difference(new_hashes.index)
+    common = new_hashes.index.intersection(old_hashes.index)
+    changed = common[new_hashes[common].values != old_hashes[common].values]
+    return added, changed, disappeared
+
+
+@instrument
+def log_landvaluation_changes(old, new, added, changed, disappeared, scraped_file):
+    '''
+    appends the changes found by find_landvaluation_changes to CHANGE_LOG_FILE
+    with the old and new values of CHANGE_LOG_FIELDS, the date and the scraped file.
+    The disappeared properties stay in the latest data, so they are only logged
+    the first time (not again while their last change logged is "disappeared").
+    :return: dataframe with the logged changes
+    '''
+    if os.path.exists(CHANGE_LOG_FILE):
+        logged = pd.read_csv(CHANGE_LOG_FILE, dtype={"assessment_number": str}, usecols=['assessment_number', 'change'])
+        last_change = logged.drop_duplicates(subset=['assessment_number'], keep='last').set_index('assessment_number').change
+        disappeared = disappeared[last_change.reindex(disappeared).values != 'disappeared']
+
+    old = old.drop_duplicates(subset=['assessment_number'], keep='last').set_index('assessment_number')
+    new = new.drop_duplicates(subset=['assessment_number'], keep='last').set_index('assessment_number')
+
+    assessment_numbers = added.append(changed).append(disappeared)
+    log = pd.DataFrame({'assessment_number': assessment_numbers,
+                        'change': ['added'] * len(added) + ['changed'] * len(changed)
+                                  + ['disappeared'] * len(disappeared)})
+    for field in CHANGE_LOG_FIELDS:
+        log['old_' + field] = old[field].reindex(assessment_numbers).values
+        log['new_' + field] = new[field].reindex(assessment_numbers).values
+    log['detected_on'] = datetime.date.today().isoformat()
+    log['scraped_file'] = os.path.basename(scraped_file)
+
+    log.to_csv(CHANGE_LOG_FILE, mode='a', index=False,
+               header=not os.path.exists(CHANGE_LOG_FILE))
+    return log
+
+
+@instrument
+def parse_historic_arvs(scraped):
+    '''
+    converts the Historic_ARVs text of the scraped landvaluation data
+    (pairs of effective date and ARV, like "01/01/2020: $50,000 01/01/2015: $45,600")
+    into a long table with one row per property and effective date.
+    Dates are day first (as on landvaluation.bm), a year alone is the 1st of January.
+    :param scraped: scraped landvaluation data
+    :return: dataframe with assessment_number, effective_date and arv
+    '''
+    historic = scraped.Historic_ARVs.astype('string')
+    historic.index = scraped.assessment_number.values
+    found = historic.str.extractall(HISTORIC_ARV_PATTERN)
+
+    dates = found.effective_date.astype(str)
+    dates = dates.mask(dates.str.len() == 4, dates + '-01-01')
+    table = pd.DataFrame({
+        'assessment_number': found.index.get_level_values(0).astype(str),
+        'effective_date': pd.to_datetime(dates.values, format='mixed', dayfirst=True, errors='coerce'),
+        'arv': pd.to_numeric(found.arv.str.replace(',', '', regex=False).values, errors='coerce'),
+    })
+    table = table.dropna(subset=['effective_date', 'arv'])
+    table['arv'] = table.arv.astype('int64')
+    return table
+
+
+@instrument
+def update_historic_arvs(scraped):
+    '''
+    adds the historic ARVs of the last scrape to HISTORIC_ARVS_FILE.
+    The file is sorted by assessment number (then date), so the statistics
+    of each row group work as an index when reading a few properties
+    (see load_historic_arvs).
+    :return: the updated historic ARVs
+    '''
+    if 'Historic_ARVs' not in scraped.columns:
+        print("No historic ARVs in the scraped data")
+        return None
+
+    table = parse_historic_arvs(scraped)
+    if os.path.exists(HISTORIC_ARVS_FILE):
+        table = pd.concat([pd.read_parquet(HISTORIC_ARVS_FILE), table], ignore_index=True)
+    table = table.drop_duplicates(subset=['assessment_number', 'effective_date'], keep='last')
+    table = table.sort_values(['assessment_number', 'effective_date'], ignore_index=True)
+
+    table.to_parquet(HISTORIC_ARVS_FILE, index=False, row_group_size=HISTORIC_ARVS_ROW_GROUP)
+    print(f"{len(table)} historic ARVs of {table.assessment_number.nunique()} properties saved")
+    MAN.count('historic_arvs', len(table))
+    return table
+
+
+@instrument
+def load_historic_arvs(assessment_numbers=None):
+    '''
+    ARVs over time of some properties (all of them if assessment_numbers is None)
+    only the row groups which can contain those assessment numbers are read.
+    :param assessment_numbers: list of assessment numbers (9 digit strings)
+    :return: dataframe with assessment_number, effective_date and arv
+    '''
+    filters = None
+    if assessment_numbers is not None:
+        filters = [('assessment_number', 'in', list(assessment_numbers))]
+    return pd.read_parquet(HISTORIC_ARVS_FILE, filters=filters)
+
+
+def _merge_building_names(names, names_low):
+    '''
+    decides which building names of a group of duplicates
+    (same assessment number, oldest first) are kept.
+    The last (most recent scraped) name is always kept.
+    Older names are dropped if they are similar to a more recent one
+    or only have a few characters, the others are kept so they can be
+    combined with the most recent one.
+    :return: list of the positions of the names to keep
+    '''
+    from thefuzz import fuzz
+
+    keep = []
+    for i, name_low in enumerate(names_low[:-1]):
+        # compare with all the more recent names
+        similar = any(fuzz.ratio(name_low, later) > 80 for later in names_low[i + 1:])
+        if not similar and len(name_low) >= 5:
+            # both building names are long but different
+            keep.append(i)
+    keep.append(len(names) - 1)
+    return keep
+
+
+@instrument
 def process_and_merge_duplicates(df):
     '''
     this function is applied after last_scraped_data
     and latest_lv_data have been concatenated and full duplicates have been removed
     We now want to remove more subtle duplicates, which are duplicates only
     when considering assessment number and address.
+
+    The properties with the assessment number of a partial duplicate are
+    grouped once by assessment number, and only the last (most recent) one
+    is kept. Its building name is combined (by concatenation with " -- ")
+    with the older building names which are different enough
+    (see _merge_building_names).
     '''
 
     all_duplicates = df[df.duplicated(subset=['assessment_number', 'address'])]
-    all_duplicates = all_duplicates.replace(np.nan, 0, regex=True)
     print(all_duplicates.shape[0], "partial duplicates found")
+    MAN.count('partial_duplicates_found', all_duplicates.shape[0])
 
     if len(all_duplicates) == 0:
         # nothing to do here. No duplicates found
@@ -21,100 +200,93 @@ def process_and_merge_duplicates(df):
         return df
 
     duplicates_to_delete = []
-    for k, adupe in all_duplicates.iterrows():
-        # get a small dataframe with the duplicates matching the current row
-        matches = df[df.assessment_number == adupe.assessment_number ]
-        # save the name of the building which has a partial match
-        if matches.shape[0] == 0:
-            # not matches found. skip this row
-            continue
-        build_name = matches.building_name_low.values[0]
-        # save the index of the row to delete (if they are similar)
-        index_to_delete = df.index[(df['building_name_low'] == build_name) & \
-                                    (df.assessment_number == adupe.assessment_number)].tolist()
-        similarity_ratio = fuzz.ratio(matches.building_name_low.values[0],
-                                      matches.building_name_low.values[1])
-        # we assume duplicates are only two
-        if similarity_ratio > 80:
-            # they are close enough we can remove the old one
-            if similarity_ratio == 100 and len(index_to_delete) == 2:
-                # the building name is the same. Keep only first one (most recent scraped list)
-                duplicates_to_delete.extend([index_to_delete[0]])
-            else:
-                # index to delete only had one match (len(index_to_delete) == 1))
-                duplicates_to_delete.extend(index_to_delete)
-        else:
-            # match is not good enough
-            if len(build_name) < 5:
-                # first one only has a few characters, so we don't keep it.
-                duplicates_to_delete.extend(index_to_delete)
-            else:
-                # both building names are long but different
-                # so we will keep both (combining them by concatenation)
-                duplicates_to_delete.extend(index_to_delete)
-                new_building_name = df.loc[index_to_delete, 'building_name'].values + \
-                                    ' -- ' + df.loc[k, 'building_name']
-                new_building_name_low = df.loc[index_to_delete, 'building_name_low'].values + \
-                                        ' -- ' + df.loc[k, 'building_name_low']
-                df.loc[k, 'building_name'] = new_building_name[0]
-                df.loc[k, 'building_name_low'] = new_building_name_low[0]
-            
-            
+    with_duplicates = df[df.assessment_number.isin(all_duplicates.assessment_number)]
+    for _, matches in with_duplicates.groupby('assessment_number', sort=False):
+        names = matches.building_name.fillna('').astype(str).tolist()
+        names_low = matches.building_name_low.fillna('').astype(str).tolist()
+        keep = _merge_building_names(names, names_low)
+
+        # keep the most recent one with the combined names
+        k = matches.index[-1]
+        df.loc[k, 'building_name'] = ' -- '.join(names[i] for i in keep)
+        df.loc[k, 'building_name_low'] = ' -- '.join(names_low[i] for i in keep)
+        duplicates_to_delete.extend(matches.index[:-1])
+
     print(len(duplicates_to_delete), "partial duplicates removed")
+    MAN.count('partial_duplicates_removed', len(duplicates_to_delete))
     df = df.drop(duplicates_to_delete)
     return df
 
 
-def create_property_name(row):
-    bn = row.building_name # bn = building_name
-    bn = bn.lower().strip()
-    # check if building_name is empty
-    if pd.isna(row .building_name) or row.building_name == '\xa0':
-        # capitalize the first letter of the property_type
-        property_str = f"{row.property_type.capitalize()} at"
-        property_str += f" {row.address.split(',')[0]}"
-        property_str += f" {row.parish}"
-        return property_str
-    elif bn == "island":
-        property_str = f"Island at"
-        property_str += f" {row.address.split(',')[0]},"
-        property_str += f" {row.parish}"
-        return property_str
-    elif 'apt' in bn and len(bn) <= 16:
-        property_str = f"{bn.capitalize()}, "
-        property_str += f" {row.address.split(',')[0]}"
-        return property_str
-    elif 'main' in bn and len(bn) <= 16:
-        property_str = f"{bn.capitalize()}, "
-        property_str += f" {row.address.split(',')[0]}"
-        return property_str
-    elif 'apartment' in bn and len(bn) <= 16:
-        property_str = f"{bn.capitalize()}, "
-        property_str += f" {row.address.split(',')[0]}"
-        return property_str
-    elif 'unit' in bn and len(bn) <= 15:
-        property_str = f"{bn.capitalize()}, "
-        property_str += f" {row.address.split(',')[0]}"
-        return property_str
-    elif 'condominium' in bn and len(bn) <= 20:
-        property_str = f"{bn.capitalize()}, "
-        property_str += f" {row.address.split(',')[0]}"
-        return property_str
-    elif 'shop' in bn and len(bn) <= 15:
-        property_str = f"{bn.capitalize()}, "
-        property_str += f" {row.address.split(',')[0]}"
-        return property_str
-    elif 'house' in bn and len(bn) <= 15:
-        property_str = f"{bn.capitalize()}, "
-        property_str += f" {row.address.split(',')[0]}"
-        return property_str
-    elif 'floor' in bn and len(bn) <= 15:
-        property_str = f"{bn.capitalize()}, "
-        property_str += f" {row.address.split(',')[0]}"
-        return property_str
-    elif 'studio' in bn and len(bn) <= 15:
-        property_str = f"{bn.capitalize()}, "
-        property_str += f" {row.address.split(',')[0]}"
-        return property_str
-    else:
-        return row.building_name
+# Templates of the property names. The fields are
+# {property_type} and {building_name} (capitalized), {street} (first part
+# of the address) and {parish}.
+# properties without a building name
+NO_NAME_TEMPLATE = "{property_type} at {street} {parish}"
+# properties with the building name "island"
+ISLAND_TEMPLATE = "Island at {street}, {parish}"
+# Building names which are not descriptive enough by themselves
+# (like "Apt 2" or "Main House") are completed with the address.
+# Each rule is (keyword in the building name, maximum length of the name, template)
+# and applies to the lowercase, stripped building name. The first rule which matches is used.
+SHORT_NAME_TEMPLATE = "{building_name},  {street}"
+PROPERTY_NAME_RULES = [
+    ('apt', 16, SHORT_NAME_TEMPLATE),
+    ('main', 16, SHORT_NAME_TEMPLATE),
+    ('apartment', 16, SHORT_NAME_TEMPLATE),
+    ('unit', 15, SHORT_NAME_TEMPLATE),
+    ('condominium', 20, SHORT_NAME_TEMPLATE),
+    ('shop', 15, SHORT_NAME_TEMPLATE),
+    ('house', 15, SHORT_NAME_TEMPLATE),
+    ('floor', 15, SHORT_NAME_TEMPLATE),
+    ('studio', 15, SHORT_NAME_TEMPLATE),
+]
+
+
+def _fill_template(template, fields):
+    """
+    the template filled in row by row with the columns in fields
+    (a row with a missing field gives NaN)
+    :param fields: dict of {field name: pd.Series}
+    :return: pd.Series
+    """
+    result = ''
+    for literal, field, _, _ in string.Formatter().parse(template):
+        result = result + literal
+        if field is not None:
+            result = result + fields[field]
+    return result
+
+
+@instrument
+def create_property_names(df):
+    '''
+    creates the property name of every property from its
+    building name, property type, address and parish.
+    - no building name: "House at 12 Some Road Paget"
+    - building name "island": "Island at Some Island, Hamilton"
+    - short building names matching PROPERTY_NAME_RULES: "Apt 2,  12 Some Road"
+    - otherwise the building name is used as is.
+    (see the templates above PROPERTY_NAME_RULES)
+    :param df: landvaluation dataframe
+    :return: pd.Series with the property names
+    '''
+    bn = df.building_name.str.lower().str.strip()
+    street = df.address.str.split(',').str[0]
+    parish = df.parish.astype(str)
+
+    fields = {'property_type': df.property_type.str.capitalize(), 'building_name': bn.str.capitalize(),
+              'street': street, 'parish': parish}
+
+    no_name = df.building_name.isna() | (df.building_name == '\xa0')
+    conditions = [no_name, bn == 'island']
+    choices = [_fill_template(NO_NAME_TEMPLATE, fields), _fill_template(ISLAND_TEMPLATE, fields)]
+    # each template is filled in once, even if several rules use it
+    filled = {}
+    for keyword, max_length, template in PROPERTY_NAME_RULES:
+        if template not in filled:
+            filled[template] = _fill_template(template, fields)
+        conditions.append(bn.str.contains(keyword, regex=False, na=False) & (bn.str.len() <= max_length))
+        choices.append(filled[template])
+    return pd.Series(np.select(conditions, choices, default=df.building_name),
+                     index=df.index)
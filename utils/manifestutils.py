@@ -0,0 +1,191 @@
+# run manifests: a JSON file written by every run of a pipeline (or script)
+# with what went in and out of each stage, so runs can be compared
+# without reading their logs:
+#
+#   - status (ran, skipped, failed) and duration of each stage
+#   - rows going in and out of each stage
+#   - sha256 of the files each stage read and wrote
+#   - counters of what the stage did ("partial duplicates removed",
+#     "Skipper Stats duplicates processed based on dates", ...),
+#     added from anywhere in the code with count()
+#
+# They are saved to ./data/manifests/<run>_<date>_<time>.json
+import hashlib
+import json
+import os
+import subprocess
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from utils.profileutils import nr_rows
+
+MANIFEST_DIR = "./data/manifests/"
+
+# the run being recorded (one per process)
+_run = None
+
+
+def file_hash(file_path):
+    """
+    sha256 of the content of a file (None if it does not exist)
+    """
+    if not os.path.exists(file_path):
+        return None
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _commit():
+    # commit of the code which ran (None outside a git checkout)
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _number(value):
+    # numpy numbers are not JSON serializable
+    return value.item() if hasattr(value, 'item') else value
+
+
+class StageRecord:
+    """
+    What a stage did, recorded while it runs (use it as a context manager)
+    """
+
+    def __init__(self, run, name, inputs=()):
+        self.run = run
+        self.name = name
+        self.record = {'status': 'running', 'seconds': None, 'rows_in': nr_rows(inputs), 'rows_out': None,
+                       'counters': {}, 'inputs': {}, 'outputs': {}}
+
+    def output(self, result):
+        """
+        counts the rows of the result of the stage, which is returned
+        """
+        self.record['rows_out'] = nr_rows([result])
+        return result
+
+    def add_files(self, role, file_hashes):
+        """
+        :param role: 'inputs' or 'outputs'
+        :param file_hashes: dict of {path: sha256}, or list of paths to hash
+        """
+        if not isinstance(file_hashes, dict):
+            file_hashes = {file_path: file_hash(file_path) for file_path in file_hashes}
+        self.record[role].update(file_hashes)
+
+    def __enter__(self):
+        self.previous = self.run.current
+        self.run.current = self
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.record['seconds'] = round(time.perf_counter() - self.start, 3)
+        self.record['status'] = 'failed' if exc_type is not None else 'ran'
+        self.run.current = self.previous
+        return False
+
+
+class RunManifest:
+    """
+    manifest of a run, see start_run()
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.manifest = {'run': name, 'commit': _commit(),
+                         'started': datetime.now().isoformat(timespec='seconds'),
+                         'finished': None, 'seconds': None, 'status': 'running',
+                         'counters': {}, 'stages': {}}
+        self.current = None
+
+    def stage(self, name, inputs=()):
+        """
+        :param name: name of the stage
+        :param inputs: dataframes going in (to count their rows)
+        :return: StageRecord of the stage, to use as a context manager
+        """
+        stage = StageRecord(self, name, inputs)
+        self.manifest['stages'][name] = stage.record
+        return stage
+
+    def skipped(self, name, file_hashes=None):
+        """
+        records a stage which did not run (its result was reused)
+        """
+        self.manifest['stages'][name] = {'status': 'skipped', 'inputs': file_hashes or {}}
+
+    def count(self, key, value):
+        counters = self.current.record['counters'] if self.current else self.manifest['counters']
+        counters[key] = counters.get(key, 0) + _number(value)
+
+    def save(self, status=None):
+        failed = any(stage['status'] == 'failed' for stage in self.manifest['stages'].values())
+        self.manifest['status'] = status or ('failed' if failed else 'done')
+        self.manifest['finished'] = datetime.now().isoformat(timespec='seconds')
+        self.manifest['seconds'] = round(time.perf_counter() - self.start, 3)
+        os.makedirs(MANIFEST_DIR, exist_ok=True)
+        manifest_file = os.path.join(MANIFEST_DIR, "{}_{}.json".format(
+            self.name, datetime.now().strftime("%Y-%m-%d_%H%M%S")))
+        with open(manifest_file, 'w') as f:
+            json.dump(self.manifest, f, indent=2, default=str)
+        print("run manifest saved to " + manifest_file)
+        return manifest_file
+
+
+def start_run(name):
+    """
+    starts recording a run (the counters go to it until finish_run)
+    :return: RunManifest
+    """
+    global _run
+    _run = RunManifest(name)
+    return _run
+
+
+def finish_run(status=None):
+    """
+    saves the manifest of the current run
+    :return: path of the manifest (None if no run was recorded)
+    """
+    global _run
+    if _run is None:
+        return None
+    run, _run = _run, None
+    return run.save(status)
+
+
+def count(key, value):
+    """
+    adds value to the counter key of the stage running
+    (nothing happens if no run is being recorded)
+    """
+    if _run is not None:
+        _run.count(key, value)
+
+
+@contextmanager
+def recording(name, inputs=(), outputs=()):
+    """
+    records a script run on its own as a run with a single stage, 'main'
+    :param inputs: files read by the script
+    :param outputs: files written by the script
+    """
+    run = start_run(name)
+    status = 'failed'
+    try:
+        with run.stage('main') as stage:
+            stage.add_files('inputs', inputs)
+            yield stage
+        stage.add_files('outputs', outputs)
+        status = None
+    finally:
+        finish_run(status)
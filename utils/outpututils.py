@@ -0,0 +1,175 @@
+# reading and writing the kw-*.csv files prepared for the webapp
+#
+# With KW_PARQUET=1 each of them is also saved as Parquet next to the CSV
+# (kw-sales.csv -> kw-sales.parquet) with the explicit schema of SCHEMAS:
+# lists stay lists, dates stay dates and the text columns with only a few
+# values (parish, property_type...) are dictionary encoded.
+# read_output() prefers the Parquet file when it is up to date, so the
+# next pipelines don't have to infer the types of the CSV again or parse
+# the lists written as text ("['041959019', '041960017']").
+# The CSV files are always written (the database is seeded from them).
+import ast
+import os
+
+import numpy as np
+import pandas as pd
+
+PARQUET = os.environ.get("KW_PARQUET", "") not in ("", "0")
+
+# type of each column of the outputs:
+#   'string'    text
+#   'category'  text with few distinct values (dictionary encoded in Parquet,
+#               read as a pandas categorical)
+#   'int', 'float'   (an 'int' column with missing values is saved as float)
+#   'date'      date (read as datetime64, ready to compare with other dates)
+#   'list'      list of strings, 0 when there are none (as in the CSV files)
+# columns which are not listed are saved as text
+SCHEMAS = {
+    'kw-properties.csv': {
+        'assessment_number': 'string', 'arv': 'int', 'tax_code': 'category', 'property_type': 'category',
+        'address': 'string', 'grid': 'string', 'parish': 'category', 'building_name': 'string',
+        'property_name': 'string',
+    },
+    'kw-sales.csv': {
+        'application_number': 'string', 'registration_date': 'date', 'parish': 'category',
+        'address': 'string', 'parcel_area': 'string', 'parcel_area_ha': 'float',
+        'assessment_number': 'list',
+        # acquisition dates come in several formats (see skipperstatsutils.parse_mixed_dates)
+        'acquisition_date': 'string',
+        'price': 'int',
+        # one ARV or a list of them
+        'arv': 'string', 'combined_arv': 'int',
+        'property_type': 'category', 'full_address': 'string',
+    },
+    'kw-skipper_properties.csv': {
+        'reference': 'string', 'skipper_id': 'int', 'assessment_number': 'list', 'name': 'string',
+        'parish': 'category', 'zip': 'string', 'flag': 'category', 'longitude': 'float',
+        'latitude': 'float', 'property_type': 'category', 'url': 'string', 'views': 'int',
+        'special_headline': 'string', 'short_description': 'string', 'long_description': 'string',
+        'youtube_id': 'string', 'vimeo_id': 'string', 'paradym_url': 'string',
+        'virtual_tour_url': 'string', 'images': 'list', 'bedrooms': 'float', 'bathrooms': 'float',
+        'half_bathrooms': 'float', 'lotsize': 'float', 'sqft': 'float', 'property_name': 'string',
+    },
+    'kw-listings.csv': {
+        'reference': 'string', 'skipper_id': 'int', 'date_added': 'string', 'date_relisted': 'string',
+        'is_rent': 'int', 'is_sale': 'int', 'under_contract': 'int', 'under_offer': 'int',
+        'buyer_type': 'category', 'price': 'float', 'price_from': 'float', 'daily_rate': 'float',
+        # a dict with the id, name, company, email and phone of the agent
+        'agent': 'string', 'property_name': 'string',
+    },
+    'kw-skipper-stats-sales.csv': {
+        'application_number': 'string', 'ref': 'string', 'registration_date': 'date',
+        'parish': 'category', 'property_name': 'string', 'address': 'string', 'postcode': 'string',
+        'longitude': 'float', 'latitude': 'float', 'assessment_number': 'string', 'price': 'float',
+        'arv': 'int', 'property_type': 'category', 'photos': 'list', 'grid': 'string',
+        'flag': 'category',
+    },
+}
+TEXT_TYPES = ('string', 'category', 'date', 'list')
+
+
+def parquet_file(csv_file):
+    return os.path.splitext(csv_file)[0] + ".parquet"
+
+
+def _schema(csv_file, columns):
+    schema = SCHEMAS.get(os.path.basename(csv_file), {})
+    return {column: schema.get(column, 'string') for column in columns}
+
+
+def _is_missing(value):
+    # the pipelines write 0 when there is no value
+    if isinstance(value, (list, np.ndarray)):
+        return False
+    return value is None or (isinstance(value, float) and np.isnan(value)) or value in (0, '0', '')
+
+
+def _to_list(value):
+    """
+    a value of a list column as a list of strings (None if missing)
+    """
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [str(item) for item in value]
+    if _is_missing(value):
+        return None
+    if isinstance(value, str) and value.startswith('['):
+        # a list written as text
+        return [str(item) for item in ast.literal_eval(value)]
+    return [str(value)]
+
+
+def _arrow_array(values, column_type):
+    import pyarrow as pa
+
+    if column_type in ('int', 'float'):
+        numbers = pd.to_numeric(values, errors='coerce')
+        if column_type == 'int' and not numbers.isna().any():
+            return pa.array(numbers.astype('int64'), type=pa.int64())
+        return pa.array(numbers.astype('float64'), type=pa.float64(), from_pandas=True)
+    if column_type == 'date':
+        dates = pd.to_datetime(values.mask(values.map(_is_missing)), errors='coerce')
+        return pa.array(dates.dt.date, type=pa.date32(), from_pandas=True)
+    if column_type == 'list':
+        return pa.array(values.map(_to_list), type=pa.list_(pa.string()))
+    # empty texts are missing, as when the CSV is read
+    text = pa.array([None if value is None or (isinstance(value, float) and np.isnan(value)) or value == ''
+                     else str(value) for value in values], type=pa.string())
+    return text.dictionary_encode() if column_type == 'category' else text
+
+
+def write_output(df, csv_file, **to_csv_kwargs):
+    """
+    saves df to csv_file and, with KW_PARQUET, to its Parquet file
+    (see SCHEMAS). Without it, an older Parquet file is removed
+    so it is not read instead of the new CSV.
+    :param to_csv_kwargs: passed to df.to_csv (na_rep etc.)
+    """
+    df.to_csv(csv_file, index=False, **to_csv_kwargs)
+    parquet_path = parquet_file(csv_file)
+    if not PARQUET:
+        if os.path.exists(parquet_path):
+            os.remove(parquet_path)
+        return
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _schema(csv_file, df.columns)
+    table = pa.Table.from_arrays([_arrow_array(df[column], schema[column]) for column in df.columns],
+                                 names=[str(column) for column in df.columns])
+    pq.write_table(table, parquet_path)
+
+
+def _apply_schema(df, schema):
+    """
+    gives the columns of df the types of the schema,
+    whether they were read from the CSV or from the Parquet file
+    """
+    for column, column_type in schema.items():
+        values = df[column]
+        if column_type == 'string':
+            # missing values are NaN (as when reading the CSV)
+            df[column] = values.astype(object).where(values.notna(), np.nan)
+        elif column_type == 'category':
+            df[column] = values.astype('category')
+        elif column_type == 'date':
+            df[column] = pd.to_datetime(values, errors='coerce')
+        elif column_type == 'list':
+            df[column] = [0 if items is None else items for items in values.map(_to_list)]
+    return df
+
+
+def read_output(csv_file):
+    """
+    reads one of the kw-* outputs, from its Parquet file when it is
+    at least as recent as the CSV, with the types of SCHEMAS
+    :return: dataframe
+    """
+    parquet_path = parquet_file(csv_file)
+    if os.path.exists(parquet_path) and (not os.path.exists(csv_file) or
+                                         os.path.getmtime(parquet_path) >= os.path.getmtime(csv_file)):
+        df = pd.read_parquet(parquet_path)
+    else:
+        columns = pd.read_csv(csv_file, nrows=0).columns
+        schema = _schema(csv_file, columns)
+        df = pd.read_csv(csv_file, dtype={column: str for column in columns if schema[column] in TEXT_TYPES})
+    return _apply_schema(df, _schema(csv_file, df.columns))
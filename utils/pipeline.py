@@ -0,0 +1,275 @@
+# a small pipeline runner for the data import scripts
+#
+# each stage (load, clean, dedup, enrich, export...) declares
+#  - the stages it depends on (their results are its arguments)
+#  - the files it reads and the files it writes
+# A stage is fingerprinted with the content of the files it reads,
+# the source code of its function (and of the modules of this repository
+# imported by its module) and the fingerprints of the stages it depends on.
+# If the fingerprint is the same as in the last run (and the files it
+# writes are still there) the result saved in the last run is used
+# instead of running the stage again.
+import ast
+import functools
+import glob
+import hashlib
+import importlib.util
+import inspect
+import os
+import pickle
+import time
+from graphlib import TopologicalSorter
+
+import utils.manifestutils as MAN
+import utils.profileutils as PRF
+
+CACHE_DIR = "./data/.pipeline_cache/"
+# the code of the stages is looked for in this directory
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _expand(paths):
+    """
+    list of paths (or a function returning them, evaluated when the stage runs)
+    glob patterns are expanded
+    """
+    if callable(paths):
+        paths = paths()
+    expanded = []
+    for path in paths:
+        if glob.has_magic(path):
+            expanded.extend(sorted(glob.glob(path)))
+        else:
+            expanded.append(path)
+    return expanded
+
+
+def _imported_names(source_file):
+    """
+    names of the modules imported by a python file
+    (`from utils import X` gives both utils and utils.X)
+    """
+    with open(source_file, encoding='utf-8') as f:
+        tree = ast.parse(f.read(), source_file)
+    names = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names.append(node.module)
+            names.extend(node.module + '.' + alias.name for alias in node.names)
+    return names
+
+
+def _repo_file(module_name):
+    """
+    source file of a module of this repository (None for the other modules)
+    """
+    try:
+        spec = importlib.util.find_spec(module_name)
+    except (ImportError, ValueError):
+        return None
+    if spec is None or spec.origin is None or not spec.origin.endswith('.py'):
+        return None
+    origin = os.path.abspath(spec.origin)
+    if not origin.startswith(REPO_DIR + os.sep) or 'site-packages' in origin:
+        return None
+    return origin
+
+
+@functools.lru_cache(maxsize=None)
+def code_files(source_file):
+    """
+    A python file of this repository and the ones it imports (recursively)
+    :return: sorted tuple of absolute paths
+    """
+    found = set()
+    to_visit = [os.path.abspath(source_file)]
+    while to_visit:
+        current = to_visit.pop()
+        if current in found:
+            continue
+        found.add(current)
+        for module_name in _imported_names(current):
+            module_file = _repo_file(module_name)
+            if module_file is not None:
+                to_visit.append(module_file)
+    return tuple(sorted(found))
+
+
+def _source(func):
+    try:
+        return inspect.getsource(func)
+    except (OSError, TypeError):
+        return func.__code__.co_code.hex()
+
+
+class Stage:
+    """
+    A step of a pipeline
+    :param name: name of the stage (unique in its pipeline)
+    :param func: function called with the results of the `inputs` stages (in that order)
+    :param inputs: names of the stages this stage depends on
+    :param files: files read by the stage (paths, glob patterns,
+        or a function returning them). The python modules with the code
+        of the stage are found from the imports of the module of `func`.
+    :param outputs: files written by the stage (or a function returning them)
+    :param always_run: run the stage even if nothing changed (e.g. downloads),
+        its fingerprint is then taken after running it
+    """
+
+    def __init__(self, name, func, inputs=(), files=(), outputs=(), always_run=False):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.files = files
+        self.outputs = outputs
+        self.always_run = always_run
+
+    def code_files(self):
+        """
+        :return: the python files of this repository used by the stage
+        """
+        try:
+            source_file = inspect.getsourcefile(self.func)
+        except TypeError:
+            return ()
+        if source_file is None or not os.path.exists(source_file):
+            return ()
+        return code_files(source_file)
+
+    def file_hashes(self):
+        """
+        :return: dict with the sha256 of each file read by the stage
+            (and of its code, named relative to the repository)
+        """
+        file_hashes = {file_path: MAN.file_hash(file_path) for file_path in _expand(self.files)}
+        for code_file in self.code_files():
+            file_hashes[os.path.relpath(code_file, REPO_DIR)] = MAN.file_hash(code_file)
+        return file_hashes
+
+    def fingerprint(self, upstream_fingerprints, file_hashes=None):
+        if file_hashes is None:
+            file_hashes = self.file_hashes()
+        sha = hashlib.sha256()
+        sha.update(self.name.encode('utf-8'))
+        sha.update(_source(self.func).encode('utf-8'))
+        for file_path, file_hash in file_hashes.items():
+            sha.update("{}:{}".format(file_path, file_hash).encode('utf-8'))
+        for fingerprint in upstream_fingerprints:
+            sha.update(fingerprint.encode('utf-8'))
+        return sha.hexdigest()
+
+    def outputs_exist(self):
+        return all(os.path.exists(file_path) for file_path in _expand(self.outputs))
+
+    def __repr__(self):
+        return "Stage({})".format(self.name)
+
+
+class Pipeline:
+    """
+    Stages run in the order of their dependencies,
+    reusing the results of the last run when their fingerprint is unchanged.
+    :param name: name of the pipeline (the cache of its stages goes to CACHE_DIR/name/)
+    :param stages: list of Stage
+    """
+
+    def __init__(self, name, stages, cache_dir=CACHE_DIR):
+        self.name = name
+        self.stages = {stage.name: stage for stage in stages}
+        self.cache_dir = os.path.join(cache_dir, name)
+        for stage in stages:
+            for input_name in stage.inputs:
+                if input_name not in self.stages:
+                    raise ValueError("Stage {} depends on unknown stage {}".format(stage.name, input_name))
+        graph = {stage.name: stage.inputs for stage in stages}
+        self.order = list(TopologicalSorter(graph).static_order())
+        # seconds taken by each stage which ran in the last run
+        self.timings = {}
+        # manifest of the last run (see manifestutils)
+        self.manifest_file = None
+
+    def _cache_file(self, stage, extension):
+        return os.path.join(self.cache_dir, stage.name + extension)
+
+    def _is_cached(self, stage, fingerprint):
+        fingerprint_file = self._cache_file(stage, ".fingerprint")
+        if not (os.path.exists(fingerprint_file) and os.path.exists(self._cache_file(stage, ".pkl"))):
+            return False
+        with open(fingerprint_file) as f:
+            return f.read() == fingerprint
+
+    def _load_cached(self, stage):
+        with open(self._cache_file(stage, ".pkl"), 'rb') as f:
+            return pickle.load(f)
+
+    def _save_cached(self, stage, fingerprint, result):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # write to other files first, so an interruption
+        # never leaves a half written cache
+        cache_file = self._cache_file(stage, ".pkl")
+        with open(cache_file + ".tmp", 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(cache_file + ".tmp", cache_file)
+        fingerprint_file = self._cache_file(stage, ".fingerprint")
+        with open(fingerprint_file + ".tmp", 'w') as f:
+            f.write(fingerprint)
+        os.replace(fingerprint_file + ".tmp", fingerprint_file)
+
+    def run(self, force=False):
+        """
+        runs the stages which changed since the last run (all of them if force)
+        The results saved by the last run are only loaded
+        when a stage which depends on them has to run.
+        A manifest of the run is saved (see manifestutils).
+        :return: dict with the result of each stage which ran
+            (or was loaded from the last run)
+        """
+        results = {}
+        fingerprints = {}
+        self.timings = {}
+        run = MAN.start_run(self.name)
+        try:
+            for name in self.order:
+                stage = self.stages[name]
+                upstream = [fingerprints[input_name] for input_name in stage.inputs]
+
+                if not stage.always_run:
+                    file_hashes = stage.file_hashes()
+                    fingerprint = stage.fingerprint(upstream, file_hashes)
+                    if not force and stage.outputs_exist() and self._is_cached(stage, fingerprint):
+                        print("[{}] {}: unchanged, skipped".format(self.name, name))
+                        run.skipped(name, file_hashes)
+                        fingerprints[name] = fingerprint
+                        continue
+
+                args = []
+                for input_name in stage.inputs:
+                    if input_name not in results:
+                        results[input_name] = self._load_cached(self.stages[input_name])
+                    args.append(results[input_name])
+
+                print("[{}] {}: running".format(self.name, name))
+                start = time.perf_counter()
+                with run.stage(name, args) as record, \
+                        PRF.measure("[{}] {}".format(self.name, name), args) as m:
+                    result = stage.func(*args)
+                    record.output(m.output(result))
+                self.timings[name] = time.perf_counter() - start
+                print("[{}] {}: done in {:.1f}s".format(self.name, name, self.timings[name]))
+
+                if stage.always_run:
+                    # the files it reads may have been written by the stage itself
+                    file_hashes = stage.file_hashes()
+                    fingerprint = stage.fingerprint(upstream, file_hashes)
+                record.add_files('inputs', file_hashes)
+                record.add_files('outputs', _expand(stage.outputs))
+                self._save_cached(stage, fingerprint, result)
+                results[name] = result
+                fingerprints[name] = fingerprint
+        finally:
+            self.manifest_file = MAN.finish_run()
+        # with KW_PROFILE set (see profileutils)
+        PRF.report(self.name)
+        return results
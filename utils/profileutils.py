@@ -0,0 +1,203 @@
+# instrumentation of the pipelines: wall time, CPU time, peak memory
+# and number of rows going in and out of the functions which clean the data
+#
+# It is switched on with environment variables, otherwise it costs nothing
+# (the decorated functions are left as they are):
+#
+#   KW_PROFILE=1          record every instrumented function and stage,
+#                         print a report at the end of the run and save it
+#                         as JSON in ./data/profile/
+#   KW_PROFILE=nomem      the same without the peak memory
+#                         (tracemalloc slows python down quite a bit)
+#   KW_CPROFILE=<name>    run the function or stage <name> under cProfile
+#                         (its first call in each process), the stats are
+#                         printed and saved to ./data/profile/<name>_<pid>.prof,
+#                         e.g. KW_CPROFILE=LTROutils.clean_addresses_with_landvaluation
+#                         or KW_CPROFILE="[ltro] enrich" (the report tells which one is the slowest)
+#
+# functions are instrumented with @instrument, any other block of code with
+#   with measure("name", inputs=[df]) as m:
+#       ...
+#       m.output(df)
+import atexit
+import cProfile
+import functools
+import json
+import os
+import pstats
+import time
+import tracemalloc
+from datetime import datetime
+
+PROFILE = os.environ.get("KW_PROFILE", "")
+CPROFILE = os.environ.get("KW_CPROFILE", "")
+ENABLED = PROFILE not in ("", "0") or CPROFILE != ""
+TRACE_MEMORY = PROFILE not in ("", "0", "nomem")
+PROFILE_DIR = "./data/profile/"
+
+# totals of each instrumented name, in the order they were first seen
+_records = {}
+# measures in progress (the innermost last), to share the peak memory
+_stack = []
+# cProfile runs once per process (see KW_CPROFILE)
+_profiled = False
+
+if TRACE_MEMORY:
+    tracemalloc.start()
+
+
+def nr_rows(values):
+    """
+    number of rows of the dataframes (or series) in values
+    None if there are none
+    """
+    rows = None
+    for value in values:
+        if isinstance(value, (tuple, list)) and not isinstance(value, str):
+            value_rows = nr_rows(value)
+        elif hasattr(value, 'shape') and hasattr(value, 'index'):
+            value_rows = value.shape[0]
+        else:
+            value_rows = None
+        if value_rows is not None:
+            rows = (rows or 0) + value_rows
+    return rows
+
+
+class measure:
+    """
+    Context manager recording the time, peak memory and rows of a block of code
+    :param name: name of the block in the report
+    :param inputs: dataframes going in (to count their rows)
+    """
+
+    def __init__(self, name, inputs=()):
+        self.name = name
+        self.rows_in = nr_rows(inputs) if ENABLED else None
+        self.rows_out = None
+
+    def output(self, result):
+        """
+        counts the rows of the result of the block, which is returned
+        """
+        if ENABLED:
+            self.rows_out = nr_rows([result])
+        return result
+
+    def __enter__(self):
+        global _profiled
+        if not ENABLED:
+            return self
+        self.profiler = None
+        if CPROFILE in (self.name, self.name.split('.')[-1]) and not _profiled:
+            _profiled = True
+            self.profiler = cProfile.Profile()
+        self.peak = 0
+        if TRACE_MEMORY:
+            current, peak = tracemalloc.get_traced_memory()
+            # the peak of the enclosing measure so far, before restarting it for this one
+            if _stack:
+                _stack[-1].peak = max(_stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            self.memory_start = current
+        _stack.append(self)
+        self.cpu_start = time.process_time()
+        self.wall_start = time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not ENABLED:
+            return False
+        if self.profiler is not None:
+            self.profiler.disable()
+            _save_cprofile(self.name, self.profiler)
+        wall = time.perf_counter() - self.wall_start
+        cpu = time.process_time() - self.cpu_start
+        _stack.pop()
+        peak_mb = None
+        if TRACE_MEMORY:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            if _stack:
+                _stack[-1].peak = max(_stack[-1].peak, self.peak)
+            peak_mb = (self.peak - self.memory_start) / 2 ** 20
+
+        record = _records.setdefault(self.name, {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'peak_mb': None,
+                                                 'rows_in': None, 'rows_out': None})
+        record['calls'] += 1
+        record['wall'] += wall
+        record['cpu'] += cpu
+        if peak_mb is not None:
+            record['peak_mb'] = max(record['peak_mb'] or 0, peak_mb)
+        for field in ('rows_in', 'rows_out'):
+            rows = getattr(self, field)
+            if rows is not None:
+                record[field] = (record[field] or 0) + rows
+        if exc_type is not None:
+            record['failed'] = True
+        return False
+
+
+def instrument(func):
+    """
+    decorator recording each call of func (see measure),
+    named after its module and name, e.g. LTROutils.process_duplicates
+    When the instrumentation is off, func is returned as it is.
+    """
+    if not ENABLED:
+        return func
+    name = "{}.{}".format(func.__module__.split('.')[-1], func.__name__)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with measure(name, list(args) + list(kwargs.values())) as m:
+            return m.output(func(*args, **kwargs))
+    return wrapper
+
+
+def _save_cprofile(name, profiler):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stats_file = os.path.join(PROFILE_DIR, "{}_{}.prof".format(name.replace("/", "_").replace(" ", "_"), os.getpid()))
+    profiler.dump_stats(stats_file)
+    print("\ncProfile of {} (saved to {}):".format(name, stats_file))
+    pstats.Stats(profiler).sort_stats('cumulative').print_stats(25)
+
+
+def report(label="run"):
+    """
+    prints the times, memory and rows recorded since the last report
+    and saves them to PROFILE_DIR/<label>_<date>.json
+    :return: the records (dict by name)
+    """
+    global _records
+    if not ENABLED or not _records:
+        return {}
+    records, _records = _records, {}
+
+    print("\n >> PROFILE ({}) << \n".format(label))
+    print("{:<48} {:>5} {:>9} {:>9} {:>9} {:>9} {:>9}".format(
+        "", "calls", "wall (s)", "cpu (s)", "peak (MB)", "rows in", "rows out"))
+    slowest = sorted(records.items(), key=lambda item: item[1]['wall'], reverse=True)
+    for name, record in slowest:
+        print("{:<48} {:>5} {:>9.2f} {:>9.2f} {:>9} {:>9} {:>9}".format(
+            name[:48], record['calls'], record['wall'], record['cpu'],
+            "-" if record['peak_mb'] is None else "{:.1f}".format(record['peak_mb']),
+            "-" if record['rows_in'] is None else record['rows_in'],
+            "-" if record['rows_out'] is None else record['rows_out']))
+    # the stages include the functions they call, so the slowest function is more useful
+    functions = [name for name, _ in slowest if not name.startswith('[')]
+    if functions and not CPROFILE:
+        print("\nslowest function: {0} (run with KW_CPROFILE={0} to profile it)".format(functions[0]))
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    report_file = os.path.join(PROFILE_DIR, "{}_{}.json".format(label, datetime.now().strftime("%Y-%m-%d_%H%M%S")))
+    with open(report_file, 'w') as f:
+        json.dump({'label': label, 'trace_memory': TRACE_MEMORY, 'records': records}, f, indent=2)
+    print("profile saved to " + report_file)
+    return records
+
+
+if ENABLED:
+    # what was not reported yet (scripts run on their own) is reported when python exits
+    atexit.register(report)
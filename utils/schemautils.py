@@ -0,0 +1,155 @@
+# types of the columns of each source, applied when the data is loaded
+#
+# Each schema maps a column to (type, value for missing values):
+#   'category'  text with few distinct values (parish, status...),
+#               stored once per value instead of once per row
+#   'int'       integers, in the smallest type which holds them
+#               (they stay float while there are missing values)
+#   'float'     numbers
+#               (a column with something else than numbers is left as it is)
+#   'date'      datetime.date, parsed once here
+#   None        the type is left as it is
+# Missing values are replaced column by column with fill_missing()
+# (None keeps them missing), instead of running
+# df.replace(np.nan, 0, regex=True) over every cell of the dataframe.
+# Columns which are not listed are left as they are.
+import pandas as pd
+
+# LTRO sales (LTRO files, see LTROutils.LTRO_HEADER)
+LTRO_SALES = {
+    'application_number': ('int', 0),
+    'sale_type': ('category', 0),
+    'registration_date': ('date', 0),
+    'parish': ('category', 0),
+    'parcel_area': (None, 0),
+    'assessment_number': (None, 0),
+    'address': (None, 0),
+    # only searched for keywords
+    'Mode of\nAcquisition': ('category', None),
+    'acquisition_date': (None, 0),
+    'Nature of\nInterest': ('category', None),
+    'price': ('int', 0),
+    'source_file': ('category', None),
+    'sale_key': (None, None),
+    # added by the identify_* functions
+    'property_type': (None, 0),
+}
+
+# Property Skipper properties and listings (CSV made from the XML feed)
+SKIPPER_PROPERTIES = {
+    'reference': (None, 0),
+    'skipper_id': ('int', 0),
+    'assessment_number': (None, 0),
+    'name': (None, 0),
+    'city': ('category', 0),
+    'zip': (None, 0),
+    'country': ('category', 0),
+    'longitude': ('float', 0),
+    'latitude': ('float', 0),
+    'property_type': (None, 0),
+    'url': (None, 0),
+    'views': ('int', 0),
+    'special_headline': (None, 0),
+    'short_description': (None, 0),
+    'long_description': (None, 0),
+    'youtube_id': (None, 0),
+    'vimeo_id': (None, 0),
+    'paradym_url': (None, 0),
+    'virtual_tour_url': (None, 0),
+    'images': (None, 0),
+    'bedrooms': ('int', 0),
+    'bathrooms': ('int', 0),
+    'half_bathrooms': ('int', 0),
+    'lotsize': ('float', 0),
+    'sqft': ('float', 0),
+    'date_added': (None, 0),
+    'date_relisted': (None, 0),
+    'is_rent': ('int', 0),
+    'is_let': ('int', 0),
+    'is_sale': ('int', 0),
+    'under_contract': ('int', 0),
+    'under_offer': ('int', 0),
+    'buyer_type': ('category', 0),
+    'price': ('float', 0),
+    'price_from': ('float', 0),
+    'daily_rate': ('float', 0),
+    'agent': (None, 0),
+}
+
+# Skipper Stats transactions (see skipperstatsutils.transaction_xml_to_dataframe)
+SKIPPER_TRANSACTIONS = {
+    'application_number': (None, 0),
+    'status': ('category', 0),
+    'ref': (None, 0),
+    'transaction_date': (None, 0),
+    'price': ('float', 0),
+    'sold_to_international_purchaser': ('category', 0),
+    'property_type': (None, 0),
+    'assessment_number': (None, 0),
+    'address_line': (None, 0),
+    'building_name': (None, 0),
+    'parish': ('category', 0),
+    'postcode': (None, 0),
+    'latitude': (None, 0),
+    'longitude': (None, 0),
+    'arv_default': (None, 0),
+    'is_land': ('category', 0),
+    'is_fractional_unit': ('category', 0),
+}
+
+
+def apply_schema(df, schema):
+    """
+    gives the columns of df the types of the schema
+    :param schema: one of the schemas above
+    :return: dataframe
+    """
+    for column, (column_type, _) in schema.items():
+        if column not in df.columns or column_type is None:
+            continue
+        if column_type == 'category':
+            df[column] = df[column].astype('category')
+        elif column_type in ('int', 'float'):
+            try:
+                numbers = pd.to_numeric(df[column])
+            except (ValueError, TypeError):
+                # some values are not numbers, they are cleaned further on
+                continue
+            if column_type == 'int' and not numbers.isna().any():
+                numbers = pd.to_numeric(numbers, downcast='integer')
+            df[column] = numbers
+        elif column_type == 'date':
+            # the LTRO files give dates and text dates (2018-05-17)
+            df[column] = pd.to_datetime(df[column], format='ISO8601').dt.date
+    return df
+
+
+def fill_missing(df, schema):
+    """
+    replaces the missing values of each column of the schema
+    with its value for missing values
+    :return: new dataframe (df is often a slice of another one)
+    """
+    df = df.copy()
+    for column, (column_type, fill) in schema.items():
+        if column not in df.columns or fill is None:
+            continue
+        values = df[column]
+        if not values.isna().any():
+            continue
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            if fill not in values.cat.categories:
+                values = values.cat.add_categories([fill])
+            df[column] = values.fillna(fill)
+        elif column_type == 'int':
+            df[column] = pd.to_numeric(values.fillna(fill), downcast='integer')
+        else:
+            df[column] = values.fillna(fill)
+    return df
+
+
+def memory_mb(df):
+    """
+    memory used by df (with its texts) in MB
+    """
+    return df.memory_usage(deep=True).sum() / 2 ** 20
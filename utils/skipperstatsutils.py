@@ -1,27 +1,18 @@
+import functools
 import hashlib
 import re
-import subprocess
-
-from thefuzz import fuzz
-from pyproj import CRS, Transformer
-
-from dateutil.parser import parse
 
 import pandas as pd
 import xml.etree.ElementTree as ET
 
-
-def get_xml_with_wget(url, output_file):
-    try:
-        subprocess.run(["wget", "-O", output_file, url], check=True)
-        print(f"Successfully downloaded to {output_file}")
-        with open(output_file, 'r') as f:
-            return f.read()
-    except subprocess.CalledProcessError as e:
-        print(f"Error downloading: {e}")
-        return None
+# thefuzz, pyproj and dateutil are imported by the functions using them,
+# so importing this module stays quick
+import utils.manifestutils as MAN
+from utils.downloadutils import get_xml_with_wget
+from utils.profileutils import instrument
 
 
+@instrument
 def transaction_xml_to_dataframe(xml_file):
     """
     - opens the XML previously downloaded from skipperstats
@@ -79,6 +70,7 @@ def in_keywords(x, keywords):
     else:   
         return any([keyword in x for keyword in keywords])
 
+@instrument
 def identify_fractionals(df):
     '''
     identify which rows correspond to sales of fractional properties.
@@ -115,6 +107,7 @@ def identify_fractionals(df):
     return df
 
 
+@instrument
 def identify_lands(df):  
 
     # change df.property_type if is_land == 1
@@ -153,6 +146,7 @@ def application_number_hash(a,b,c,d):
     code_hash = hashlib.md5( str(a).encode('utf-8') + str(b).encode('utf-8') + str(c).encode('utf-8') + str(d).encode('utf-8')).hexdigest()
     return code_hash[0:8]
 
+@instrument
 def drop_unidentified(df):
     """
     Some properties are completely unidentified other than by price and date.
@@ -176,6 +170,7 @@ def drop_unidentified(df):
 
     return df
 
+@instrument
 def drop_selected_duplicates_by_hand(df):
     # adhoc dropping as I found it to be a duplicate
     # but it's hard for it to be identified by the deduplicate functions
@@ -189,6 +184,7 @@ def drop_selected_duplicates_by_hand(df):
                 (df.application_number == 'skip-d95b02ba'))]
     return df
 
+@instrument
 def clean_up_skipperstats_data(df):
 
     # drop rows with no price
@@ -206,6 +202,8 @@ def _fuzzy_address_match(addr1, addr2):
     :return: bool
 
     """
+    from thefuzz import fuzz
+
     if 'Bermuda' not in addr2:
       addr2 = addr2 + ', Bermuda'
     if 'one tenth' in addr2.lower():
@@ -250,6 +248,7 @@ def _fuzzy_address_match(addr1, addr2):
 
 
 def parse_mixed_dates(date_str):
+    from dateutil.parser import parse
     try:
         return parse(date_str, dayfirst=False, yearfirst=False)
     except (ValueError, TypeError):
@@ -263,6 +262,7 @@ def parse_mixed_dates(date_str):
             return pd.NaT
 
 
+@instrument
 def date_filter_for_sss_LTRO_duplicates(df, sa):
     """ SSS (Skipper Stats Sales) | LTRO (Land Title Registry)
     this function uses the LTRO sales dataframe 
@@ -383,6 +383,7 @@ def date_filter_for_sss_LTRO_duplicates(df, sa):
             # not date matches. We don't consider this a duplicate
             pass
     print('\n', len(indexes_of_matches_to_delete), 'Skipper Stats duplicates processed based on dates')
+    MAN.count('ltro_duplicates_by_date', len(indexes_of_matches_to_delete))
     df = df.drop(indexes_of_matches_to_delete)
     return df
 
@@ -429,6 +430,7 @@ def are_prices_close(skipperprice, ltroprice):
     
 
 def are_addresses_close(skipper_addr, ltro_addr):
+    from thefuzz import fuzz
     numbers_only_0 = set(re.findall(r'\d+', skipper_addr))
     numbers_only_1 = set(re.findall(r'\d+', ltro_addr))
     similarity_ratio = fuzz.ratio(skipper_addr, ltro_addr)
@@ -438,6 +440,7 @@ def are_addresses_close(skipper_addr, ltro_addr):
         return False
 
 
+@instrument
 def address_filter_for_sss_LTRO_duplicates(df, sa):
     """ SSS (Skipper Stats Sales) | LTRO (Land Title Registry)
     this function uses the LTRO sales dataframe 
@@ -514,10 +517,12 @@ def address_filter_for_sss_LTRO_duplicates(df, sa):
                 if are_prices_close(row.price, fuzzy_addr_match.price.values[0]) and are_dates_close(trans_date, reg_date, acq_date)[0]:
                     indexes_of_matches_to_delete.append(k)
     print(len(indexes_of_matches_to_delete), 'Skipper Stats duplicates processed based on address')
+    MAN.count('ltro_duplicates_by_address', len(indexes_of_matches_to_delete))
     df = df.drop(indexes_of_matches_to_delete)
     return df
 
 
+@instrument
 def fractional_filter_for_sss_LTRO_duplicates(df, sa):
     indexes_of_matches_to_delete = []
     sss_frac = df[(df.property_type == 'fractional')] 
@@ -550,11 +555,14 @@ def fractional_filter_for_sss_LTRO_duplicates(df, sa):
                 indexes_of_matches_to_delete.append(k) 
     
     print(len(indexes_of_matches_to_delete), 'Fractional Skipper Stats duplicates processed')
+    MAN.count('ltro_duplicates_fractional', len(indexes_of_matches_to_delete))
     df = df.drop(indexes_of_matches_to_delete)
     return df    
     
 
-def lng_lat_to_BDA_east_north(lng, lat):
+@functools.lru_cache(maxsize=None)
+def _bda_transformer():
+    from pyproj import CRS, Transformer
 
     # define the source and destination coordinate systems
     # EPSG:4326, https://spatialreference.org/ref/epsg/4326/
@@ -563,12 +571,18 @@ def lng_lat_to_BDA_east_north(lng, lat):
     dst_crs = CRS.from_proj4("+proj=tmerc +lat_0=32 +lon_0=-64.75 +k=1 +x_0=550000 +y_0=100000 +ellps=WGS84 +towgs84=0,0,0,0,0,0,0 +units=m +no_defs")
 
     # create a transformer object
-    transformer = Transformer.from_crs(src_crs, dst_crs)
+    # (only once, it is the same for all the coordinates)
+    return Transformer.from_crs(src_crs, dst_crs)
+
+
+def lng_lat_to_BDA_east_north(lng, lat):
+    transformer = _bda_transformer()
 
     # transform the coordinates using the transformer object
     east, north = transformer.transform(lng, lat)
     return round(east), round(north)
 
+@instrument
 def add_bermuda_grid(df):
     """
     Takes a dataframe with longitude and latutude
@@ -599,6 +613,7 @@ def add_bermuda_grid(df):
     print(" -> Bermuda grid with 'Northing' and 'Easting' added.\n")
     return df
 
+@instrument
 def fix_no_name_buildings(df, lv):
     """
     Takes buildings with no name and adds a name based on:
@@ -607,6 +622,7 @@ def fix_no_name_buildings(df, lv):
     """
     mask = (df.building_name == "0") | (df.building_name == "N/A") | (df.building_name.isna()) | (df.building_name == 0)
     print("\n",df[mask].shape[0], "buildings with no name")
+    MAN.count('buildings_without_name', df[mask].shape[0])
     # iterate over the rows in sss that don't have a name
     for idx in df[mask].index:
         match = lv[lv.assessment_number == df.loc[idx, 'assessment_number']]
@@ -622,5 +638,6 @@ def fix_no_name_buildings(df, lv):
 
     mask = (df.building_name == "0") | (df.building_name == "N/A") | (df.building_name.isna()) | (df.building_name == 0)
     print(df[mask].shape[0], "buildings with no name after fixing")
+    MAN.count('buildings_without_name_after_fixing', df[mask].shape[0])
 
     return df
@@ -1,5 +1,4 @@
 import csv
-import os
 import re
 
 import xml.etree.ElementTree as ET
@@ -7,6 +6,10 @@ from datetime import datetime
 
 import pandas as pd
 
+import utils.manifestutils as MAN
+from utils.profileutils import instrument
+
+@instrument
 def download_skipper_xml(xml_file, csv_file):
     """
     Opens local XML, parses it and converts it to CSV
@@ -67,6 +70,7 @@ def download_skipper_xml(xml_file, csv_file):
         writer.writerows(all_properties)
     return csvdata
 
+@instrument
 def let_or_rent(df):
     # Currently, in bermuda, we find "is_let = 0" for all properties.
     # this is because bermuda uses the is_rent (US version)
@@ -132,8 +136,10 @@ def clean_assn_nr(assessment_number):
         else:
             flat_list.append(item)
     
-    # Initialize an empty set to store valid assessment numbers
-    valid_numbers = set()
+    # valid assessment numbers, without repeats and in the order they are found
+    # (a dict, not a set: the order of a set changes from one run to another,
+    # and when the function is applied again to its own result)
+    valid_numbers = {}
     
     # Process each string in the flattened list
     for string in flat_list:
@@ -157,17 +163,17 @@ def clean_assn_nr(assessment_number):
         # Add valid numbers (7-10 digits) to our set
         for num in all_numbers:
             if 7 <= len(num) <= 10:
-                valid_numbers.add(num)
+                valid_numbers[num] = None
     
     # Check if we found nothing but zeros
     if valid_numbers and all(num == '0' or num.strip('0') == '' for num in valid_numbers):
         return 0
     
     # Remove strings containing only zeros
-    valid_numbers = {num for num in valid_numbers if not all(c == '0' for c in num)}
+    valid_numbers = {num: None for num in valid_numbers if not all(c == '0' for c in num)}
     # if we see assessment number with 10 digits, remove the first digit
     # keep all other numbers as is
-    valid_numbers = {num[1:] if len(num) == 10 else num for num in valid_numbers}
+    valid_numbers = {num[1:] if len(num) == 10 else num: None for num in valid_numbers}
     
     # If we found valid numbers, return them as a list
     if valid_numbers:
@@ -231,6 +237,7 @@ def _fractional_filter(df):
     else:
         return df['property_type']
 
+@instrument
 def identify_fractionals(df):
     """
     Find properties which may have the wrong property type
@@ -240,6 +247,7 @@ def identify_fractionals(df):
     df.property_type = df.apply(_fractional_filter, axis = 1)
     return df
 
+@instrument
 def uniform_property_type(df):
     """
     Map the diversity of property types to only a few categories
@@ -321,6 +329,7 @@ def _check_address(row):
     # other wise, address is probably ok
     return ""
 
+@instrument
 def clean_and_flag_properties(df):
     """
     Generate flags for properties based on assessment number, price, and address issues.
@@ -360,19 +369,50 @@ def clean_and_flag_properties(df):
     
     # Ensure any empty flag strings are preserved as empty
     df["flag"] = df["flag"].str.strip()
-    
+
+    MAN.count('flagged', (df["flag"] != "").sum())
+    for flag in ["ASSN#", "PRICE", "ADDRESS"]:
+        MAN.count('flagged_' + flag.strip('#').lower(), df["flag"].str.contains(flag, regex=False).sum())
     return df
 
     
-def sanitize_text(df):
+def _sanitize_values(values):
+    # only the texts with a new line or a carriage return are changed
+    # (numbers, lists and missing values are left as they are)
+    try:
+        to_clean = values.str.contains('[\n\r]', regex=True, na=False)
+    except AttributeError:
+        # no text in this column
+        return values
+    if not to_clean.any():
+        return values
+    cleaned = values[to_clean].str.replace('\n', '', regex=False).str.replace('\r', ' ', regex=False)
+    return values.mask(to_clean, cleaned)
+
+@instrument
+def sanitize_text(df, columns=None):
     """
     Map carriage returns like \r to \n
     to avoid problems when converting to .csv
     as \r can result in a new line half way through the csv row.
+    New lines are removed and carriage returns replaced by a space,
+    only in the text columns and only in the rows which have them.
+    :param columns: columns to sanitize (by default all the text columns)
     """
-    df.replace('\\n', '', regex=True, inplace=True)
-    df.replace('\\r', ' ', regex=True, inplace=True)
-    return df                  
+    if columns is None:
+        columns = df.select_dtypes(include=['object', 'category']).columns
+    for column in columns:
+        values = df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # rebuilt only if one of its categories needs cleaning
+            # (two categories may become the same once cleaned)
+            categories = pd.Series(values.cat.categories, dtype=object)
+            if _sanitize_values(categories).equals(categories):
+                continue
+            df[column] = _sanitize_values(values.astype(object)).astype('category')
+        else:
+            df[column] = _sanitize_values(values)
+    return df
 
 def remove_extra_chars(x):
     x_clean = x.replace('b','').replace('[','').replace(']','').replace("'","").strip()
@@ -413,6 +453,7 @@ def agent_list_to_dict(agent_list):
         }
     return agent_dict
 
+@instrument
 def simplify_parishes(df):
     '''
     This maps rows with a parish
@@ -430,6 +471,7 @@ def simplify_parishes(df):
     df.rename(columns = {'city':'parish'}, inplace = True)
     return df
 
+@instrument
 def add_property_name_to_skipper_properties(df, lv):
     """
     Add a property name to the skipper properties dataframe using vectorized operations.
@@ -0,0 +1,103 @@
+"""Quick checks of the CSV files prepared for the webapp
+
+Only the standard library is used, so it starts quickly:
+`python validate_outputs.py` (or `python validate_outputs.py ./data/kw-sales.csv`)
+"""
+import csv
+import os
+import sys
+
+# the columns each file must have, and the column which identifies each row (if any)
+OUTPUTS = {
+    "./data/kw-properties.csv": {
+        'columns': ["assessment_number", "arv", "tax_code", "property_type", "address",
+                    "grid", "parish", "building_name", "property_name"],
+        'key': "assessment_number",
+    },
+    "./data/kw-sales.csv": {
+        'columns': ["application_number", "registration_date", "parish", "address",
+                    "parcel_area", "parcel_area_ha", "assessment_number", "acquisition_date",
+                    "price", "arv", "combined_arv", "property_type"],
+        'key': "application_number",
+    },
+    "./data/kw-skipper_properties.csv": {
+        'columns': ["reference", "skipper_id", "assessment_number", "name", "parish", "flag",
+                    "property_type", "property_name"],
+        'key': None,
+    },
+    "./data/kw-listings.csv": {
+        'columns': ["reference", "skipper_id", "date_added", "price", "agent", "property_name"],
+        'key': None,
+    },
+    "./data/kw-skipper-stats-sales.csv": {
+        'columns': ["application_number", "registration_date", "property_name", "address",
+                    "assessment_number", "price"],
+        'key': "application_number",
+    },
+}
+
+
+def validate_output(csv_file, columns, key=None):
+    """
+    :return: number of rows and list of the problems found in csv_file (empty if none)
+    """
+    if not os.path.exists(csv_file):
+        return 0, ["file not found"]
+
+    problems = []
+    with open(csv_file, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return 0, ["empty file"]
+        missing = [column for column in columns if column not in header]
+        if missing:
+            problems.append("missing columns: {}".format(", ".join(missing)))
+
+        key_position = header.index(key) if key in header else None
+        keys = set()
+        duplicates = 0
+        empty_keys = 0
+        nr_rows = 0
+        for row in reader:
+            nr_rows += 1
+            if len(row) != len(header):
+                problems.append("row {} has {} fields instead of {}".format(nr_rows, len(row), len(header)))
+                continue
+            if key_position is not None:
+                value = row[key_position]
+                if value in ("", "0"):
+                    empty_keys += 1
+                elif value in keys:
+                    duplicates += 1
+                else:
+                    keys.add(value)
+
+    if nr_rows == 0:
+        problems.append("no rows")
+    if duplicates:
+        problems.append("{} duplicate {}".format(duplicates, key))
+    if empty_keys:
+        problems.append("{} rows without {}".format(empty_keys, key))
+    return nr_rows, problems
+
+
+def main(csv_files=None):
+    """
+    :return: True if all the files are valid
+    """
+    all_valid = True
+    selected = {os.path.normpath(csv_file) for csv_file in csv_files or []}
+    for csv_file, expected in OUTPUTS.items():
+        if selected and os.path.normpath(csv_file) not in selected:
+            continue
+        nr_rows, problems = validate_output(csv_file, expected['columns'], expected['key'])
+        print("{}: {} rows, {}".format(csv_file, nr_rows, "[OK]" if not problems else "PROBLEMS FOUND"))
+        for problem in problems[:10]:
+            print("   - " + problem)
+        all_valid = all_valid and not problems
+    return all_valid
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main(sys.argv[1:]) else 1)